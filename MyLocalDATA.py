@@ -1,13 +1,20 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from io import BytesIO
 import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
 from db import crear_tabla, agregar_cliente, obtener_clientes, actualizar_cliente_detalle, \
     eliminar_cliente, set_display_base_name, get_display_base_name, agendar_visita, obtener_visitas, \
-    agregar_contacto, obtener_contactos, actualizar_cliente_campos, engine, text
+    agregar_contacto, obtener_contactos, obtener_detalle_cliente, opciones_selector_clientes, LIMITE_SELECTOR_CLIENTES, \
+    actualizar_cliente_campos, obtener_clientes_pagina, \
+    resolver_vista, obtener_clientes_vista, invalidar_bases, obtener_bases, actualizar_clientes_campos, \
+    eliminar_clientes, importar_clientes, buscar_clientes, estadisticas_pool, estadisticas_cache, \
+    estadisticas_replica, estadisticas_notificaciones, refrescar_cambios
+from exportar import FORMATOS_EXPORTACION, clave_exportacion, solicitar_exportacion, estado_exportacion
+from instrumentacion import iniciar_conteo_rerun, resumen_por_funcion, resumen_reruns
+from perfilador import iniciar_perfil_rerun, finalizar_perfil_rerun, resumen_historial
+from grilla import diferencias_grid, ids_seleccionados
 
 from collections.abc import Mapping
 import traceback
@@ -53,6 +60,18 @@ def safe_rerun():
 # --------------------------
 st.set_page_config(page_title="Gestor de Clientes", layout="wide")
 
+# Conteo de consultas SQL por rerun: se cierra el del rerun anterior y empieza uno nuevo
+st.session_state["_conteo_rerun_anterior"] = st.session_state.get("_conteo_rerun")
+st.session_state["_conteo_rerun"] = iniciar_conteo_rerun(st.session_state["_conteo_rerun_anterior"])
+
+# Perfilador de secciones del rerun (ver perfilador.py). La traza de la sesión se escribe a
+# disco con PERFILADOR_ACTIVO = true en secrets o abriendo la app con ?perfil=1
+PERFILADOR_ESCRIBIR = bool(st.secrets.get("PERFILADOR_ACTIVO", False)) or st.query_params.get("perfil") == "1"
+PERFILES_DIR = st.secrets.get("PERFILES_DIR", None)
+perfil = iniciar_perfil_rerun(st.session_state, st.session_state["_conteo_rerun"],
+                              escribir=PERFILADOR_ESCRIBIR, directorio=PERFILES_DIR)
+perfil.seccion("credenciales y autenticador")
+
 # --------------------------
 # Normalizar y validar credentials desde secrets (una sola definición)
 # --------------------------
@@ -130,6 +149,7 @@ authenticator.login(location="sidebar")
 # --------------------------
 # Manejo del status de autenticación
 # --------------------------
+perfil.seccion("login y autenticación")
 if st.session_state.get("authentication_status") is True:
     name = st.session_state.get("name")
     username = st.session_state.get("username")
@@ -146,6 +166,7 @@ if st.session_state.get("authentication_status") is True:
     # --------------------------
     # Sidebar: Bases y filtros (si admin verá opciones adicionales)
     # --------------------------
+    perfil.seccion("sidebar y filtros")
     from db import crear_tabla, agregar_cliente, obtener_clientes, actualizar_cliente_detalle, \
         set_display_base_name, get_display_base_name, eliminar_cliente, agendar_visita, obtener_visitas, agregar_contacto, obtener_contactos
     
@@ -179,13 +200,49 @@ if st.session_state.get("authentication_status") is True:
     # Admin filters
     if is_admin:
         st.sidebar.markdown("**Panel Admin — filtros**")
-        todas = obtener_clientes()  # para listar bases disponibles; si DB grande ajustar
-        bases_disponibles = []
-        if not todas.empty and "base_name" in todas.columns:
-            bases_disponibles = sorted(todas['base_name'].dropna().unique().tolist())
-        bases_disponibles = ["TRANSLOGISTIC"] + [b for b in bases_disponibles if b != "TRANSLOGISTIC"]
-        filtrar_base = st.sidebar.selectbox("Filtrar por base (Admin)", options=["Todas"] + bases_disponibles, index=0)
+        # Catálogo de bases (una consulta mínima, con conteo por base)
+        catalogo_bases = obtener_bases()
+        total_por_base = {}
+        if not catalogo_bases.empty:
+            total_por_base = dict(zip(catalogo_bases["base_name"], catalogo_bases["total_clientes"]))
+        bases_disponibles = ["TRANSLOGISTIC"] + [b for b in sorted(total_por_base) if b != "TRANSLOGISTIC"]
+        filtrar_base = st.sidebar.selectbox(
+            "Filtrar por base (Admin)",
+            options=["Todas"] + bases_disponibles,
+            index=0,
+            format_func=lambda b: f"{b} ({total_por_base[b]})" if b in total_por_base else b
+        )
         filtrar_username = st.sidebar.text_input("Filtrar por username (dejar en blanco = todos)")
+
+        # Estado del pool de conexiones y de la caché compartida (diagnóstico)
+        with st.sidebar.expander("📊 Conexiones a la BD"):
+            stats_pool = estadisticas_pool()
+            st.metric("En uso", f"{stats_pool['en_uso']} / {stats_pool['tamano'] + stats_pool['max_overflow']}")
+            st.metric("Espera por conexión (prom.)", f"{stats_pool['espera_promedio_ms']} ms")
+            st.metric("Conexiones nuevas / min", stats_pool["conexiones_por_minuto"])
+            st.json(stats_pool)
+            st.caption("Caché de clientes")
+            st.json(estadisticas_cache())
+            st.caption("Réplica local")
+            st.json(estadisticas_replica())
+            st.caption("Avisos de cambios (LISTEN/NOTIFY)")
+            st.json(estadisticas_notificaciones())
+
+        # Latencia de SQL por función de db.py y consultas emitidas por rerun
+        with st.sidebar.expander("⏱️ Consultas SQL"):
+            conteo_anterior = st.session_state.get("_conteo_rerun_anterior")
+            if conteo_anterior is not None:
+                st.metric("Consultas en el rerun anterior", conteo_anterior.consultas,
+                          help=f"{conteo_anterior.ms:.0f} ms de SQL")
+            st.caption("Consultas por rerun (todas las sesiones)")
+            st.json(resumen_reruns())
+            st.dataframe(pd.DataFrame(resumen_por_funcion()), hide_index=True)
+
+        # Tiempo por sección del script en los últimos reruns de esta sesión
+        with st.sidebar.expander("🧭 Perfil del rerun"):
+            st.dataframe(pd.DataFrame(resumen_historial(st.session_state)), hide_index=True)
+            if not PERFILADOR_ESCRIBIR:
+                st.caption("Para guardar la traza (Perfetto / chrome://tracing) abrir la app con ?perfil=1")
     else:
         filtrar_base = None
         filtrar_username = None
@@ -193,6 +250,7 @@ if st.session_state.get("authentication_status") is True:
     # --------------------------
     # Estilos personalizados (usa Google Font disponible: Poppins)
     # --------------------------
+    perfil.seccion("css")
     page_bg = """
     <style>
     @font-face {
@@ -259,18 +317,45 @@ if st.session_state.get("authentication_status") is True:
     st.markdown(page_bg, unsafe_allow_html=True)
 
     # --------------------------
-    # Conexión a BD (crear tabla si no existe)
+    # Conexión a BD (migraciones pendientes: solo la primera vez por proceso)
     # --------------------------
+    perfil.seccion("crear_tabla")
     crear_tabla()
 
     # --------------------------
     # Funciones auxiliares locales
     # --------------------------
-    def exportar_excel(df: pd.DataFrame) -> bytes:
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Clientes")
-        return output.getvalue()
+    def panel_exportar(etiqueta, contactado, busqueda, nombre_archivo, key):
+        """
+        Exportación como trabajo en segundo plano: el archivo solo se genera cuando se pide,
+        y se reusa (caché en disco) mientras los datos de la base no cambien.
+        """
+        formato = st.selectbox("Formato de exportación", list(FORMATOS_EXPORTACION), key=f"formato_{key}")
+        filtros = {"contactado": contactado, "busqueda": busqueda or None, **vista_clientes}
+        estado = estado_exportacion(clave_exportacion(formato, **filtros))
+        extension, mime = FORMATOS_EXPORTACION[formato]
+
+        if estado["estado"] == "listo":
+            # st.download_button carga el archivo completo en memoria del servidor: solo se arma
+            # tras pedirlo con "Descargar" y se desarma al bajarlo (no en cada rerun de cada sesión)
+            pedida = f"descarga_{key}"
+            if st.session_state.get(pedida) == estado["ruta"]:
+                with open(estado["ruta"], "rb") as f:
+                    st.download_button(f"💾 Guardar {nombre_archivo}.{extension}", data=f,
+                                       file_name=f"{nombre_archivo}.{extension}", mime=mime, key=key,
+                                       on_click=lambda: st.session_state.pop(pedida, None))
+            elif st.button(f"{etiqueta} (.{extension})", key=f"pedir_{key}"):
+                st.session_state[pedida] = estado["ruta"]
+                safe_rerun()
+        elif estado["estado"] == "en_proceso":
+            st.info("⏳ Generando exportación en segundo plano...")
+            st.button("🔄 Actualizar estado", key=f"estado_{key}")
+        else:
+            if estado["estado"] == "error":
+                st.error(f"La exportación falló: {estado['error']}")
+            if st.button(f"📦 Preparar exportación (.{extension})", key=f"preparar_{key}"):
+                solicitar_exportacion(formato, **filtros)
+                safe_rerun()
 
     def rename_columns_for_display(df):
         if df.empty:
@@ -302,6 +387,7 @@ if st.session_state.get("authentication_status") is True:
     # --------------------------
     # Encabezado
     # --------------------------
+    perfil.seccion("encabezado y formulario de cliente")
     st.markdown("<h1 style='text-align:center;'>📂 MyLocalDATA</h1>", unsafe_allow_html=True)
     st.markdown("<h2 style='text-align:center;'>Gestor de Clientes</h2>", unsafe_allow_html=True)
 
@@ -365,69 +451,105 @@ if st.session_state.get("authentication_status") is True:
                     st.text(str(e))
                     st.text(traceback.format_exc())
 
+    # --------------------------
+    # Importación masiva (CSV / Excel) con upsert por NIT
+    # --------------------------
+    perfil.seccion("importación")
+    with st.expander("📥 Importar clientes (CSV / Excel)"):
+        st.caption("Encabezados aceptados: los de la BD (nombre, nit, ...) o los de la tabla (Nombre, NIT, Persona de Contacto, ...). "
+                   "Los NIT que ya existan en la base se actualizan; los demás se insertan.")
+        archivo_import = st.file_uploader("Archivo de clientes", type=["csv", "xlsx"], key="archivo_import")
+        display_private_import = st.session_state.get("private_base_name", f"{username}_PRIVADA")
+        destino_import = st.selectbox("Importar en Base:", ["TRANSLOGISTIC", display_private_import], key="destino_import")
+        if archivo_import is not None and st.button("📥 Importar", key="btn_importar"):
+            base_import = "TRANSLOGISTIC" if destino_import == "TRANSLOGISTIC" else f"{username}__{destino_import}"
+            try:
+                with st.spinner("Importando clientes..."):
+                    resultado = importar_clientes(archivo_import, base_name=base_import, username=username,
+                                                  nombre_archivo=archivo_import.name)
+                st.success(f"✅ Importación terminada: {resultado['insertados']} insertados, "
+                           f"{resultado['actualizados']} actualizados, {resultado['rechazados']} rechazados")
+            except Exception as e:
+                st.error(f"❌ Error importando clientes: {e}")
+
     # --------------------------
     # Listado y exportación de clientes (AgGrid con guardado automático)
     # --------------------------
     # --------------------------
-    # Cargar df_no / df_si (con caché en session_state y soporte de "force refresh")
+    # Cargar df_no / df_si (caché compartida del proceso en db.py + soporte de "force refresh")
     # --------------------------
-    # Intentar usar versiones en caché si existen (para respuesta inmediata)
-    df_no = st.session_state.get('df_no_cached')
-    df_si = st.session_state.get('df_si_cached')
-    
-    # Flag que puede forzar recarga desde la BD (safe_rerun() podía setear esto)
-    force_refresh = False
-    if st.session_state.get("_force_refresh"):
-        force_refresh = True
+    perfil.seccion("carga de datos")
+    # Vista actual resuelta una sola vez (admin: filtros de sidebar; usuario: base elegida)
+    vista_clientes = resolver_vista(
+        username=username,
+        is_admin=is_admin,
+        filtrar_base=filtrar_base,
+        filtrar_username=filtrar_username,
+        base_seleccionada=st.session_state.get("selected_base_view", "TRANSLOGISTIC"),
+    )
+
+    # La sesión solo recuerda cuántas páginas quiere ver de cada tab; los datos viven en
+    # la caché compartida (db.py), así que N sesiones sobre la misma base comparten una copia
+    if st.session_state.get("vista_clientes") != vista_clientes:
+        st.session_state["vista_clientes"] = vista_clientes
+        st.session_state["paginas_no"] = 1
+        st.session_state["paginas_si"] = 1
+
+    # Cambios de otros usuarios desde el último refresco: se parchan en la caché compartida.
+    # El flag _force_refresh (safe_rerun() podía setearlo) pide no esperar DELTA_INTERVALO_SEG
+    forzar = bool(st.session_state.get("_force_refresh"))
+    if forzar:
         # consumimos la marca para evitar recargas repetidas
         try:
             st.session_state.pop("_force_refresh", None)
         except Exception:
             pass
-    
-    # Si no hay caché o se pide recarga forzada, leer desde la BD y actualizar caché
-    if df_no is None or df_si is None or force_refresh:
-        selected_base = st.session_state.get("selected_base_view", "TRANSLOGISTIC")
-    
-        try:
-            if is_admin:
-                if 'filtrar_base' in locals() and filtrar_base and filtrar_base != "Todas":
-                    df_no = obtener_clientes(contactado=False, username=None, is_admin=True, base_name=filtrar_base)
-                    df_si = obtener_clientes(contactado=True, username=None, is_admin=True, base_name=filtrar_base)
-                elif 'filtrar_username' in locals() and filtrar_username:
-                    df_no = obtener_clientes(contactado=False, username=filtrar_username, is_admin=True)
-                    df_si = obtener_clientes(contactado=True, username=filtrar_username, is_admin=True)
-                else:
-                    df_no = obtener_clientes(contactado=False, is_admin=True)
-                    df_si = obtener_clientes(contactado=True, is_admin=True)
-            else:
-                if selected_base == "TRANSLOGISTIC":
-                    df_no = obtener_clientes(contactado=False, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                    df_si = obtener_clientes(contactado=True, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                else:
-                    internal_base = f"{username}__{selected_base}"
-                    df_no = obtener_clientes(contactado=False, username=username, is_admin=False, base_name=internal_base)
-                    df_si = obtener_clientes(contactado=True, username=username, is_admin=False, base_name=internal_base)
-    
-            # Guardar en session_state para reuso por este run y futuros runs
-            st.session_state['df_no_cached'] = df_no
-            st.session_state['df_si_cached'] = df_si
-        except Exception as e:
-            st.error(f"Error al leer clientes desde la BD: {e}")
-            df_no = pd.DataFrame()
-            df_si = pd.DataFrame()
-    
+    if refrescar_cambios(forzar=forzar) is None and forzar:
+        # Sin registro de cambios: recarga completa de la base como antes
+        invalidar_bases(vista_clientes["base_name"])
+
+    def recargar_clientes():
+        """
+        Arma df_no / df_si de la vista actual: la primera página de ambos tabs sale de una
+        sola consulta y las páginas extra ("Cargar más") de obtener_clientes_pagina.
+        Todo pasa por la caché compartida, que se invalida sola tras cada escritura.
+        Retorna (df_no, df_si).
+        """
+        df_no, df_si, cursor_no, cursor_si = obtener_clientes_vista(**vista_clientes)
+        tabs = {"no": [df_no, cursor_no], "si": [df_si, cursor_si]}
+        for tab, estado in tabs.items():
+            paginas = [estado[0]]
+            for _ in range(st.session_state.get(f"paginas_{tab}", 1) - 1):
+                if estado[1] is None:
+                    break
+                df_pag, estado[1] = obtener_clientes_pagina(contactado=(tab == "si"), despues_de_id=estado[1], **vista_clientes)
+                paginas.append(df_pag)
+            if len(paginas) > 1:
+                estado[0] = pd.concat(paginas, ignore_index=True)
+            st.session_state[f"cursor_{tab}"] = estado[1]
+        return tabs["no"][0], tabs["si"][0]
+
+    try:
+        df_no, df_si = recargar_clientes()
+    except Exception as e:
+        st.error(f"Error al leer clientes desde la BD: {e}")
+        df_no = pd.DataFrame()
+        df_si = pd.DataFrame()
+    
+    def cargar_mas(tab):
+        """
+        Pide una página más (keyset) del tab indicado ("no" o "si") en el próximo render.
+        """
+        if st.session_state.get(f"cursor_{tab}") is None:
+            return
+        st.session_state[f"paginas_{tab}"] = st.session_state.get(f"paginas_{tab}", 1) + 1
+
     # Import AgGrid — preferible tenerlo al top, pero lo dejamos aquí si no está importado antes
     from st_aggrid import AgGrid, GridOptionsBuilder, DataReturnMode, GridUpdateMode
     
     # Crear tabs
     tab1, tab2 = st.tabs(["📋 No Contactados", "✅ Contactados"])
 
-    st.write("DEBUG: df_no_cached columns:", None if st.session_state.get('df_no_cached') is None else st.session_state['df_no_cached'].columns.tolist())
-    st.write("DEBUG: df_si_cached columns:", None if st.session_state.get('df_si_cached') is None else st.session_state['df_si_cached'].columns.tolist())
-    st.write("DEBUG: len df_no_cached:", None if st.session_state.get('df_no_cached') is None else len(st.session_state['df_no_cached']))
-    st.write("DEBUG: len df_si_cached:", None if st.session_state.get('df_si_cached') is None else len(st.session_state['df_si_cached']))
-
     # --------------------------------------------------------------------
     # Helper: mapping display columns <-> DB columns (debe coincidir con rename_columns_for_display)
     # --------------------------------------------------------------------
@@ -457,13 +579,16 @@ if st.session_state.get("authentication_status") is True:
     # ------------------------- 
     # TAB 1: NO CONTACTADOS
     # -------------------------
+    perfil.seccion("tab no contactados (AgGrid + exportación)")
     with tab1:
         st.subheader("Clientes No Contactados")
     
-        filtro = st.text_input("🔍 Buscar cliente (filtra por Nombre)", key="filtro_no")
-        df_no_filtered = df_no.copy()
-        if filtro and not df_no_filtered.empty and "nombre" in df_no_filtered.columns:
-            df_no_filtered = df_no_filtered[df_no_filtered["nombre"].str.contains(filtro, case=False, na=False)]
+        filtro = st.text_input("🔍 Buscar cliente (nombre, NIT, contacto, ciudad, email o teléfono)", key="filtro_no")
+        if filtro:
+            # Índice en memoria de la base (o la BD mientras se construye): cubre toda la base, no solo las páginas cargadas
+            df_no_filtered = buscar_clientes(filtro, contactado=False, **vista_clientes).drop(columns=["relevancia"], errors="ignore")
+        else:
+            df_no_filtered = df_no.copy()
     
         # Normalizar y preparar DF para mostrar
         df_no_display = rename_columns_for_display(df_no_filtered)
@@ -481,12 +606,7 @@ if st.session_state.get("authentication_status") is True:
         if df_no_display.empty:
             st.info("No hay clientes para mostrar.")
         else:
-            # Guardamos copia original (claves como str)
-            orig_no_key = "orig_no_map"
-            orig_no_map = {str(r.get("id")): r for r in df_no_display.to_dict("records")}
-            st.session_state[orig_no_key] = orig_no_map
-    
-            # Configurar AgGrid
+            # Configurar AgGrid (df_no_display es también la referencia para detectar ediciones)
             gb = GridOptionsBuilder.from_dataframe(df_no_display)
             gb.configure_default_column(filterable=True, editable=False, sortable=True, resizable=True)
     
@@ -528,140 +648,35 @@ if st.session_state.get("authentication_status") is True:
                 height=420
             )
     
-            # --- Guardado automático de ediciones (igual que el bloque que ya tenías) ---
+            # --- Guardado automático de ediciones (solo las celdas que realmente cambiaron) ---
             try:
-                edited = pd.DataFrame(grid_response.get("data", []))
-                if not edited.empty:
-                    orig_map = st.session_state.get(orig_no_key, {})
-                    applied_any_update = False
-    
-                    for _, row in edited.iterrows():
-                        rid_raw = row.get("id")
-                        if rid_raw is None:
-                            continue
-                        try:
-                            rid_str = str(int(rid_raw))
-                        except Exception:
-                            rid_str = str(rid_raw)
-    
-                        orig_row = orig_map.get(rid_str, {})
-                        updates_db = {}
-    
-                        for disp_col in edited.columns:
-                            if disp_col == "id":
-                                continue
-                            old_val = orig_row.get(disp_col)
-                            new_val = row.get(disp_col)
-                            if (pd.isna(old_val) and (new_val is not None and new_val != "")) or (not pd.isna(old_val) and old_val != new_val):
-                                db_col = display_to_db.get(disp_col)
-                                if not db_col:
-                                    continue
-    
-                                # Manejo de fecha_contacto
-                                if db_col == "fecha_contacto":
-                                    try:
-                                        if new_val in (None, "", "None", "null", "NULL"):
-                                            updates_db[db_col] = None
-                                        elif isinstance(new_val, str) and new_val.strip() in ("{}", "{ }"):
-                                            updates_db[db_col] = None
-                                        elif isinstance(new_val, dict):
-                                            date_candidate = new_val.get("date") or new_val.get("value") or next(iter(new_val.values()), None)
-                                            parsed = pd.to_datetime(date_candidate, errors="coerce")
-                                            updates_db[db_col] = None if pd.isna(parsed) else str(parsed.date())
-                                        elif hasattr(new_val, "date"):
-                                            try:
-                                                updates_db[db_col] = str(new_val.date())
-                                            except Exception:
-                                                updates_db[db_col] = None
-                                        else:
-                                            parsed = pd.to_datetime(new_val, errors="coerce")
-                                            updates_db[db_col] = None if pd.isna(parsed) else str(parsed.date())
-                                    except Exception:
-                                        updates_db[db_col] = None
-    
-                                elif db_col == "contactado":
-                                    if isinstance(new_val, bool):
-                                        updates_db[db_col] = new_val
-                                    else:
-                                        updates_db[db_col] = bool(new_val)
-                                else:
-                                    updates_db[db_col] = new_val
-    
-                        if updates_db:
-                            try:
-                                try:
-                                    cliente_id_param = int(rid_str)
-                                except Exception:
-                                    cliente_id_param = rid_str
-                                actualizar_cliente_campos(cliente_id_param, updates_db)
-                                applied_any_update = True
-                                # (VERIFICACIÓN INMEDIATA) — comprobar directamente en la BD que el update se aplicó
-                                try:
-                                    with engine.connect() as conn:
-                                        check = conn.execute(text("SELECT id, contactado, fecha_contacto FROM clientes WHERE id = :id"), {"id": cliente_id_param}).fetchone()
-                                        # Mostrar mensaje de debug en la app (visible solo para ti)
-                                        st.info(f"DEBUG Update -> id={cliente_id_param} DB row: {dict(check) if check is not None else None}")
-                                except Exception as e:
-                                    st.error(f"DEBUG Update -> Error verificando DB id={cliente_id_param}: {e}")
-
-                                orig_map.setdefault(rid_str, {})
-                                for k_disp, v in row.items():
-                                    orig_map[rid_str][k_disp] = v
-                            except Exception as e:
-                                st.error(f"Error guardando cambios para id {rid_str}: {e}")
-    
-                    # persistimos el mapa actualizado
-                    st.session_state[orig_no_key] = orig_map
-                    
-                    # --------- REFRESCAR INMEDIATAMENTE LOS DF desde la BD ----------
+                editado = pd.DataFrame(grid_response.get("data", []))
+                cambios_lote = diferencias_grid(df_no_display, editado, display_to_db)
+                # Sin cambios reales no se escribe ni se recarga nada
+                if cambios_lote:
                     try:
-                        # Volver a obtener los datos desde la DB usando la misma lógica que usas arriba
-                        if is_admin:
-                            if filtrar_base and filtrar_base != "Todas":
-                                df_no = obtener_clientes(contactado=False, username=None, is_admin=True, base_name=filtrar_base)
-                                df_si = obtener_clientes(contactado=True, username=None, is_admin=True, base_name=filtrar_base)
-                            elif filtrar_username:
-                                df_no = obtener_clientes(contactado=False, username=filtrar_username, is_admin=True)
-                                df_si = obtener_clientes(contactado=True, username=filtrar_username, is_admin=True)
-                            else:
-                                df_no = obtener_clientes(contactado=False, is_admin=True)
-                                df_si = obtener_clientes(contactado=True, is_admin=True)
-                        else:
-                            selected_base = st.session_state.get("selected_base_view", "TRANSLOGISTIC")
-                            if selected_base == "TRANSLOGISTIC":
-                                df_no = obtener_clientes(contactado=False, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                                df_si = obtener_clientes(contactado=True, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                            else:
-                                internal_base = f"{username}__{selected_base}"
-                                df_no = obtener_clientes(contactado=False, username=username, is_admin=False, base_name=internal_base)
-                                df_si = obtener_clientes(contactado=True, username=username, is_admin=False, base_name=internal_base)
-                    
-                        # Guardar en session_state para que el siguiente render use estas versiones
-                        st.session_state['df_no_cached'] = df_no
-                        st.session_state['df_si_cached'] = df_si
-                    
-                        # Mensaje opcional para debug (puedes quitarlo luego)
-                        st.info(f"✅ Datos recargados: No contactados={len(df_no) if df_no is not None else 0}, Contactados={len(df_si) if df_si is not None else 0}")
-                    except Exception as e:
-                        st.error(f"Error refrescando datos desde BD: {e}")
-                    
-                    # Forzar rerun controlado para que la UI vuelva a render con los DF recargados
-                    if applied_any_update:
+                        # Guardar todos los cambios en una sola transacción (un UPDATE por grupo de columnas)
+                        # El UPDATE retorna las filas tal como quedaron (RETURNING): no hace falta releerlas
+                        actualizar_clientes_campos(cambios_lote)
+                        # Las páginas cacheadas ya quedaron parchadas (y las filas que cambiaron de
+                        # contactado, en el otro tab): el rerun no vuelve a leer los tabs de la BD
                         safe_rerun()
-
-    
+                    except Exception as e:
+                        st.error(f"Error guardando cambios ({len(cambios_lote)} filas): {e}")
             except Exception as e:
                 st.text(f"(Aviso) Error procesando ediciones automáticas: {e}")
     
             # resto: exportar, eliminar, etc. (mantén tu lógica de eliminación pero usa safe_rerun() después)
 
     
-            # Botón de exportar (usa df_no original sin renombrar para mantener campos DB)
-            st.download_button(
-                "⬇️ Exportar clientes no contactados (.xlsx)",
-                data=exportar_excel(df_no_filtered),
-                file_name="clientes_no_contactados.xlsx"
-            )
+            # Paginación: el grid solo tiene las páginas ya leídas; pedir la siguiente bajo demanda
+            if not filtro and st.session_state.get("cursor_no") is not None:
+                if st.button("⬇️ Cargar más clientes (No Contactados)", key="cargar_mas_no"):
+                    cargar_mas("no")
+                    safe_rerun()
+
+            # Botón de exportar (columnas de la BD; lee todas las páginas, no solo las cargadas en el grid)
+            panel_exportar("⬇️ Exportar clientes no contactados", False, filtro, "clientes_no_contactados", "exportar_no")
     
             # Acciones sobre filas seleccionadas (ejemplo: eliminar)
             selected_no = grid_response.get("selected_rows", [])
@@ -672,49 +687,16 @@ if st.session_state.get("authentication_status") is True:
                     st.warning("Confirmar: se eliminarán los clientes seleccionados.")
                     if st.button("Confirmar eliminación seleccionados (No Contactados)", key="confirm_eliminar_no"):
                         try:
-                            deleted_any = False
-                            for row in selected_no:
-                                if hasattr(row, "to_dict"):
-                                    row = row.to_dict()
-                                rid = row.get("id")
-                                if not rid:
-                                    continue
-                                try:
-                                    eliminar_cliente(int(rid))
-                                    deleted_any = True
-                                except Exception as e:
-                                    st.error(f"No se pudo eliminar id {rid}: {e}")
-                            if deleted_any:
-                                st.success("Clientes seleccionados eliminados ✅")
-                                # Releer la BD inmediatamente y guardar en session_state
-                                try:
-                                    # Reusar la misma lógica para recomponer df_no y df_si
-                                    if is_admin:
-                                        if filtrar_base and filtrar_base != "Todas":
-                                            df_no = obtener_clientes(contactado=False, username=None, is_admin=True, base_name=filtrar_base)
-                                            df_si = obtener_clientes(contactado=True, username=None, is_admin=True, base_name=filtrar_base)
-                                        elif filtrar_username:
-                                            df_no = obtener_clientes(contactado=False, username=filtrar_username, is_admin=True)
-                                            df_si = obtener_clientes(contactado=True, username=filtrar_username, is_admin=True)
-                                        else:
-                                            df_no = obtener_clientes(contactado=False, is_admin=True)
-                                            df_si = obtener_clientes(contactado=True, is_admin=True)
-                                    else:
-                                        selected_base = st.session_state.get("selected_base_view", "TRANSLOGISTIC")
-                                        if selected_base == "TRANSLOGISTIC":
-                                            df_no = obtener_clientes(contactado=False, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                                            df_si = obtener_clientes(contactado=True, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                                        else:
-                                            internal_base = f"{username}__{selected_base}"
-                                            df_no = obtener_clientes(contactado=False, username=username, is_admin=False, base_name=internal_base)
-                                            df_si = obtener_clientes(contactado=True, username=username, is_admin=False, base_name=internal_base)
-                            
-                                    st.session_state['df_no_cached'] = df_no
-                                    st.session_state['df_si_cached'] = df_si
-                                except Exception as e:
-                                    st.error(f"Error refrescando datos tras eliminación: {e}")
-                    
-
+                            # Un solo DELETE (y una sola transacción) para toda la selección
+                            ids_pedidos = ids_seleccionados(selected_no)
+                            eliminados = eliminar_clientes(ids_pedidos)
+                            if eliminados:
+                                st.success(f"Clientes seleccionados eliminados ✅ ({len(eliminados)})")
+                                no_eliminados = sorted(set(ids_pedidos) - set(eliminados))
+                                if no_eliminados:
+                                    st.warning(f"No se encontraron en la BD (ya eliminados?): {no_eliminados}")
+                                # Forzar refresh para que la vista se actualice inmediatamente
+                                safe_rerun()
                             else:
                                 st.info("No se eliminaron registros.")
                         except Exception as e:
@@ -724,13 +706,15 @@ if st.session_state.get("authentication_status") is True:
     # -------------------------
     # TAB 2: CONTACTADOS
     # -------------------------
+    perfil.seccion("tab contactados (AgGrid + exportación)")
     with tab2:
         st.subheader("Clientes Contactados")
     
-        filtro2 = st.text_input("🔍 Buscar cliente (Contactados)", key="filtro_si")
-        df_si_filtered = df_si.copy()
-        if filtro2 and not df_si_filtered.empty and "nombre" in df_si_filtered.columns:
-            df_si_filtered = df_si_filtered[df_si_filtered["nombre"].str.contains(filtro2, case=False, na=False)]
+        filtro2 = st.text_input("🔍 Buscar cliente (Contactados: nombre, NIT, contacto, ciudad, email o teléfono)", key="filtro_si")
+        if filtro2:
+            df_si_filtered = buscar_clientes(filtro2, contactado=True, **vista_clientes).drop(columns=["relevancia"], errors="ignore")
+        else:
+            df_si_filtered = df_si.copy()
     
         df_si_display = rename_columns_for_display(df_si_filtered)
     
@@ -747,10 +731,6 @@ if st.session_state.get("authentication_status") is True:
         if df_si_display.empty:
             st.info("No hay clientes contactados para mostrar.")
         else:
-            orig_si_key = "orig_si_map"
-            orig_si_map = {str(r.get("id")): r for r in df_si_display.to_dict("records")}
-            st.session_state[orig_si_key] = orig_si_map
-    
             gb2 = GridOptionsBuilder.from_dataframe(df_si_display)
             gb2.configure_default_column(filterable=True, sortable=True, resizable=True)
     
@@ -788,135 +768,34 @@ if st.session_state.get("authentication_status") is True:
                 height=420
             )
     
-            # --- Guardado automático de ediciones ---
+            # --- Guardado automático de ediciones (solo las celdas que realmente cambiaron) ---
             try:
-                edited2 = pd.DataFrame(grid_response2.get("data", []))
-                if not edited2.empty:
-                    orig_map2 = st.session_state.get(orig_si_key, {})
-                    applied_any_update = False
-    
-                    for _, row in edited2.iterrows():
-                        rid_raw = row.get("id")
-                        if rid_raw is None:
-                            continue
-                        try:
-                            rid_str = str(int(rid_raw))
-                        except Exception:
-                            rid_str = str(rid_raw)
-    
-                        orig_row = orig_map2.get(rid_str, {})
-                        updates_db = {}
-    
-                        for disp_col in edited2.columns:
-                            if disp_col == "id":
-                                continue
-                            old_val = orig_row.get(disp_col)
-                            new_val = row.get(disp_col)
-                            if (pd.isna(old_val) and (new_val is not None and new_val != "")) or (not pd.isna(old_val) and old_val != new_val):
-                                db_col = display_to_db.get(disp_col)
-                                if not db_col:
-                                    continue
-    
-                                if db_col == "fecha_contacto":
-                                    try:
-                                        if new_val in (None, "", "None", "null", "NULL"):
-                                            updates_db[db_col] = None
-                                        elif isinstance(new_val, str) and new_val.strip() in ("{}", "{ }"):
-                                            updates_db[db_col] = None
-                                        elif isinstance(new_val, dict):
-                                            date_candidate = new_val.get("date") or new_val.get("value") or next(iter(new_val.values()), None)
-                                            parsed = pd.to_datetime(date_candidate, errors="coerce")
-                                            updates_db[db_col] = None if pd.isna(parsed) else str(parsed.date())
-                                        elif hasattr(new_val, "date"):
-                                            try:
-                                                updates_db[db_col] = str(new_val.date())
-                                            except Exception:
-                                                updates_db[db_col] = None
-                                        else:
-                                            parsed = pd.to_datetime(new_val, errors="coerce")
-                                            updates_db[db_col] = None if pd.isna(parsed) else str(parsed.date())
-                                    except Exception:
-                                        updates_db[db_col] = None
-    
-                                elif db_col == "contactado":
-                                    if isinstance(new_val, bool):
-                                        updates_db[db_col] = new_val
-                                    else:
-                                        updates_db[db_col] = bool(new_val)
-                                else:
-                                    updates_db[db_col] = new_val
-    
-                        if updates_db:
-                            try:
-                                try:
-                                    cliente_id_param = int(rid_str)
-                                except Exception:
-                                    cliente_id_param = rid_str
-                                actualizar_cliente_campos(cliente_id_param, updates_db)
-                                applied_any_update = True
-                                # (VERIFICACIÓN INMEDIATA) — comprobar directamente en la BD que el update se aplicó
-                                try:
-                                    with engine.connect() as conn:
-                                        check = conn.execute(text("SELECT id, contactado, fecha_contacto FROM clientes WHERE id = :id"), {"id": cliente_id_param}).fetchone()
-                                        # Mostrar mensaje de debug en la app (visible solo para ti)
-                                        st.info(f"DEBUG Update -> id={cliente_id_param} DB row: {dict(check) if check is not None else None}")
-                                except Exception as e:
-                                    st.error(f"DEBUG Update -> Error verificando DB id={cliente_id_param}: {e}")
-
-                                orig_map2.setdefault(rid_str, {})
-                                for k_disp, v in row.items():
-                                    orig_map2[rid_str][k_disp] = v
-                            except Exception as e:
-                                st.error(f"Error guardando cambios para id {rid_str}: {e}")
-    
-                    # persistimos el mapa actualizado
-                    st.session_state[orig_si_key] = orig_map2
-                    
-                    # --------- REFRESCAR INMEDIATAMENTE LOS DF desde la BD (TAB 2) ----------
+                editado = pd.DataFrame(grid_response2.get("data", []))
+                cambios_lote = diferencias_grid(df_si_display, editado, display_to_db)
+                # Sin cambios reales no se escribe ni se recarga nada
+                if cambios_lote:
                     try:
-                        if is_admin:
-                            if filtrar_base and filtrar_base != "Todas":
-                                df_no = obtener_clientes(contactado=False, username=None, is_admin=True, base_name=filtrar_base)
-                                df_si = obtener_clientes(contactado=True, username=None, is_admin=True, base_name=filtrar_base)
-                            elif filtrar_username:
-                                df_no = obtener_clientes(contactado=False, username=filtrar_username, is_admin=True)
-                                df_si = obtener_clientes(contactado=True, username=filtrar_username, is_admin=True)
-                            else:
-                                df_no = obtener_clientes(contactado=False, is_admin=True)
-                                df_si = obtener_clientes(contactado=True, is_admin=True)
-                        else:
-                            selected_base = st.session_state.get("selected_base_view", "TRANSLOGISTIC")
-                            if selected_base == "TRANSLOGISTIC":
-                                df_no = obtener_clientes(contactado=False, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                                df_si = obtener_clientes(contactado=True, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-                            else:
-                                internal_base = f"{username}__{selected_base}"
-                                df_no = obtener_clientes(contactado=False, username=username, is_admin=False, base_name=internal_base)
-                                df_si = obtener_clientes(contactado=True, username=username, is_admin=False, base_name=internal_base)
-                    
-                        st.session_state['df_no_cached'] = df_no
-                        st.session_state['df_si_cached'] = df_si
-                    
-                        st.info(f"✅ Datos recargados: No contactados={len(df_no) if df_no is not None else 0}, Contactados={len(df_si) if df_si is not None else 0}")
-                    except Exception as e:
-                        st.error(f"Error refrescando datos desde BD: {e}")
-                    
-                    if applied_any_update:
+                        # Guardar todos los cambios en una sola transacción (un UPDATE por grupo de columnas)
+                        # El UPDATE retorna las filas tal como quedaron (RETURNING): no hace falta releerlas
+                        actualizar_clientes_campos(cambios_lote)
+                        # Las páginas cacheadas ya quedaron parchadas (y las filas que cambiaron de
+                        # contactado, en el otro tab): el rerun no vuelve a leer los tabs de la BD
                         safe_rerun()
-
-    
+                    except Exception as e:
+                        st.error(f"Error guardando cambios ({len(cambios_lote)} filas): {e}")
             except Exception as e:
                 st.text(f"(Aviso) Error procesando ediciones automáticas en Contactados: {e}")
     
             # Exportar Contactados, eliminar, etc.
 
     
+            if not filtro2 and st.session_state.get("cursor_si") is not None:
+                if st.button("⬇️ Cargar más clientes (Contactados)", key="cargar_mas_si"):
+                    cargar_mas("si")
+                    safe_rerun()
+
             # Exportar Contactados
-            st.download_button(
-                "⬇️ Exportar Contactados a Excel",
-                data=exportar_excel(df_si_filtered),
-                file_name="clientes_contactados.xlsx"
-            )
+            panel_exportar("⬇️ Exportar Contactados", True, filtro2, "clientes_contactados", "exportar_si")
     
             # Acciones sobre filas seleccionadas (ej: eliminar)
             selected = grid_response2.get("selected_rows", [])
@@ -927,28 +806,14 @@ if st.session_state.get("authentication_status") is True:
                     st.warning("Confirmar: se eliminarán los clientes seleccionados.")
                     if st.button("Confirmar eliminación seleccionados (Contactados)", key="confirm_eliminar_si"):
                         try:
-                            deleted_any = False
-                            for row in selected:
-                                if hasattr(row, "to_dict"):
-                                    row = row.to_dict()
-                                rid = row.get("id")
-                                if not rid:
-                                    continue
-                                try:
-                                    eliminar_cliente(int(rid))
-                                    deleted_any = True
-                                    # (VERIFICACIÓN INMEDIATA) — comprobar en la BD que la fila fue eliminada
-                                    try:
-                                        with engine.connect() as conn:
-                                            check_del = conn.execute(text("SELECT id FROM clientes WHERE id = :id"), {"id": int(rid)}).fetchone()
-                                            st.info(f"DEBUG Delete -> id={rid} presente en BD?: {False if check_del is None else True}")
-                                    except Exception as e:
-                                        st.error(f"DEBUG Delete -> Error verificando eliminación id={rid}: {e}")
-
-                                except Exception as e:
-                                    st.error(f"No se pudo eliminar id {rid}: {e}")
-                            if deleted_any:
-                                st.success("Clientes seleccionados eliminados ✅")
+                            # Un solo DELETE (y una sola transacción) para toda la selección
+                            ids_pedidos = ids_seleccionados(selected)
+                            eliminados = eliminar_clientes(ids_pedidos)
+                            if eliminados:
+                                st.success(f"Clientes seleccionados eliminados ✅ ({len(eliminados)})")
+                                no_eliminados = sorted(set(ids_pedidos) - set(eliminados))
+                                if no_eliminados:
+                                    st.warning(f"No se encontraron en la BD (ya eliminados?): {no_eliminados}")
                                 # Forzar refresh para que la vista se actualice inmediatamente
                                 safe_rerun()
                             else:
@@ -959,29 +824,28 @@ if st.session_state.get("authentication_status") is True:
     # --------------------------
     # Vista detallada y edición
     # --------------------------
+    perfil.seccion("vista detallada")
     st.markdown("---")
     st.subheader("🔎 Vista Detallada por Cliente")
 
-    # Obtener clientes para selector (para admin respetar filtros)
-    if is_admin:
-        # Si el admin puso un filtro de base en la sidebar (filtrar_base), aplica
-        if 'filtrar_base' in locals() and filtrar_base and filtrar_base != "Todas":
-            clientes = obtener_clientes(is_admin=True, base_name=filtrar_base)
-        else:
-            clientes = obtener_clientes(is_admin=True)
-    else:
-        selected = st.session_state.get("selected_base_view", "TRANSLOGISTIC")
-        if selected == "TRANSLOGISTIC":
-            clientes = obtener_clientes(contactado=None, username=None, is_admin=False, base_name="TRANSLOGISTIC")
-        else:
-            # selected es un display name; convertir a internal
-            internal_base = f"{username}__{selected}"
-            clientes = obtener_clientes(username=username, is_admin=False, base_name=internal_base)
-
-    if clientes is not None and not clientes.empty:
-        seleccion = st.selectbox("Selecciona un cliente", clientes["nombre"].tolist())
-        cliente = clientes[clientes["nombre"] == seleccion].iloc[0]
-    
+    # Selector del lado del servidor (misma vista que los tabs): como máximo
+    # LIMITE_SELECTOR_CLIENTES opciones, buscadas por nombre/NIT y resueltas por id
+    filtro_detalle = st.text_input("🔍 Buscar cliente por nombre o NIT", key="filtro_detalle")
+    opciones = opciones_selector_clientes(filtro_detalle, **vista_clientes)
+    cliente = None
+    if opciones is not None and not opciones.empty:
+        etiquetas = {int(f.id): f"{f.nombre} (NIT: {f.nit})" for f in opciones.itertuples(index=False)}
+        if not filtro_detalle and len(etiquetas) >= LIMITE_SELECTOR_CLIENTES:
+            st.caption(f"Se muestran los primeros {LIMITE_SELECTOR_CLIENTES} clientes; escribe para buscar los demás.")
+        cliente_id = st.selectbox("Selecciona un cliente", list(etiquetas), format_func=etiquetas.get)
+        # Cliente, historial y agenda en una sola consulta (cacheada por cliente entre reruns)
+        detalle = obtener_detalle_cliente(cliente_id)
+        if detalle is not None:
+            cliente, contactos_df, visitas_df = detalle
+    elif filtro_detalle:
+        st.info("Ningún cliente coincide con la búsqueda.")
+
+    if cliente is not None:
         with st.form("detalle_cliente"):
             st.write(f"### {cliente.get('nombre', '')} (NIT: {cliente.get('nit', '')})")
             tipo_operacion = st.text_input("Tipo de Operación", cliente.get("tipo_operacion", ""))
@@ -1036,51 +900,52 @@ if st.session_state.get("authentication_status") is True:
                 st.info("Eliminación cancelada.")
         
 
-    # -------------------------
-    # Historial de contactos
-    # -------------------------
-    st.markdown("#### 📞 Historial de Contactos")
-    contactos_df = obtener_contactos(cliente["id"])
-    if contactos_df is None or contactos_df.empty:
-        st.info("No hay registros de contactos todavía.")
-    else:
-        # renombrar columnas si quieres
-        st.dataframe(contactos_df, use_container_width=True)
-
-    # Formulario para agregar nuevo contacto al historial
-    with st.form("agregar_contacto"):
-        col1, col2 = st.columns(2)
-        with col1:
-            fecha_contacto = st.date_input("Fecha contacto", datetime.today())
-            tipo_contacto = st.selectbox("Tipo", ["Presencial", "Llamada", "Email"])
-        with col2:
-            notas_contacto = st.text_area("Notas (opcional)")
-        if st.form_submit_button("Agregar contacto"):
-            try:
-                agregar_contacto(cliente["id"], fecha_contacto.isoformat(), tipo_contacto, notas_contacto)
-                st.success("Contacto agregado al historial ✅")
-            except Exception as e:
-                st.error(f"No se pudo agregar el contacto: {e}")
+    if cliente is not None:
+        # -------------------------
+        # Historial de contactos
+        # -------------------------
+        perfil.seccion("contactos")
+        st.markdown("#### 📞 Historial de Contactos")
+        if contactos_df is None or contactos_df.empty:
+            st.info("No hay registros de contactos todavía.")
+        else:
+            # renombrar columnas si quieres
+            st.dataframe(contactos_df, use_container_width=True)
 
-    # -------------------------
-    # Agenda de visitas
-    # -------------------------
-    st.markdown("#### 📅 Agenda de Visitas")
-    with st.form("agendar_visita"):
-        fecha_visita = st.date_input("Fecha de visita")
-        medio_visita = st.selectbox("Medio", ["Presencial", "Llamada", "Email"])
-        if st.form_submit_button("Programar visita"):
-            try:
-                agendar_visita(cliente["id"], fecha_visita.isoformat(), medio_visita, username)
-                st.success(f"Visita programada para {fecha_visita.isoformat()}")
-            except Exception as e:
-                st.error(f"No se pudo programar la visita: {e}")
+        # Formulario para agregar nuevo contacto al historial
+        with st.form("agregar_contacto"):
+            col1, col2 = st.columns(2)
+            with col1:
+                fecha_contacto = st.date_input("Fecha contacto", datetime.today())
+                tipo_contacto = st.selectbox("Tipo", ["Presencial", "Llamada", "Email"])
+            with col2:
+                notas_contacto = st.text_area("Notas (opcional)")
+            if st.form_submit_button("Agregar contacto"):
+                try:
+                    agregar_contacto(cliente["id"], fecha_contacto.isoformat(), tipo_contacto, notas_contacto)
+                    st.success("Contacto agregado al historial ✅")
+                except Exception as e:
+                    st.error(f"No se pudo agregar el contacto: {e}")
+
+        # -------------------------
+        # Agenda de visitas
+        # -------------------------
+        perfil.seccion("visitas")
+        st.markdown("#### 📅 Agenda de Visitas")
+        with st.form("agendar_visita"):
+            fecha_visita = st.date_input("Fecha de visita")
+            medio_visita = st.selectbox("Medio", ["Presencial", "Llamada", "Email"])
+            if st.form_submit_button("Programar visita"):
+                try:
+                    agendar_visita(cliente["id"], fecha_visita.isoformat(), medio_visita, username)
+                    st.success(f"Visita programada para {fecha_visita.isoformat()}")
+                except Exception as e:
+                    st.error(f"No se pudo programar la visita: {e}")
 
-    visitas_df = obtener_visitas(cliente["id"])
-    if visitas_df is None or visitas_df.empty:
-        st.info("No hay visitas agendadas.")
-    else:
-        st.dataframe(visitas_df, use_container_width=True)
+        if visitas_df is None or visitas_df.empty:
+            st.info("No hay visitas agendadas.")
+        else:
+            st.dataframe(visitas_df, use_container_width=True)
 
     st.markdown("---")
     st.markdown("<div style='text-align:center; padding: 12px;'>"
@@ -1098,3 +963,6 @@ elif st.session_state.get("authentication_status") is False:
 
 else:  # authentication_status es None
     st.sidebar.warning("🔑 Por favor ingresa tus credenciales")
+
+# Fin del rerun: cerrar y guardar el perfil (si el script se corta antes, lo cierra el siguiente rerun)
+finalizar_perfil_rerun(st.session_state, escribir=PERFILADOR_ESCRIBIR, directorio=PERFILES_DIR)
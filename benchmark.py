@@ -0,0 +1,235 @@
+"""
+Benchmark de las funciones de db.py / exportar.py contra una BD Postgres LOCAL.
+
+Llenar antes la BD con generar_datos.py. Cada caso se repite N veces (más una de
+calentamiento) y el resultado sale en JSON para comparar entre versiones:
+
+    MYLOCALDATA_DATABASE_URL=postgresql+psycopg2://postgres@localhost/mylocaldata \\
+        python benchmark.py --repeticiones 20 --salida bench_nuevo.json --comparar bench_viejo.json
+
+db.py lee sus ajustes con st.secrets: hace falta streamlit instalado y un
+.streamlit/secrets.toml (puede estar vacío). Las escrituras se hacen en la base
+BENCHMARK, que se borra al terminar.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE_BENCHMARK = "BENCHMARK"
+# Búsquedas típicas (con tildes, mayúsculas y errores de tipeo)
+TEXTOS_BUSQUEDA = ["logistica", "Transportes Gómez", "800001234", "distribuidra andina", "bogota", "María"]
+
+def _percentil(ordenados, p):
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+def medir(funcion, repeticiones, preparar=None):
+    """
+    Corre funcion(*preparar()) `repeticiones` veces (más una de calentamiento que no cuenta).
+    preparar() se ejecuta fuera de la medición y retorna los argumentos de cada repetición.
+    """
+    tiempos = []
+    for i in range(repeticiones + 1):
+        args = preparar() if preparar else ()
+        inicio = time.perf_counter()
+        funcion(*args)
+        ms = (time.perf_counter() - inicio) * 1000
+        if i > 0:
+            tiempos.append(ms)
+    ordenados = sorted(tiempos)
+    return {
+        "n": len(tiempos),
+        "min_ms": round(ordenados[0], 3),
+        "p50_ms": round(_percentil(ordenados, 50), 3),
+        "p95_ms": round(_percentil(ordenados, 95), 3),
+        "max_ms": round(ordenados[-1], 3),
+        "media_ms": round(sum(tiempos) / len(tiempos), 3),
+    }
+
+def _csv_importacion(filas, semilla=7):
+    rnd = random.Random(semilla)
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(["Nombre", "NIT", "Contacto", "Teléfono", "Email", "Ciudad"])
+    for i in range(filas):
+        escritor.writerow([f"Importado {i}", f"7{i:08d}", f"Contacto {i}", f"31{rnd.randrange(10**8):08d}",
+                           f"importado{i}@ejemplo.co", rnd.choice(["Bogotá", "Medellín", "Cali"])])
+    return salida.getvalue().encode("utf-8")
+
+def casos(db, exportar, repeticiones):
+    """Genera (nombre, resultado) para cada caso del benchmark."""
+    from sqlalchemy import text
+
+    with db.engine.connect() as conn:
+        base_grande = conn.execute(text(
+            "SELECT base_name FROM bases WHERE base_name <> :b ORDER BY total_clientes DESC LIMIT 1"
+        ), {"b": BASE_BENCHMARK}).scalar()
+        cursor_pagina = conn.execute(text("""
+            SELECT id FROM clientes WHERE base_name = 'TRANSLOGISTIC' AND contactado = FALSE
+            ORDER BY id OFFSET :n LIMIT 1
+        """), {"n": 10 * db.PAGINA_CLIENTES}).scalar()
+        muestra_ids = [r[0] for r in conn.execute(text(
+            "SELECT cliente_id FROM contactos GROUP BY cliente_id ORDER BY cliente_id LIMIT 500"
+        ))]
+    rnd = random.Random(1)
+    vista = {"username": None, "is_admin": False, "base_name": "TRANSLOGISTIC"}
+
+    # --- Lecturas ---
+    def _frio(base):
+        return lambda: (db.invalidar_bases(base), ())[1]
+
+    yield "obtener_clientes_vista (frío)", medir(
+        lambda: db.obtener_clientes_vista(**vista), repeticiones, _frio("TRANSLOGISTIC"))
+    yield "obtener_clientes_vista (caché)", medir(lambda: db.obtener_clientes_vista(**vista), repeticiones)
+    if cursor_pagina is not None:
+        yield "obtener_clientes_pagina (página 11, frío)", medir(
+            lambda: db.obtener_clientes_pagina(contactado=False, base_name="TRANSLOGISTIC",
+                                               despues_de_id=cursor_pagina),
+            repeticiones, _frio("TRANSLOGISTIC"))
+    if base_grande:
+        yield "obtener_clientes (base privada más grande, frío)", medir(
+            lambda: db.obtener_clientes(is_admin=True, base_name=base_grande), repeticiones, _frio(base_grande))
+
+    # buscar_clientes en la BD (sin índice en memoria) y desde el índice en memoria
+    max_filas = db.INDICE_BUSQUEDA_MAX_FILAS
+    db.INDICE_BUSQUEDA_MAX_FILAS = -1
+    db.descartar_indices_busqueda("TRANSLOGISTIC")
+    try:
+        yield "buscar_clientes (BD)", medir(
+            lambda q: db.buscar_clientes(q, **vista), repeticiones,
+            lambda: (db.invalidar_bases("TRANSLOGISTIC"), (rnd.choice(TEXTOS_BUSQUEDA),))[1])
+    finally:
+        db.INDICE_BUSQUEDA_MAX_FILAS = max_filas
+    inicio = time.perf_counter()
+    db._construir_indice("TRANSLOGISTIC")
+    yield "construir índice en memoria (TRANSLOGISTIC)", {"n": 1, "p50_ms": round((time.perf_counter() - inicio) * 1000, 3)}
+    if db.indice_busqueda("TRANSLOGISTIC", construir=False) is not None:
+        yield "buscar_clientes (índice en memoria)", medir(
+            lambda q: db.buscar_clientes(q, **vista), repeticiones, lambda: (rnd.choice(TEXTOS_BUSQUEDA),))
+
+    if muestra_ids:
+        yield "obtener_contactos", medir(db.obtener_contactos, repeticiones, lambda: (rnd.choice(muestra_ids),))
+        yield "obtener_visitas", medir(db.obtener_visitas, repeticiones, lambda: (rnd.choice(muestra_ids),))
+        yield "obtener_detalle_cliente (frío)", medir(
+            db.obtener_detalle_cliente, repeticiones,
+            lambda: (lambda i: (db.invalidar_detalle(i), (i,))[1])(rnd.choice(muestra_ids)))
+    yield "get_display_base_name (caché)", medir(lambda: db.get_display_base_name("vendedor1"), repeticiones)
+
+    # --- Escrituras (todas en la base BENCHMARK) ---
+    contador = iter(range(10**9))
+
+    def _nuevo():
+        n = next(contador)
+        return ({"nombre": f"Bench {n}", "nit": f"6{n:08d}", "ciudad": "Bogotá", "base_name": BASE_BENCHMARK},)
+
+    yield "agregar_cliente", medir(db.agregar_cliente, repeticiones, _nuevo)
+
+    def _ids_benchmark(n):
+        with db.engine.begin() as conn:
+            return [r[0] for r in conn.execute(text(
+                "INSERT INTO clientes (nombre, nit, base_name) "
+                "SELECT 'Bench lote ' || g, '5' || g, :b FROM generate_series(1, :n) AS g RETURNING id"
+            ), {"b": BASE_BENCHMARK, "n": n})]
+
+    fijos = _ids_benchmark(100)
+    yield "actualizar_cliente_campos", medir(
+        db.actualizar_cliente_campos, repeticiones,
+        lambda: (rnd.choice(fijos), {"observacion": f"nota {rnd.random()}", "contactado": rnd.random() < 0.5}))
+    yield "actualizar_clientes_campos (100 filas)", medir(
+        db.actualizar_clientes_campos, repeticiones,
+        lambda: ([(i, {"observacion": f"lote {rnd.random()}", "ciudad": "Cali"}) for i in fijos],))
+    yield "eliminar_clientes (100 filas)", medir(db.eliminar_clientes, repeticiones, lambda: (_ids_benchmark(100),))
+
+    contenido = _csv_importacion(5000)
+    yield "importar_clientes (CSV 5.000 filas)", medir(
+        lambda archivo: db.importar_clientes(archivo, base_name=BASE_BENCHMARK, nombre_archivo="bench.csv"),
+        max(1, min(repeticiones, 5)), lambda: (io.BytesIO(contenido),))
+
+    # --- Exportaciones (streaming desde la BD a un archivo temporal) ---
+    if base_grande:
+        with tempfile.TemporaryDirectory() as carpeta:
+            for formato, reps in (("csv", min(repeticiones, 5)), ("parquet", min(repeticiones, 5)), ("xlsx", min(repeticiones, 3))):
+                destino = os.path.join(carpeta, f"export.{formato}")
+                try:
+                    yield f"exportar_clientes {formato} (base privada más grande)", medir(
+                        lambda: exportar.exportar_clientes(destino, formato, is_admin=True, base_name=base_grande),
+                        max(1, reps))
+                except ImportError as e:
+                    print(f"  (omitido {formato}: {e})")
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def comparar(actual, previo):
+    # p50 de cada caso frente al archivo previo (ratio < 1 = más rápido ahora)
+    print(f"\nComparación contra {previo.get('etiqueta') or previo.get('commit')}:")
+    for nombre, datos in actual["resultados"].items():
+        antes = previo.get("resultados", {}).get(nombre)
+        if not antes or not antes.get("p50_ms"):
+            continue
+        ratio = datos["p50_ms"] / antes["p50_ms"]
+        print(f"  {nombre:<55} {antes['p50_ms']:>10.2f} -> {datos['p50_ms']:>10.2f} ms  (x{ratio:.2f})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de db.py contra una BD local.")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    parser.add_argument("--etiqueta", help="nombre de la corrida (por defecto, el commit)")
+    parser.add_argument("--comparar", help="JSON de una corrida previa")
+    args = parser.parse_args()
+
+    if not os.environ.get("MYLOCALDATA_DATABASE_URL"):
+        print("Definir MYLOCALDATA_DATABASE_URL (BD Postgres local llenada con generar_datos.py)")
+        return 2
+
+    import db
+    import exportar
+    from sqlalchemy import text
+
+    db.crear_tabla()
+    with db.engine.connect() as conn:
+        total = conn.execute(text("SELECT coalesce(sum(total_clientes), 0) FROM bases")).scalar()
+
+    resultado = {
+        "etiqueta": args.etiqueta or _commit(),
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "clientes_en_bd": int(total),
+        "repeticiones": args.repeticiones,
+        "resultados": {},
+    }
+    print(f"Benchmark con {total} clientes, {args.repeticiones} repeticiones por caso")
+    try:
+        for nombre, datos in casos(db, exportar, args.repeticiones):
+            resultado["resultados"][nombre] = datos
+            print(f"  {nombre:<55} p50 {datos['p50_ms']:>10.2f} ms   p95 {datos.get('p95_ms', datos['p50_ms']):>10.2f} ms")
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM clientes WHERE base_name = :b"), {"b": BASE_BENCHMARK})
+        db.invalidar_bases(BASE_BENCHMARK)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
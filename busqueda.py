@@ -0,0 +1,188 @@
+import threading
+import unicodedata
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# --------------------------
+# Índice invertido de trigramas en memoria (búsqueda tipo "type-ahead" sin ir a la BD)
+# --------------------------
+# Campos que entran al texto indexado de cada cliente (los mismos que buscar_clientes en db.py)
+CAMPOS_INDEXADOS = ("nombre", "nit", "contacto", "ciudad", "email", "telefono")
+
+def normalizar_texto(valor) -> str:
+    # minúsculas y sin tildes ("Bogotá" -> "bogota")
+    if valor is None:
+        return ""
+    try:
+        if pd.isna(valor):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    texto = unicodedata.normalize("NFKD", str(valor).lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def trigramas(texto: str) -> set:
+    """
+    Trigramas por palabra con el mismo relleno que pg_trgm ("  w" al inicio, " " al final),
+    así las palabras cortas también generan trigramas.
+    """
+    grams = set()
+    for palabra in texto.split():
+        relleno = f"  {palabra} "
+        for i in range(len(relleno) - 2):
+            grams.add(relleno[i:i + 3])
+    return grams
+
+class IndiceNgramas:
+    """
+    Índice trigrama -> posiciones de un snapshot de clientes.
+    - Las listas de posiciones son array('I') (4 bytes por entrada) y se consultan con numpy.
+    - Editar o borrar un cliente marca su posición como muerta y (si sigue existiendo) agrega
+      una posición nueva; cuando hay demasiadas muertas el índice se compacta.
+    Es seguro para uso concurrente (lock interno).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._lock = threading.RLock()
+        self._construir(df)
+
+    def _construir(self, df):
+        self._postings = {}           # trigrama -> array('I') de posiciones
+        self._ids = array("q")        # posición -> id de cliente
+        self._vivo = bytearray()      # posición -> 1 si sigue vigente
+        self._contactado = bytearray()
+        self._usuario = array("I")    # posición -> código de username (ver _codigos_usuario)
+        self._codigos_usuario = {}    # username -> código
+        self._docs = []               # posición -> texto normalizado
+        self._posicion = {}           # id de cliente -> posición vigente
+        self._muertas = 0
+        self._filas = {} if df is None or df.empty else {
+            int(r["id"]): r for r in df.to_dict("records")
+        }
+        self._columnas = list(df.columns) if df is not None else []
+        for fila in self._filas.values():
+            self._agregar_posicion(fila)
+
+    def __len__(self):
+        return len(self._posicion)
+
+    def _agregar_posicion(self, fila):
+        pos = len(self._ids)
+        doc = normalizar_texto(" ".join(str(fila.get(c) or "") for c in CAMPOS_INDEXADOS))
+        for g in trigramas(doc):
+            lista = self._postings.get(g)
+            if lista is None:
+                lista = self._postings[g] = array("I")
+            lista.append(pos)
+        self._ids.append(int(fila["id"]))
+        self._vivo.append(1)
+        self._contactado.append(1 if bool(fila.get("contactado")) else 0)
+        username = fila.get("username")
+        self._usuario.append(self._codigos_usuario.setdefault(username, len(self._codigos_usuario)))
+        self._docs.append(doc)
+        self._posicion[int(fila["id"])] = pos
+
+    def _matar(self, cliente_id):
+        pos = self._posicion.pop(cliente_id, None)
+        if pos is not None:
+            self._vivo[pos] = 0
+            self._muertas += 1
+        self._filas.pop(cliente_id, None)
+
+    def aplicar(self, filas=(), eliminados=()):
+        """
+        Aplica cambios incrementales: filas = dicts completos de clientes insertados o
+        actualizados; eliminados = ids que ya no pertenecen al snapshot.
+        """
+        with self._lock:
+            for cliente_id in eliminados:
+                self._matar(int(cliente_id))
+            for fila in filas:
+                fila = dict(fila)
+                cliente_id = int(fila["id"])
+                self._matar(cliente_id)
+                self._filas[cliente_id] = fila
+                self._agregar_posicion(fila)
+            # Compactar cuando más de la mitad de las posiciones están muertas
+            if self._muertas > 1000 and self._muertas > len(self._posicion):
+                self._construir(pd.DataFrame(list(self._filas.values()), columns=self._columnas or None))
+
+    def buscar(self, texto, contactado=None, limite=50, umbral=0.4, username=None) -> pd.DataFrame:
+        """
+        Retorna hasta `limite` filas ordenadas por relevancia: primero las que contienen el
+        texto tal cual (sin tildes/mayúsculas), luego por proporción de trigramas en común.
+        contactado y username filtran antes de aplicar el límite (como el WHERE de la BD).
+        """
+        q = normalizar_texto(texto).strip()
+        qgrams = trigramas(q)
+        if not qgrams:
+            return pd.DataFrame(columns=self._columnas)
+
+        with self._lock:
+            vigentes = np.frombuffer(bytes(self._vivo), dtype=np.uint8) == 1
+            if contactado is not None:
+                flags = np.frombuffer(bytes(self._contactado), dtype=np.uint8)
+                vigentes &= flags == (1 if contactado else 0)
+            if username is not None:
+                codigo = self._codigos_usuario.get(username)
+                if codigo is None:
+                    return pd.DataFrame(columns=self._columnas + ["relevancia"])
+                vigentes &= np.frombuffer(self._usuario, dtype=np.uint32) == codigo
+
+            # Substring exacto, sin umbral (como LIKE '%texto%' en la BD): los trigramas internos
+            # de cada palabra del texto acotan dónde buscar; con palabras de 1-2 letras se revisa todo
+            internos = {w[i:i + 3] for w in q.split() for i in range(len(w) - 2)}
+            if not internos:
+                revisar = np.arange(len(self._docs))
+            elif all(g in self._postings for g in internos):
+                # Listas ya ordenadas y sin repetidos: se cruza de la más corta a la más larga y
+                # se para cuando quedan pocas (el substring las verifica igual)
+                listas = sorted((np.frombuffer(self._postings[g], dtype=np.uint32) for g in internos), key=len)
+                revisar = listas[0]
+                for lista in listas[1:]:
+                    if len(revisar) <= 2000:
+                        break
+                    revisar = np.intersect1d(revisar, lista, assume_unique=True)
+            else:
+                revisar = np.empty(0, dtype=np.int64)
+            revisar = revisar[vigentes[revisar]]
+            exactos = np.array([p for p in revisar.tolist() if q in self._docs[p]], dtype=np.int64)
+
+            # Similitud: proporción de trigramas del texto que tiene cada posición
+            listas = [np.frombuffer(self._postings[g], dtype=np.uint32) for g in qgrams if g in self._postings]
+            if listas:
+                posiciones, cuentas = np.unique(np.concatenate(listas), return_counts=True)
+            else:
+                posiciones, cuentas = np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+            puntaje = cuentas / len(qgrams)
+
+            candidatos = []
+            if len(exactos):
+                # Entre los exactos, primero los más parecidos (y luego por id)
+                score = np.zeros(len(exactos))
+                if len(posiciones):
+                    i = np.minimum(np.searchsorted(posiciones, exactos), len(posiciones) - 1)
+                    score = np.where(posiciones[i] == exactos, puntaje[i], 0.0)
+                ids = np.frombuffer(self._ids, dtype=np.int64)[exactos]
+                orden = np.lexsort((ids, -score))[:limite]
+                candidatos = [(True, float(score[o]), int(ids[o])) for o in orden]
+
+            faltan = limite - len(candidatos)
+            if faltan > 0 and len(posiciones):
+                mascara = vigentes[posiciones] & (puntaje >= umbral) & ~np.isin(posiciones, exactos)
+                posiciones, puntaje = posiciones[mascara], puntaje[mascara]
+                k = min(len(posiciones), faltan)
+                if k:
+                    mejores = np.argpartition(-puntaje, k - 1)[:k] if k < len(posiciones) else np.arange(len(posiciones))
+                    similares = [(False, float(puntaje[i]), self._ids[int(posiciones[i])]) for i in mejores]
+                    similares.sort(key=lambda c: (-c[1], c[2]))
+                    candidatos += similares
+
+            filas = []
+            for exacto, score, cliente_id in candidatos:
+                fila = dict(self._filas[cliente_id])
+                fila["relevancia"] = 1.0 if exacto else score
+                filas.append(fila)
+        return pd.DataFrame(filas, columns=self._columnas + ["relevancia"])
@@ -1,93 +1,706 @@
 import streamlit as st
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 import urllib.parse
+import json
+import logging
+import threading
+import uuid
+import time
+import csv
+import io
+from datetime import date, datetime
+from collections import OrderedDict, deque
+from busqueda import IndiceNgramas
+from migraciones import aplicar_migraciones
+from instrumentacion import instrumentar
+from replica import ReplicaLocal, TABLAS_REPLICA, leer_cambios, marca_actual, podar_cambios
+from notificaciones import EscuchaCambios
 
-# --- Leer secrets de Streamlit (asegúrate que estén definidos) ---
-DB_USER = st.secrets["DB_USER"]
-DB_PASS = st.secrets["DB_PASS"]
-DB_HOST = st.secrets["DB_HOST"]
-DB_NAME = st.secrets["DB_NAME"]
-DB_PORT = st.secrets.get("DB_PORT", 5432)
+# Avisos de los hilos en segundo plano y de las cachés (sin sesión a la que mostrarle st.error)
+_log = logging.getLogger("mylocaldata.db")
 
-# --- Codificar password para evitar errores si contiene caracteres especiales ---
-DB_PASS_ENC = urllib.parse.quote_plus(str(DB_PASS))
+# --- URL explícita (BD local de generar_datos.py / benchmark.py); si no, se arma desde secrets ---
+DATABASE_URL = os.environ.get("MYLOCALDATA_DATABASE_URL")
 
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS_ENC}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=require"
+if not DATABASE_URL:
+    # --- Leer secrets de Streamlit (asegúrate que estén definidos) ---
+    DB_USER = st.secrets["DB_USER"]
+    DB_PASS = st.secrets["DB_PASS"]
+    DB_HOST = st.secrets["DB_HOST"]
+    DB_NAME = st.secrets["DB_NAME"]
+    DB_PORT = st.secrets.get("DB_PORT", 5432)
+
+    # --- Codificar password para evitar errores si contiene caracteres especiales ---
+    DB_PASS_ENC = urllib.parse.quote_plus(str(DB_PASS))
+
+    DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS_ENC}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=require"
+
+# --------------------------
+# Pool de conexiones (configurable desde secrets) y sus estadísticas
+# --------------------------
+DB_POOL_SIZE = int(st.secrets.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(st.secrets.get("DB_MAX_OVERFLOW", 10))
+# Segundos máximos esperando una conexión libre antes de fallar
+DB_POOL_TIMEOUT = int(st.secrets.get("DB_POOL_TIMEOUT", 30))
+# Reciclar conexiones más viejas que esto (segundos); evita cortes del proxy/SSL del servidor
+DB_POOL_RECYCLE = int(st.secrets.get("DB_POOL_RECYCLE", 1800))
+# Pre-ping: "siempre" (en cada checkout), "inactivas" (solo si estuvo ociosa más de
+# DB_PRE_PING_INACTIVA_SEG) o "nunca" (se confía en recycle + keepalive)
+DB_PRE_PING = str(st.secrets.get("DB_PRE_PING", "inactivas")).lower()
+DB_PRE_PING_INACTIVA_SEG = int(st.secrets.get("DB_PRE_PING_INACTIVA_SEG", 60))
+# statement_timeout de Postgres en ms (0 = sin límite)
+DB_STATEMENT_TIMEOUT_MS = int(st.secrets.get("DB_STATEMENT_TIMEOUT_MS", 0))
+# TCP keepalive de libpq (segundos)
+DB_KEEPALIVES_IDLE = int(st.secrets.get("DB_KEEPALIVES_IDLE", 30))
+DB_KEEPALIVES_INTERVAL = int(st.secrets.get("DB_KEEPALIVES_INTERVAL", 10))
+DB_KEEPALIVES_COUNT = int(st.secrets.get("DB_KEEPALIVES_COUNT", 5))
+
+_pool_stats_lock = threading.Lock()
+_pool_esperas = deque(maxlen=500)   # segundos esperando conexión (últimos checkouts)
+_pool_conexiones = deque()          # instantes (monotonic) de conexiones nuevas a la BD
+_pool_timeouts = 0
+_pool_pings_fallidos = 0
+
+class PoolMedido(QueuePool):
+    """QueuePool que registra cuánto espera cada checkout y cuántos agotan el timeout."""
+
+    def _do_get(self):
+        global _pool_timeouts
+        inicio = time.monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with _pool_stats_lock:
+                _pool_timeouts += 1
+            raise
+        finally:
+            with _pool_stats_lock:
+                _pool_esperas.append(time.monotonic() - inicio)
+
+# application_name único por proceso: los avisos de cambios lo traen (migración 9) y así el
+# proceso reconoce los que vienen de sus propias escrituras
+PROCESO_ID = f"mylocaldata-{uuid.uuid4().hex[:12]}"
+
+_connect_args = {
+    "application_name": PROCESO_ID,
+    "keepalives": 1,
+    "keepalives_idle": DB_KEEPALIVES_IDLE,
+    "keepalives_interval": DB_KEEPALIVES_INTERVAL,
+    "keepalives_count": DB_KEEPALIVES_COUNT,
+}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    _connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
 
 # Crear el motor de conexión (pool nativo de SQLAlchemy)
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=PoolMedido,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=(DB_PRE_PING == "siempre"),
+    connect_args=_connect_args,
+)
+
+@event.listens_for(engine, "connect")
+def _al_conectar(dbapi_conn, registro):
+    with _pool_stats_lock:
+        _pool_conexiones.append(time.monotonic())
+
+@event.listens_for(engine, "checkin")
+def _al_devolver(dbapi_conn, registro):
+    registro.info["devuelta_en"] = time.monotonic()
+
+@event.listens_for(engine, "checkout")
+def _al_tomar(dbapi_conn, registro, proxy):
+    # Pre-ping "inactivas": solo se paga el round trip si la conexión estuvo ociosa un buen rato
+    global _pool_pings_fallidos
+    if DB_PRE_PING != "inactivas":
+        return
+    devuelta = registro.info.get("devuelta_en")
+    if devuelta is None or time.monotonic() - devuelta < DB_PRE_PING_INACTIVA_SEG:
+        return
+    try:
+        cur = dbapi_conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+    except Exception:
+        with _pool_stats_lock:
+            _pool_pings_fallidos += 1
+        # El pool descarta esta conexión y reintenta con una nueva
+        raise DisconnectionError("conexión inactiva caída")
+
+# Hooks de instrumentación: duración/filas por sentencia y log rotativo de consultas lentas
+SQL_LENTO_MS = float(st.secrets.get("SQL_LENTO_MS", 500))
+SQL_LENTO_LOG = st.secrets.get("SQL_LENTO_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "sql_lento.log"))
+instrumentar(engine, umbral_lento_ms=SQL_LENTO_MS, ruta_log=SQL_LENTO_LOG)
+
+def estadisticas_pool():
+    """
+    Estado del pool para el panel admin: conexiones en uso, overflow, espera por
+    conexión (promedio/máx de los últimos checkouts) y conexiones nuevas por minuto.
+    """
+    pool = engine.pool
+    ahora = time.monotonic()
+    with _pool_stats_lock:
+        while _pool_conexiones and ahora - _pool_conexiones[0] > 60:
+            _pool_conexiones.popleft()
+        esperas = list(_pool_esperas)
+        conexiones_minuto = len(_pool_conexiones)
+        timeouts, pings_fallidos = _pool_timeouts, _pool_pings_fallidos
+    return {
+        "tamano": pool.size(),
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "espera_promedio_ms": round(1000 * sum(esperas) / len(esperas), 2) if esperas else 0.0,
+        "espera_max_ms": round(1000 * max(esperas), 2) if esperas else 0.0,
+        "conexiones_por_minuto": conexiones_minuto,
+        "timeouts": timeouts,
+        "pings_fallidos": pings_fallidos,
+        "pre_ping": DB_PRE_PING,
+    }
+
+# Filas por página en las consultas paginadas (keyset por id)
+PAGINA_CLIENTES = 500
 
 # --------------------------
-# Funciones auxiliares
+# Caché de clientes compartida por todas las sesiones del proceso
 # --------------------------
-def crear_tabla():
-    with engine.begin() as conn:
-        # Tabla principal clientes (agregada columna direccion)
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS clientes (
-                id SERIAL PRIMARY KEY,
-                nombre TEXT,
-                nit TEXT,
-                contacto TEXT,
-                telefono TEXT,
-                email TEXT,
-                ciudad TEXT,
-                direccion TEXT,
-                fecha_contacto DATE,
-                observacion TEXT,
-                contactado BOOLEAN DEFAULT FALSE,
-                username TEXT,
-                base_name TEXT,
-                tipo_operacion TEXT,
-                modalidad TEXT,
-                origen TEXT,
-                destino TEXT,
-                mercancia TEXT
-            );
-        """))
+# Límite de memoria de la caché (MB); al superarlo se descartan las entradas menos usadas (LRU)
+CACHE_CLIENTES_MAX_MB = int(st.secrets.get("CACHE_CLIENTES_MAX_MB", 256))
 
-        # Asegurar columnas existentes en caso de migración
-        conn.execute(text("ALTER TABLE clientes ADD COLUMN IF NOT EXISTS base_name TEXT;"))
+_cache_lock = threading.RLock()
+_cache_clientes = OrderedDict()  # clave -> (base_name, version, valor, bytes)
+_cache_bytes = 0
+# Versión por base (base_name interno); cada escritura sobre la base la incrementa
+_versiones_base = {}
+# Versión global: invalida las vistas sin base concreta (admin "Todas", filtro por username)
+_version_global = 0
 
-        # Índices para búsqueda rápida
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_username ON clientes(username);"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_base_name ON clientes(base_name);"))
+def _version_de(base_name):
+    if base_name is None:
+        return _version_global
+    return _versiones_base.get(base_name, 0)
 
-        # Normalizar base_name faltante a TRANSLOGISTIC
-        conn.execute(text("UPDATE clientes SET base_name = 'TRANSLOGISTIC' WHERE base_name IS NULL;"))
+def _tamano_valor(valor):
+    # Estima la memoria de un valor cacheado (DataFrame o tupla con DataFrames)
+    partes = valor if isinstance(valor, tuple) else (valor,)
+    total = 0
+    for p in partes:
+        if isinstance(p, pd.DataFrame):
+            total += int(p.memory_usage(index=True, deep=True).sum())
+    return total
 
-        # Tabla para persistir el nombre mostrado de la base privada por usuario
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                display_base_name TEXT
-            );
-        """))
+def _cache_leer(clave, base_name, cargar):
+    """
+    Retorna el valor cacheado para clave si sigue vigente para la versión actual de base_name.
+    Si no existe o quedó obsoleto, lo calcula con cargar() y lo guarda.
+    Los valores cacheados se comparten entre sesiones: no deben modificarse in-place.
+    """
+    global _cache_bytes
+    with _cache_lock:
+        version = _version_de(base_name)
+        entrada = _cache_clientes.get(clave)
+        if entrada is not None and entrada[1] == version:
+            _cache_clientes.move_to_end(clave)
+            return entrada[2]
 
-        # Tabla para historial de contactos por cliente
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS contactos (
-                id SERIAL PRIMARY KEY,
-                cliente_id INTEGER REFERENCES clientes(id) ON DELETE CASCADE,
-                fecha DATE,
-                tipo TEXT,
-                notas TEXT DEFAULT ''
-            );
-        """))
+    # Leer fuera del lock para no serializar las consultas de todas las sesiones
+    valor = cargar()
+    tamano = _tamano_valor(valor)
+    limite = CACHE_CLIENTES_MAX_MB * 1024 * 1024
 
-        # Tabla para agenda de visitas/recordatorios (sin notificaciones externas)
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS visitas (
-                id SERIAL PRIMARY KEY,
-                cliente_id INTEGER REFERENCES clientes(id) ON DELETE CASCADE,
-                fecha DATE,
-                medio TEXT,
-                creado_por TEXT,
-                creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """))
+    with _cache_lock:
+        # Si hubo una escritura mientras leíamos, la versión ya cambió: no guardamos datos viejos
+        if version != _version_de(base_name) or tamano > limite:
+            return valor
+        anterior = _cache_clientes.pop(clave, None)
+        if anterior is not None:
+            _cache_bytes -= anterior[3]
+        _cache_clientes[clave] = (base_name, version, valor, tamano)
+        _cache_bytes += tamano
+        while _cache_bytes > limite and _cache_clientes:
+            _, descartada = _cache_clientes.popitem(last=False)
+            _cache_bytes -= descartada[3]
+    return valor
+
+def invalidar_bases(*bases):
+    """
+    Marca como obsoletas las entradas cacheadas de las bases indicadas (y las vistas
+    sin base concreta, que incluyen a todas). Las demás bases conservan su caché.
+    """
+    global _cache_bytes, _version_global
+    bases = {b for b in bases if b}
+    with _cache_lock:
+        _version_global += 1
+        for b in bases:
+            _versiones_base[b] = _versiones_base.get(b, 0) + 1
+        for clave in [k for k, e in _cache_clientes.items() if e[0] is None or e[0] in bases]:
+            _cache_bytes -= _cache_clientes.pop(clave)[3]
+
+# Entradas cuyo valor son páginas de clientes por id que se pueden parchar fila a fila
+_TIPOS_PARCHABLES = {"clientes", "pagina", "vista"}
+
+def _parchar_frame(df, filas, eliminados, coincide, desde=None, hasta=None):
+    """
+    Retorna una copia de df con las filas cambiadas aplicadas dentro del rango de ids
+    (desde, hasta] que cubre la página: se quitan las eliminadas y las que ya no cumplen el
+    filtro (coincide), y se agregan/reemplazan las que sí, manteniendo el orden por id.
+    """
+    if df is None or "id" not in df.columns:
+        return df
+    tocados = set(eliminados) | {f["id"] for f in filas}
+    en_rango = [f for f in filas if coincide(f)
+                and (desde is None or f["id"] > desde) and (hasta is None or f["id"] <= hasta)]
+    quedan = df[~df["id"].isin(tocados)]
+    if not en_rango:
+        return quedan.reset_index(drop=True) if len(quedan) != len(df) else df
+    nuevas = pd.DataFrame(en_rango).reindex(columns=df.columns)
+    for columna, tipo in df.dtypes.items():
+        try:
+            nuevas[columna] = nuevas[columna].astype(tipo)
+        except (TypeError, ValueError):
+            pass
+    partes = [p for p in (quedan, nuevas) if not p.empty]
+    return pd.concat(partes, ignore_index=True).sort_values("id", kind="stable").reset_index(drop=True)
+
+def _parchar_entrada(clave, valor, filas, eliminados):
+    # clave: ("clientes"|"pagina"|"vista", base_name, username, ...) (ver las lecturas más abajo)
+    tipo, base, username = clave[0], clave[1], clave[2]
+
+    def _coincide(contactado):
+        return lambda f: ((base is None or f.get("base_name") == base)
+                          and (username is None or f.get("username") == username)
+                          and (contactado is None or bool(f.get("contactado")) == contactado))
+
+    if tipo == "clientes":
+        return _parchar_frame(valor, filas, eliminados, _coincide(clave[3]))
+    if tipo == "pagina":
+        df, cursor = valor
+        return _parchar_frame(df, filas, eliminados, _coincide(clave[3]), clave[4], cursor), cursor
+    # "vista": primera página de cada tab (o la base completa si limite es None)
+    df_no, df_si, cursor_no, cursor_si = valor
+    return (_parchar_frame(df_no, filas, eliminados, _coincide(False), None, cursor_no),
+            _parchar_frame(df_si, filas, eliminados, _coincide(True), None, cursor_si),
+            cursor_no, cursor_si)
+
+def aplicar_cambios_cache(filas=(), eliminados=(), bases=()):
+    """
+    Alternativa a invalidar_bases tras una escritura que retorna sus filas (RETURNING *):
+    las páginas cacheadas de las bases afectadas (tabs, "Cargar más", base completa) se
+    reemplazan por copias parchadas con las filas nuevas/cambiadas/eliminadas, incluido el
+    paso de un tab a otro cuando cambia contactado. El resto de entradas de esas bases
+    (búsquedas, selector, catálogo) se descarta como en invalidar_bases.
+    """
+    global _cache_bytes, _version_global
+    filas = [dict(f) for f in filas]
+    eliminados = [int(i) for i in eliminados]
+    bases = {b for b in bases if b} | {f.get("base_name") for f in filas if f.get("base_name")}
+    with _cache_lock:
+        _version_global += 1
+        for b in bases:
+            _versiones_base[b] = _versiones_base.get(b, 0) + 1
+        for clave in [k for k, e in _cache_clientes.items() if e[0] is None or e[0] in bases]:
+            base_name, _, valor, tamano = _cache_clientes.pop(clave)
+            _cache_bytes -= tamano
+            if clave[0] not in _TIPOS_PARCHABLES:
+                continue
+            try:
+                nuevo = _parchar_entrada(clave, valor, filas, eliminados)
+            except Exception as e:
+                _log.warning("no se pudo parchar la caché %s (%s)", clave[:2], e)
+                continue
+            tamano = _tamano_valor(nuevo)
+            _cache_clientes[clave] = (base_name, _version_de(base_name), nuevo, tamano)
+            _cache_bytes += tamano
+
+def estadisticas_cache():
+    # Resumen para diagnóstico: número de entradas y memoria usada
+    with _cache_lock:
+        return {"entradas": len(_cache_clientes), "bytes": _cache_bytes,
+                "limite_bytes": CACHE_CLIENTES_MAX_MB * 1024 * 1024}
+
+# --------------------------
+# Índices de búsqueda en memoria por base (ver busqueda.py)
+# --------------------------
+# Bases con más filas que esto se buscan siempre en la BD (el índice no se construye)
+INDICE_BUSQUEDA_MAX_FILAS = int(st.secrets.get("INDICE_BUSQUEDA_MAX_FILAS", 200000))
+# Cuántas bases indexadas se mantienen a la vez (LRU)
+INDICE_BUSQUEDA_MAX_BASES = int(st.secrets.get("INDICE_BUSQUEDA_MAX_BASES", 8))
+
+_indices_lock = threading.Lock()
+_indices_busqueda = OrderedDict()   # base_name -> IndiceNgramas
+_indices_construyendo = set()       # bases con un hilo construyendo su índice
+
+def _construir_indice(base_name):
+    # Corre en un hilo aparte: lee la base completa y registra el índice si nadie escribió mientras tanto
+    try:
+        with _cache_lock:
+            version = _version_de(base_name)
+        df = pd.read_sql(text("SELECT * FROM clientes WHERE base_name = :b ORDER BY id"),
+                         engine, params={"b": base_name})
+        indice = IndiceNgramas(df)
+        with _indices_lock:
+            with _cache_lock:
+                vigente = version == _version_de(base_name)
+            if vigente:
+                _indices_busqueda[base_name] = indice
+                _indices_busqueda.move_to_end(base_name)
+                while len(_indices_busqueda) > INDICE_BUSQUEDA_MAX_BASES:
+                    _indices_busqueda.popitem(last=False)
+    except Exception as e:
+        # Sin índice las búsquedas van a la BD; la próxima búsqueda de la base lo intenta de nuevo
+        _log.warning("no se pudo construir el índice de búsqueda de %s (%s)", base_name, e)
+    finally:
+        with _indices_lock:
+            _indices_construyendo.discard(base_name)
+
+def indice_busqueda(base_name, construir=True):
+    """
+    Retorna el índice en memoria de base_name si ya está listo; si no, retorna None y
+    (con construir=True) lo construye en segundo plano para las próximas búsquedas.
+    Las bases más grandes que INDICE_BUSQUEDA_MAX_FILAS nunca se indexan.
+    """
+    if not base_name:
+        return None
+    with _indices_lock:
+        indice = _indices_busqueda.get(base_name)
+        if indice is not None:
+            _indices_busqueda.move_to_end(base_name)
+            return indice
+        if not construir or base_name in _indices_construyendo:
+            return None
+
+    bases = obtener_bases()
+    fila = bases[bases["base_name"] == base_name] if not bases.empty else bases
+    if fila.empty or int(fila["total_clientes"].iloc[0]) > INDICE_BUSQUEDA_MAX_FILAS:
+        return None
+    with _indices_lock:
+        if base_name in _indices_construyendo or base_name in _indices_busqueda:
+            return _indices_busqueda.get(base_name)
+        _indices_construyendo.add(base_name)
+    threading.Thread(target=_construir_indice, args=(base_name,), daemon=True).start()
+    return None
+
+def _indices_aplicar(filas=(), eliminados=()):
+    """
+    Mantiene los índices al día tras una escritura (llamar DESPUÉS de invalidar_bases).
+    filas: dicts completos (RETURNING *) de clientes insertados/actualizados; cada fila entra
+    al índice de su base y sale de los demás (cambio de base). eliminados: ids borrados.
+    """
+    filas = [dict(f) for f in filas]
+    eliminados = list(eliminados)
+    if not filas and not eliminados:
+        return
+    with _indices_lock:
+        for base_name, indice in _indices_busqueda.items():
+            propias = [f for f in filas if f.get("base_name") == base_name]
+            ajenas = [f["id"] for f in filas if f.get("base_name") != base_name]
+            indice.aplicar(filas=propias, eliminados=eliminados + ajenas)
+
+def descartar_indices_busqueda(*bases):
+    # Olvida los índices de las bases (p. ej. tras una importación masiva); se reconstruyen al buscar
+    with _indices_lock:
+        for b in bases:
+            _indices_busqueda.pop(b, None)
+
+# --------------------------
+# Réplica local de solo lectura (SQLite, ver replica.py)
+# --------------------------
+# Apagada por defecto: con REPLICA_ACTIVA = true en secrets las lecturas de clientes, contactos
+# y visitas se sirven desde un archivo local mientras la réplica no tenga más de
+# REPLICA_MAX_RETRASO_SEG de atraso; si lo supera (o falla la sincronización) se lee de Postgres.
+REPLICA_ACTIVA = bool(st.secrets.get("REPLICA_ACTIVA", False))
+REPLICA_RUTA = st.secrets.get("REPLICA_RUTA", None)
+REPLICA_INTERVALO_SEG = float(st.secrets.get("REPLICA_INTERVALO_SEG", 5))
+REPLICA_MAX_RETRASO_SEG = float(st.secrets.get("REPLICA_MAX_RETRASO_SEG", 30))
+# Horas que se conserva cambios_replica; una réplica apagada más tiempo se copia de nuevo completa
+REPLICA_RETENCION_HORAS = int(st.secrets.get("REPLICA_RETENCION_HORAS", 24))
+
+_replica = None
+
+def _replica_vigente():
+    # La réplica solo responde si su última sincronización está dentro del atraso permitido
+    r = _replica
+    return r if r is not None and r.vigente(REPLICA_MAX_RETRASO_SEG) else None
+
+def _replica_aplicar(tabla, filas=(), eliminados=()):
+    # Write-through: llamar tras el commit en Postgres con las filas de RETURNING *
+    if _replica is not None:
+        _replica.aplicar(tabla, filas=filas, eliminados=eliminados)
+
+def _al_cambiar_replica(cambios):
+    # Cambios hechos por otros procesos que trajo la sincronización: invalidar lo que los cachea
+    aplicar_cambios_cache(filas=cambios["clientes"], eliminados=cambios["clientes_eliminados"],
+                          bases=cambios["bases"])
+    invalidar_detalle(*cambios["clientes_eliminados"], *[f["id"] for f in cambios["clientes"]],
+                      *cambios["historial"])
+    _indices_aplicar(filas=cambios["clientes"], eliminados=cambios["clientes_eliminados"])
+    with _usuarios_lock:
+        for username in cambios["users"]:
+            _usuarios_cache.pop(username, None)
+
+def _leer_df(tabla, sql, params):
+    # Lectura con la réplica si está vigente (sql debe ser válido en Postgres y en SQLite)
+    replica = _replica_vigente()
+    if replica is not None:
+        return replica.leer(tabla, sql, params)
+    return pd.read_sql(text(sql), engine, params=params)
+
+def estadisticas_replica():
+    if _replica is None:
+        return {"activa": False}
+    return {"activa": True, "vigente": _replica_vigente() is not None, **_replica.estadisticas()}
+
+# --------------------------
+# Refresco incremental de las cachés (cambios de otros procesos, sin réplica)
+# --------------------------
+# Cada refresco pide a la BD solo las filas tocadas desde la última marca (cambios_replica, ver
+# la migración 7) y las parcha en la caché, en vez de recargar bases completas. La marca es un
+# txid, no una fecha: no depende de los relojes ni pierde transacciones que confirman tarde.
+# Entre dos refrescos pasan al menos DELTA_INTERVALO_SEG (los reruns intermedios no van a la BD).
+DELTA_INTERVALO_SEG = float(st.secrets.get("DELTA_INTERVALO_SEG", 5))
+
+_delta_lock = threading.Lock()
+_delta_marca = None    # txid desde el que hay cambios sin aplicar a las cachés
+_delta_ultima = 0.0    # time.time() del último refresco
+_delta_fallando = False  # el último refresco falló (solo se avisa el primero)
+# Sin réplica, el registro de cambios se poda desde aquí (como en ReplicaLocal._bucle)
+PODA_CAMBIOS_INTERVALO_SEG = 3600
+_poda_lock = threading.Lock()
+_poda_ultima = None    # time.monotonic() de la última poda
+
+def marca_cambios():
+    """Marca de agua actual para cambios_desde."""
+    with engine.connect() as conn:
+        return marca_actual(conn)
+
+def cambios_desde(marca, tablas=tuple(TABLAS_REPLICA)):
+    """
+    Filas de `tablas` insertadas, modificadas o eliminadas desde `marca` (de marca_cambios).
+    Retorna (cambios, nueva_marca), con cambios = {tabla: (filas, claves_eliminadas)}; las
+    filas son dicts con todas las columnas. Una fila puede repetirse en dos llamadas seguidas.
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            nueva = marca_actual(conn)
+            return leer_cambios(conn, marca, tablas), nueva
+
+def _bases_cacheadas_con(ids):
+    # Bases cuyas páginas cacheadas tienen alguno de los ids (filas borradas o que cambiaron de base)
+    ids = list(ids)
+    bases = set()
+    with _cache_lock:
+        for clave, (base_name, _, valor, _) in _cache_clientes.items():
+            if base_name is None or base_name in bases or clave[0] not in _TIPOS_PARCHABLES:
+                continue
+            partes = valor if isinstance(valor, tuple) else (valor,)
+            if any(isinstance(p, pd.DataFrame) and "id" in p.columns and p["id"].isin(ids).any()
+                   for p in partes):
+                bases.add(base_name)
+    return bases
+
+def _detalles_con(tabla, ids):
+    # Clientes cuyo detalle cacheado incluye alguno de los contactos/visitas borrados
+    posicion = 1 if tabla == "contactos" else 2
+    ids = list(ids)
+    with _detalle_lock:
+        return [k for k, (_, detalle) in _detalle_cache.items()
+                if "id" in detalle[posicion].columns and detalle[posicion]["id"].isin(ids).any()]
+
+def _invalidar_todo():
+    # Tras perder el hilo del registro (marca nueva o más vieja que la retención)
+    with _cache_lock:
+        bases = {e[0] for e in _cache_clientes.values()}
+    invalidar_bases(*bases)
+    with _detalle_lock:
+        ids = list(_detalle_cache)
+    invalidar_detalle(*ids)
+    with _indices_lock:
+        _indices_busqueda.clear()
+    with _usuarios_lock:
+        _usuarios_cache.clear()
+
+def _aplicar_delta(cambios):
+    filas, eliminados = cambios.get("clientes", ([], []))
+    ids = [f["id"] for f in filas] + list(eliminados)
+    if ids:
+        aplicar_cambios_cache(filas=filas, eliminados=eliminados, bases=_bases_cacheadas_con(ids))
+        _indices_aplicar(filas=filas, eliminados=eliminados)
+    historial = set(ids)
+    for tabla in ("contactos", "visitas"):
+        vivas, borradas = cambios.get(tabla, ([], []))
+        historial |= {f["cliente_id"] for f in vivas}
+        if borradas:
+            historial |= set(_detalles_con(tabla, borradas))
+    if historial:
+        invalidar_detalle(*historial)
+    vivas, borradas = cambios.get("users", ([], []))
+    with _usuarios_lock:
+        for username in [f["username"] for f in vivas] + list(borradas):
+            _usuarios_cache.pop(username, None)
+
+def _podar():
+    try:
+        podar_cambios(engine, REPLICA_RETENCION_HORAS)
+    except Exception as e:
+        _log.warning("no se pudo podar cambios_replica (%s)", e)
+    finally:
+        _poda_lock.release()
+
+def _podar_si_toca():
+    # A lo sumo una poda por hora y en segundo plano (el rerun que la dispara no la espera)
+    global _poda_ultima
+    if _poda_ultima is not None and time.monotonic() - _poda_ultima < PODA_CAMBIOS_INTERVALO_SEG:
+        return
+    if not _poda_lock.acquire(blocking=False):
+        return
+    _poda_ultima = time.monotonic()
+    threading.Thread(target=_podar, name="poda-cambios", daemon=True).start()
+
+def refrescar_cambios(forzar=False):
+    """
+    Aplica a las cachés del proceso (páginas de clientes, detalle, índices de búsqueda y
+    perfiles) lo que otros procesos escribieron desde el último refresco. Llamar al inicio de
+    cada rerun: sin forzar, solo consulta la BD si pasaron DELTA_INTERVALO_SEG y no hay una
+    escucha de avisos conectada (que ya refresca al llegar cada aviso). Con la réplica activa
+    no hace nada (su sincronización ya lo hace). Retorna las filas aplicadas, o None si no se
+    pudo consultar el registro de cambios.
+    """
+    global _delta_marca, _delta_ultima, _delta_fallando
+    if _replica is not None:
+        return 0
+    _podar_si_toca()
+    if not forzar and ((_escucha is not None and _escucha.conectada())
+                       or time.time() - _delta_ultima < DELTA_INTERVALO_SEG):
+        return 0
+    # Sin forzar, si otra sesión ya está refrescando no hace falta esperarla
+    if not _delta_lock.acquire(blocking=forzar):
+        return 0
+    try:
+        ahora = time.time()
+        if _delta_marca is None or ahora - _delta_ultima > REPLICA_RETENCION_HORAS * 3600 * 0.9:
+            # El registro pudo podarse: no se sabe qué cambió y todo lo cacheado es sospechoso
+            _delta_marca, _delta_ultima = marca_cambios(), ahora
+            _invalidar_todo()
+            return 0
+        cambios, nueva = cambios_desde(_delta_marca)
+        _aplicar_delta(cambios)
+        _delta_marca, _delta_ultima = nueva, ahora
+        if _delta_fallando:
+            _delta_fallando = False
+            _log.info("cambios recientes leídos de nuevo")
+        return sum(len(filas) + len(eliminadas) for filas, eliminadas in cambios.values())
+    except Exception as e:
+        # Cada rerun reintenta: con la BD caída solo se avisa el primer fallo
+        _log.log(logging.DEBUG if _delta_fallando else logging.WARNING,
+                 "no se pudieron leer los cambios recientes (%s)", e)
+        _delta_fallando = True
+        return None
+    finally:
+        _delta_lock.release()
+
+# --------------------------
+# Avisos de cambios de otros procesos (LISTEN/NOTIFY, ver notificaciones.py)
+# --------------------------
+# Un hilo por proceso recibe un aviso por cada sentencia que escribe en las tablas y pone al día
+# las cachés en ese momento: las sesiones ven lo que escribió otro vendedor en su próximo
+# rerun sin recargar la base ni consultar la BD en cada rerun.
+NOTIFICACIONES_ACTIVAS = bool(st.secrets.get("NOTIFICACIONES_ACTIVAS", True))
+
+_escucha = None
+
+def _invalidar_por_avisos(avisos):
+    # Sin registro de cambios legible: invalidar solo lo que nombra cada aviso
+    bases, clientes, todo_detalle = set(), set(), False
+    for aviso in avisos:
+        tabla, claves = aviso.get("tabla"), aviso.get("claves")
+        if tabla == "users":
+            with _usuarios_lock:
+                for username in claves if claves is not None else list(_usuarios_cache):
+                    _usuarios_cache.pop(username, None)
+            continue
+        if tabla not in ("clientes", "contactos", "visitas") or (tabla == "clientes" and aviso.get("bases") is None):
+            _invalidar_todo()
+            return
+        if tabla == "clientes":
+            bases |= set(aviso["bases"])
+        if claves is None:
+            todo_detalle = True
+        else:
+            clientes |= set(claves)
+    if bases:
+        invalidar_bases(*bases)
+        descartar_indices_busqueda(*bases)
+    if todo_detalle:
+        with _detalle_lock:
+            clientes |= set(_detalle_cache)
+    invalidar_detalle(*clientes, bases=bases)
+
+def _al_notificar(avisos):
+    # avisos=None: la escucha se (re)conectó y pudo perder avisos; se recupera con el delta
+    if avisos is not None:
+        # Lo que escribió este proceso ya está aplicado a sus cachés desde la escritura
+        avisos = [a for a in avisos if a.get("proceso") != PROCESO_ID]
+        if not avisos:
+            return
+    if _replica is not None:
+        _replica.despertar()
+        return
+    if refrescar_cambios(forzar=True) is None and avisos is not None:
+        _invalidar_por_avisos(avisos)
+
+def estadisticas_notificaciones():
+    if _escucha is None:
+        return {"activa": False}
+    return {"activa": True, **_escucha.estadisticas()}
+
+# --------------------------
+# Funciones auxiliares
+# --------------------------
+_migracion_lock = threading.Lock()
+_migracion_hecha = False
+
+def crear_tabla():
+    """
+    Deja el esquema al día (ver migraciones.py). Solo la primera llamada del proceso va a
+    la BD; las siguientes (una por cada rerun de Streamlit) retornan de inmediato.
+    También arranca la réplica local si está activa (necesita la migración 7) o, si no, toma
+    la primera marca de refrescar_cambios, y la escucha de avisos de cambios (migración 8).
+    """
+    global _migracion_hecha, _replica, _escucha
+    if _migracion_hecha:
+        return
+    with _migracion_lock:
+        if not _migracion_hecha:
+            aplicar_migraciones(engine)
+            if REPLICA_ACTIVA:
+                _replica = ReplicaLocal(engine, ruta=REPLICA_RUTA, intervalo_seg=REPLICA_INTERVALO_SEG,
+                                        retencion_horas=REPLICA_RETENCION_HORAS,
+                                        al_cambiar=_al_cambiar_replica).iniciar()
+            else:
+                # Primera marca del refresco incremental (y primera poda del registro de cambios)
+                refrescar_cambios(forzar=True)
+            if NOTIFICACIONES_ACTIVAS:
+                _escucha = EscuchaCambios(engine, _al_notificar).iniciar()
+            _migracion_hecha = True
+
+def _base_interna(base_name, username):
+    # Normalizar base_name privada para evitar colisiones:
+    # Si base_name no es TRANSLOGISTIC y parece ser un display name, lo guardamos como "{username}__{display}" internamente.
+    if base_name and base_name != "TRANSLOGISTIC" and username:
+        # Si el usuario paso un display name (sin prefijo), lo convertimos
+        if "__" not in base_name:
+            return f"{username}__{base_name}"
+    return base_name
 
 def agregar_cliente(datos):
     import streamlit as st
@@ -95,7 +708,8 @@ def agregar_cliente(datos):
 
     # Defaults y saneamiento
     datos2.setdefault("contactado", False)
-    datos2.setdefault("base_name", "TRANSLOGISTIC")
+    # Un base_name None explícito no usa el DEFAULT de la columna: se normaliza aquí
+    datos2["base_name"] = datos2.get("base_name") or "TRANSLOGISTIC"
 
     # Si contactado == False, no se guarda fecha_contacto (lógico)
     fc = datos2.get("fecha_contacto")
@@ -117,16 +731,11 @@ def agregar_cliente(datos):
     for k in ("nombre","nit","contacto","telefono","email","ciudad","direccion","observacion","username","base_name"):
         datos2.setdefault(k, None)
 
-    # Normalizar base_name privada para evitar colisiones:
-    # Si base_name no es TRANSLOGISTIC y parece ser un display name, lo guardamos como "{username}__{display}" internamente.
-    if datos2["base_name"] and datos2["base_name"] != "TRANSLOGISTIC" and datos2.get("username"):
-        # Si el usuario paso un display name (sin prefijo), lo convertimos
-        if "__" not in datos2["base_name"]:
-            datos2["base_name"] = f"{datos2['username']}__{datos2['base_name']}"
+    datos2["base_name"] = _base_interna(datos2["base_name"], datos2.get("username"))
 
     try:
         with engine.begin() as conn:
-            conn.execute(text("""
+            fila = conn.execute(text("""
                 INSERT INTO clientes (
                     nombre, nit, contacto, telefono, email, ciudad, direccion,
                     fecha_contacto, observacion, contactado, username, base_name
@@ -134,13 +743,22 @@ def agregar_cliente(datos):
                     :nombre, :nit, :contacto, :telefono, :email, :ciudad, :direccion,
                     :fecha_contacto, :observacion, :contactado, :username, :base_name
                 )
-            """), datos2)
+                RETURNING *
+            """), datos2).mappings().fetchone()
     except Exception as e:
         st.error(f"Error al insertar cliente en la base de datos: {e}")
         raise
+    aplicar_cambios_cache(filas=[fila])
+    _indices_aplicar(filas=[fila])
+    _replica_aplicar("clientes", filas=[fila])
+    return dict(fila)
 
-def obtener_clientes(contactado=None, username=None, is_admin=False, base_name=None):
-    sql = "SELECT * FROM clientes"
+def _filtros_clientes(contactado=None, username=None, is_admin=False, base_name=None):
+    """
+    Construye las cláusulas WHERE y los parámetros comunes a las consultas de clientes.
+    Con base_name filtra por esa base; sin ella, un usuario ve su base privada y un admin con
+    username ve los clientes de ese usuario en todas las bases. Retorna (clauses, params).
+    """
     clauses = []
     params = {}
 
@@ -168,20 +786,346 @@ def obtener_clientes(contactado=None, username=None, is_admin=False, base_name=N
             except Exception:
                 clauses.append("username = :username")
                 params["username"] = username
+        elif username:
+            # Admin filtrando por usuario: todos los clientes de ese usuario, en cualquier base
+            clauses.append("username = :username")
+            params["username"] = username
+
+    return clauses, params
+
+def obtener_clientes(contactado=None, username=None, is_admin=False, base_name=None):
+    sql = "SELECT * FROM clientes"
+    clauses, params = _filtros_clientes(contactado, username, is_admin, base_name)
 
     if clauses:
         sql += " WHERE " + " AND ".join(clauses)
+    # Mismo orden que las páginas parchadas de la caché (ver _parchar_frame)
+    sql += " ORDER BY id"
 
+    base = params.get("base_name")
+    clave = ("clientes", base, params.get("username"), contactado)
     try:
-        df = pd.read_sql(text(sql), engine, params=params)
+        df = _cache_leer(clave, base, lambda: _leer_df("clientes", sql, params))
     except Exception as e:
         st.error(f"Error al leer la base de datos: {e}")
         return pd.DataFrame()
     return df
 
+def obtener_clientes_pagina(contactado=None, username=None, is_admin=False, base_name=None,
+                            despues_de_id=None, limite=PAGINA_CLIENTES):
+    """
+    Retorna (DataFrame, cursor) con una página de clientes ordenada por id (keyset).
+    - despues_de_id: cursor devuelto por la página anterior (None = primera página).
+    - cursor: id de la última fila de la página, o None si ya no hay más filas.
+    El orden por id es estable aunque se inserten clientes nuevos mientras se pagina.
+    """
+    sql = "SELECT * FROM clientes"
+    clauses, params = _filtros_clientes(contactado, username, is_admin, base_name)
+
+    if despues_de_id is not None:
+        clauses.append("id > :despues_de_id")
+        params["despues_de_id"] = int(despues_de_id)
+
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+
+    # Pedimos una fila extra para saber si existe una página siguiente
+    sql += " ORDER BY id LIMIT :limite"
+    params["limite"] = int(limite) + 1
+
+    def _leer():
+        df = _leer_df("clientes", sql, params)
+        cursor = None
+        if len(df) > limite:
+            df = df.iloc[:limite]
+            cursor = int(df["id"].iloc[-1])
+        return df, cursor
+
+    base = params.get("base_name")
+    clave = ("pagina", base, params.get("username"), contactado, params.get("despues_de_id"), int(limite))
+    try:
+        return _cache_leer(clave, base, _leer)
+    except Exception as e:
+        st.error(f"Error al leer la base de datos: {e}")
+        return pd.DataFrame(), None
+
+def leer_clientes_por_bloques(contactado=None, username=None, is_admin=False, base_name=None,
+                              busqueda=None, tamano_bloque=5000):
+    """
+    Genera DataFrames de hasta tamano_bloque clientes (ordenados por id) usando un cursor
+    del lado del servidor: la memoria usada no depende del tamaño de la base.
+    Con `busqueda` genera todas las coincidencias de la búsqueda del tab (mismo WHERE y orden
+    que buscar_clientes, pero sin el tope de la pantalla), también por bloques.
+    """
+    if busqueda and busqueda.strip():
+        for bloque in _consultar_busqueda(busqueda.strip(), tamano_bloque=tamano_bloque, contactado=contactado,
+                                          username=username, is_admin=is_admin, base_name=base_name):
+            yield bloque.drop(columns=["doc", "relevancia"], errors="ignore")
+        return
+
+    sql = "SELECT * FROM clientes"
+    clauses, params = _filtros_clientes(contactado, username, is_admin, base_name)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=tamano_bloque)
+        for bloque in pd.read_sql(text(sql), conn, params=params, chunksize=tamano_bloque):
+            yield bloque
+
+# Campos en los que busca buscar_clientes
+CAMPOS_BUSQUEDA = ("nombre", "nit", "contacto", "ciudad", "email", "telefono")
+# Similitud mínima (0-1) para aceptar coincidencias con errores de tipeo
+UMBRAL_SIMILITUD_BUSQUEDA = 0.4
+
+def _patron_like(texto):
+    # LIKE '%texto%' literal: "%", "_" y la barra invertida del usuario no son comodines
+    return "%" + texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+# Se vuelve True si la BD no tiene la búsqueda por trigramas (la migración 5 es opcional y
+# se reintenta al reiniciar): desde ahí el proceso busca con ILIKE sin probar de nuevo
+_busqueda_sin_trigramas = False
+
+def _falta_trigramas(error):
+    # Solo "no existe la función/operador" (pg_trgm, unaccent o texto_busqueda_cliente): 42883.
+    # pandas envuelve el error del driver en el suyo, por eso se recorre la cadena de causas
+    while error is not None:
+        if getattr(getattr(error, "orig", error), "pgcode", None) == "42883":
+            return True
+        error = error.__cause__
+    return False
+
+def _sql_busqueda(texto, contactado=None, username=None, is_admin=False, base_name=None, limite=None):
+    """
+    Retorna (sql, params) de la búsqueda de buscar_clientes: con pg_trgm, coincidencias tal cual
+    primero y luego por similitud; sin pg_trgm, ILIKE por id. Sin limite trae todas (exportación).
+    """
+    clauses, params = _filtros_clientes(contactado, username, is_admin, base_name)
+    filtros = "".join(f" AND {c}" for c in clauses)
+    params.update({"q": texto, "patron": _patron_like(texto)})
+    tope = ""
+    if limite is not None:
+        tope = " LIMIT :limite"
+        params["limite"] = int(limite)
+    if _busqueda_sin_trigramas:
+        # Sin pg_trgm/unaccent: coincidencia simple, sin tildes ni tolerancia a errores
+        campos = ", ".join(CAMPOS_BUSQUEDA)
+        return f"""
+            SELECT *, 1.0 AS relevancia FROM clientes
+            WHERE concat_ws(' ', {campos}) ILIKE :patron{filtros}
+            ORDER BY id{tope}
+        """, params
+    return f"""
+        SELECT *, word_similarity(lower(f_unaccent(:q)), doc) AS relevancia
+        FROM (
+            SELECT c.*, texto_busqueda_cliente(nombre, nit, contacto, ciudad, email, telefono) AS doc
+            FROM clientes c
+            WHERE (
+                texto_busqueda_cliente(nombre, nit, contacto, ciudad, email, telefono) LIKE lower(f_unaccent(:patron))
+                OR lower(f_unaccent(:q)) <% texto_busqueda_cliente(nombre, nit, contacto, ciudad, email, telefono)
+            ){filtros}
+        ) t
+        ORDER BY (doc LIKE lower(f_unaccent(:patron))) DESC, relevancia DESC, id{tope}
+    """, params
+
+def _consultar_busqueda(texto, limite=None, tamano_bloque=None, **filtros):
+    """
+    Ejecuta _sql_busqueda y genera el resultado: un solo DataFrame, o bloques de tamano_bloque
+    filas leídos con un cursor del lado del servidor. Si falta pg_trgm (y solo en ese caso)
+    marca _busqueda_sin_trigramas y repite con ILIKE; cualquier otro error se propaga.
+    """
+    global _busqueda_sin_trigramas
+    while True:
+        sin_trigramas = _busqueda_sin_trigramas
+        sql, params = _sql_busqueda(texto, limite=limite, **filtros)
+        entregados = False
+        try:
+            with engine.connect() as conn:
+                if tamano_bloque:
+                    conn = conn.execution_options(stream_results=True, max_row_buffer=tamano_bloque)
+                if not sin_trigramas:
+                    # Local a la transacción: no queda en la conexión que vuelve al pool
+                    conn.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :umbral, true)"),
+                                 {"umbral": str(UMBRAL_SIMILITUD_BUSQUEDA)})
+                if not tamano_bloque:
+                    yield pd.read_sql(text(sql), conn, params=params)
+                    return
+                for bloque in pd.read_sql(text(sql), conn, params=params, chunksize=tamano_bloque):
+                    entregados = True
+                    yield bloque
+            return
+        except Exception as e:
+            if sin_trigramas or entregados or not _falta_trigramas(e):
+                raise
+            _log.warning("búsqueda sin pg_trgm/unaccent, se usa ILIKE (%s)", e)
+            _busqueda_sin_trigramas = True
+
+def buscar_clientes(texto, contactado=None, username=None, is_admin=False, base_name=None, limite=50):
+    """
+    Búsqueda del lado del servidor en nombre, NIT, contacto, ciudad, email y teléfono.
+    Ignora mayúsculas y tildes, tolera errores de tipeo (similitud de trigramas) y retorna
+    como máximo `limite` clientes ordenados por relevancia (columna "relevancia").
+    Si la base tiene su índice en memoria (indice_busqueda) responde desde él; si no, usa el
+    índice GIN de trigramas creado por las migraciones y, sin pg_trgm, cae a ILIKE.
+    """
+    texto = (texto or "").strip()
+    if not texto:
+        return pd.DataFrame()
+
+    filtros = {"contactado": contactado, "username": username, "is_admin": is_admin, "base_name": base_name}
+    _, params = _filtros_clientes(**filtros)
+
+    def _leer():
+        resultado, = _consultar_busqueda(texto, limite=limite, **filtros)
+        return resultado.drop(columns=["doc"], errors="ignore")
+
+    base = params.get("base_name")
+    # Si la base ya tiene su índice en memoria se responde sin ir a la BD
+    indice = indice_busqueda(base)
+    if indice is not None:
+        return indice.buscar(texto, contactado=contactado, limite=limite, umbral=UMBRAL_SIMILITUD_BUSQUEDA,
+                             username=params.get("username"))
+
+    clave = ("busqueda", base, params.get("username"), contactado, texto.lower(), int(limite))
+    try:
+        return _cache_leer(clave, base, _leer)
+    except Exception as e:
+        st.error(f"Error buscando clientes: {e}")
+        return pd.DataFrame()
+
+# Opciones como máximo en el selector de clientes de la Vista Detallada
+LIMITE_SELECTOR_CLIENTES = 50
+
+def opciones_selector_clientes(texto=None, username=None, is_admin=False, base_name=None,
+                               limite=LIMITE_SELECTOR_CLIENTES):
+    """
+    Opciones (id, nombre, nit) para el selector de la Vista Detallada, como máximo `limite`.
+    Con texto busca con buscar_clientes (nombre, NIT, ...) por relevancia; sin texto retorna
+    los primeros clientes de la vista por id. Nunca lee la base completa.
+    """
+    texto = (texto or "").strip()
+    if texto:
+        df = buscar_clientes(texto, username=username, is_admin=is_admin, base_name=base_name, limite=limite)
+        return df[["id", "nombre", "nit"]] if not df.empty else pd.DataFrame(columns=["id", "nombre", "nit"])
+
+    sql = "SELECT id, nombre, nit FROM clientes"
+    clauses, params = _filtros_clientes(None, username, is_admin, base_name)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id LIMIT :limite"
+    params["limite"] = int(limite)
+
+    base = params.get("base_name")
+    clave = ("selector", base, params.get("username"), int(limite))
+    try:
+        return _cache_leer(clave, base, lambda: _leer_df("clientes", sql, params))
+    except Exception as e:
+        st.error(f"Error al leer la base de datos: {e}")
+        return pd.DataFrame(columns=["id", "nombre", "nit"])
+
+def resolver_vista(username=None, is_admin=False, filtrar_base=None, filtrar_username=None,
+                   base_seleccionada="TRANSLOGISTIC"):
+    """
+    Resuelve una sola vez qué clientes corresponden a la vista del usuario.
+    Retorna un dict (username, is_admin, base_name) listo para pasar como **kwargs
+    a obtener_clientes / obtener_clientes_pagina / obtener_clientes_vista.
+    """
+    if is_admin:
+        if filtrar_base and filtrar_base != "Todas":
+            return {"username": None, "is_admin": True, "base_name": filtrar_base}
+        if filtrar_username:
+            return {"username": filtrar_username, "is_admin": True, "base_name": None}
+        return {"username": None, "is_admin": True, "base_name": None}
+
+    if not base_seleccionada or base_seleccionada == "TRANSLOGISTIC":
+        return {"username": None, "is_admin": False, "base_name": "TRANSLOGISTIC"}
+    # base_seleccionada es el display de la base privada; convertir a interno (username__display)
+    return {"username": username, "is_admin": False, "base_name": f"{username}__{base_seleccionada}"}
+
+def obtener_clientes_vista(username=None, is_admin=False, base_name=None, limite=PAGINA_CLIENTES):
+    """
+    Lee en UNA sola consulta los clientes de la vista y los separa en memoria en
+    No Contactados / Contactados. Retorna (df_no, df_si, cursor_no, cursor_si).
+    - limite=None: trae la base completa (los cursores quedan en None).
+    - limite=N: trae solo la primera página (keyset por id) de cada tab; los cursores
+      sirven para pedir la siguiente página con obtener_clientes_pagina.
+    """
+    clauses, params = _filtros_clientes(None, username, is_admin, base_name)
+    where = " AND ".join(clauses) if clauses else "TRUE"
+
+    if limite is None:
+        sql = sql_replica = f"SELECT * FROM clientes WHERE {where} AND contactado IS NOT NULL ORDER BY id"
+    else:
+        # Una rama por tab, cada una resuelta con el índice (base_name, contactado, id);
+        # pedimos una fila extra por tab para saber si hay página siguiente
+        sql = (
+            f"(SELECT * FROM clientes WHERE {where} AND contactado = FALSE ORDER BY id LIMIT :limite)"
+            " UNION ALL "
+            f"(SELECT * FROM clientes WHERE {where} AND contactado = TRUE ORDER BY id LIMIT :limite)"
+        )
+        # SQLite no acepta ramas entre paréntesis en un UNION: mismas ramas como subconsultas
+        sql_replica = (
+            f"SELECT * FROM (SELECT * FROM clientes WHERE {where} AND contactado = FALSE ORDER BY id LIMIT :limite)"
+            " UNION ALL "
+            f"SELECT * FROM (SELECT * FROM clientes WHERE {where} AND contactado = TRUE ORDER BY id LIMIT :limite)"
+        )
+        params["limite"] = int(limite) + 1
+
+    def _leer():
+        replica = _replica_vigente()
+        if replica is not None:
+            df = replica.leer("clientes", sql_replica, params)
+        else:
+            df = pd.read_sql(text(sql), engine, params=params)
+        if df.empty:
+            return df, df.copy(), None, None
+
+        es_contactado = df["contactado"].fillna(False).astype(bool)
+        partes = []
+        for mascara in (~es_contactado, es_contactado):
+            parte = df[mascara].reset_index(drop=True)
+            cursor = None
+            if limite is not None and len(parte) > limite:
+                parte = parte.iloc[:limite]
+                cursor = int(parte["id"].iloc[-1])
+            partes.append((parte, cursor))
+
+        (df_no, cursor_no), (df_si, cursor_si) = partes
+        return df_no, df_si, cursor_no, cursor_si
+
+    base = params.get("base_name")
+    clave = ("vista", base, params.get("username"), limite)
+    try:
+        return _cache_leer(clave, base, _leer)
+    except Exception as e:
+        st.error(f"Error al leer la base de datos: {e}")
+        return pd.DataFrame(), pd.DataFrame(), None, None
+
+def obtener_bases():
+    """
+    Retorna DataFrame (base_name, total_clientes, actualizado_en) leído del catálogo de bases,
+    ordenado por nombre. Es una consulta mínima: no toca la tabla clientes.
+    actualizado_en es el último cambio de conteo o la última edición (bases_ediciones), la más reciente.
+    """
+    def _leer():
+        return pd.read_sql(text("""
+            SELECT b.base_name, b.total_clientes,
+                   greatest(b.actualizado_en, (SELECT max(e.editado_en) FROM bases_ediciones e
+                                               WHERE e.base_name = b.base_name)) AS actualizado_en
+            FROM bases b
+            ORDER BY b.base_name
+        """), engine)
+
+    try:
+        return _cache_leer(("bases",), None, _leer)
+    except Exception as e:
+        st.error(f"Error al leer el catálogo de bases: {e}")
+        return pd.DataFrame(columns=["base_name", "total_clientes", "actualizado_en"])
+
 def actualizar_cliente_detalle(cliente_id, datos):
     with engine.begin() as conn:
-        conn.execute(text("""
+        res = conn.execute(text("""
             UPDATE clientes
             SET tipo_operacion=:tipo_operacion,
                 modalidad=:modalidad,
@@ -189,7 +1133,13 @@ def actualizar_cliente_detalle(cliente_id, datos):
                 destino=:destino,
                 mercancia=:mercancia
             WHERE id=:id
-        """), {"id": cliente_id, **datos})
+            RETURNING *
+        """), {"id": cliente_id, **datos}).mappings().fetchone()
+    if res:
+        aplicar_cambios_cache(filas=[res])
+        invalidar_detalle(cliente_id)
+        _indices_aplicar(filas=[res])
+        _replica_aplicar("clientes", filas=[res])
 
 # --- Debe decir (agregar estas funciones nuevas) ---
 def eliminar_cliente(cliente_id):
@@ -204,22 +1154,84 @@ def eliminar_cliente(cliente_id):
         return
 
     with engine.begin() as conn:
-        conn.execute(text("DELETE FROM clientes WHERE id = :id"), {"id": cliente_id})
+        res = conn.execute(text("DELETE FROM clientes WHERE id = :id RETURNING *"), {"id": cliente_id}).mappings().fetchone()
+    if res:
+        aplicar_cambios_cache(eliminados=[cliente_id], bases=[res["base_name"]])
+        invalidar_detalle(cliente_id)
+        _indices_aplicar(eliminados=[cliente_id])
+        _replica_aplicar("clientes", eliminados=[cliente_id])
+        return dict(res)
+    return None
+
+
+def eliminar_clientes(ids):
+    """
+    Elimina en UNA sola sentencia y transacción todos los clientes cuyos ids se indican
+    (los ON DELETE CASCADE de contactos/visitas se resuelven en el mismo DELETE).
+    Retorna la lista de ids realmente eliminados; los que no existían no aparecen.
+    """
+    ids_validos = []
+    for cliente_id in ids or []:
+        try:
+            ids_validos.append(int(cliente_id))
+        except Exception:
+            continue
+    if not ids_validos:
+        return []
+
+    with engine.begin() as conn:
+        filas = conn.execute(
+            text("DELETE FROM clientes WHERE id = ANY(:ids) RETURNING id, base_name"),
+            {"ids": ids_validos}
+        ).fetchall()
+    if filas:
+        aplicar_cambios_cache(eliminados=[f[0] for f in filas], bases={f[1] for f in filas})
+        invalidar_detalle(*[f[0] for f in filas])
+        _indices_aplicar(eliminados=[f[0] for f in filas])
+        _replica_aplicar("clientes", eliminados=[f[0] for f in filas])
+    return [f[0] for f in filas]
+
+
+# --------------------------
+# Perfil de usuario (display de la base privada) con caché en memoria
+# --------------------------
+# Segundos que un display leído de la BD se considera vigente (cubre cambios hechos por otro proceso)
+USUARIOS_CACHE_TTL = int(st.secrets.get("USUARIOS_CACHE_TTL", 300))
 
+_usuarios_lock = threading.Lock()
+_usuarios_cache = {}  # username -> (display_base_name o None, expira_en)
 
 def set_display_base_name(username, display_name):
     # guarda/actualiza en users
     with engine.begin() as conn:
-        conn.execute(text("""
+        fila = conn.execute(text("""
             INSERT INTO users (username, display_base_name)
             VALUES (:username, :display_base_name)
             ON CONFLICT (username) DO UPDATE SET display_base_name = EXCLUDED.display_base_name
-        """), {"username": username, "display_base_name": display_name})
+            RETURNING *
+        """), {"username": username, "display_base_name": display_name}).mappings().fetchone()
+    _replica_aplicar("users", filas=[fila])
+    # Write-through: tras el commit la caché queda con el valor nuevo, sin volver a leerlo
+    with _usuarios_lock:
+        _usuarios_cache[username] = (display_name, time.monotonic() + USUARIOS_CACHE_TTL)
 
 def get_display_base_name(username):
-    with engine.begin() as conn:
+    """
+    Display de la base privada del usuario (None si no tiene). Se resuelve desde la caché
+    mientras no venza el TTL; también se cachea la ausencia de fila para no repetir la consulta.
+    """
+    ahora = time.monotonic()
+    with _usuarios_lock:
+        entrada = _usuarios_cache.get(username)
+        if entrada is not None and entrada[1] > ahora:
+            return entrada[0]
+
+    with engine.connect() as conn:
         res = conn.execute(text("SELECT display_base_name FROM users WHERE username = :username"), {"username": username}).fetchone()
-        return res[0] if res else None
+    display = res[0] if res else None
+    with _usuarios_lock:
+        _usuarios_cache[username] = (display, ahora + USUARIOS_CACHE_TTL)
+    return display
 
 def agendar_visita(cliente_id, fecha, medio, creado_por):
     try:
@@ -233,10 +1245,13 @@ def agendar_visita(cliente_id, fecha, medio, creado_por):
         return
 
     with engine.begin() as conn:
-        conn.execute(text("""
+        fila = conn.execute(text("""
             INSERT INTO visitas (cliente_id, fecha, medio, creado_por)
             VALUES (:cliente_id, :fecha, :medio, :creado_por)
-        """), {"cliente_id": cliente_id, "fecha": fecha, "medio": medio, "creado_por": creado_por})
+            RETURNING *
+        """), {"cliente_id": cliente_id, "fecha": fecha, "medio": medio, "creado_por": creado_por}).mappings().fetchone()
+    invalidar_detalle(cliente_id)
+    _replica_aplicar("visitas", filas=[fila])
 
 def obtener_visitas(cliente_id):
     """
@@ -255,6 +1270,12 @@ def obtener_visitas(cliente_id):
             st.error(f"ID de cliente inválido al leer visitas: {cliente_id}")
             return pd.DataFrame()
 
+        replica = _replica_vigente()
+        if replica is not None:
+            df = replica.leer("visitas", "SELECT * FROM visitas WHERE cliente_id = :cliente_id ORDER BY fecha DESC",
+                              {"cliente_id": cliente_id})
+            return df if not df.empty else pd.DataFrame()
+
         with engine.connect() as conn:
             stmt = text("SELECT * FROM visitas WHERE cliente_id = :cliente_id ORDER BY fecha DESC")
             result = conn.execute(stmt, {"cliente_id": cliente_id})
@@ -284,10 +1305,13 @@ def agregar_contacto(cliente_id, fecha, tipo, notas=""):
         return
 
     with engine.begin() as conn:
-        conn.execute(text("""
+        fila = conn.execute(text("""
             INSERT INTO contactos (cliente_id, fecha, tipo, notas)
             VALUES (:cliente_id, :fecha, :tipo, :notas)
-        """), {"cliente_id": cliente_id, "fecha": fecha, "tipo": tipo, "notas": notas})
+            RETURNING *
+        """), {"cliente_id": cliente_id, "fecha": fecha, "tipo": tipo, "notas": notas}).mappings().fetchone()
+    invalidar_detalle(cliente_id)
+    _replica_aplicar("contactos", filas=[fila])
 
 def obtener_contactos(cliente_id):
     """
@@ -303,6 +1327,12 @@ def obtener_contactos(cliente_id):
             st.error(f"ID de cliente inválido al leer contactos: {cliente_id}")
             return pd.DataFrame()
 
+        replica = _replica_vigente()
+        if replica is not None:
+            df = replica.leer("contactos", "SELECT * FROM contactos WHERE cliente_id = :cliente_id ORDER BY fecha DESC",
+                              {"cliente_id": cliente_id})
+            return df if not df.empty else pd.DataFrame()
+
         with engine.connect() as conn:
             stmt = text("SELECT * FROM contactos WHERE cliente_id = :cliente_id ORDER BY fecha DESC")
             result = conn.execute(stmt, {"cliente_id": cliente_id})
@@ -319,6 +1349,117 @@ def obtener_contactos(cliente_id):
         return pd.DataFrame()
 
 
+# --------------------------
+# Detalle de un cliente: fila + historial + agenda en una sola consulta, con caché por cliente
+# --------------------------
+# Clientes cuyo detalle se mantiene en memoria (LRU)
+DETALLE_CACHE_MAX = int(st.secrets.get("DETALLE_CACHE_MAX", 1000))
+
+_detalle_lock = threading.Lock()
+_detalle_cache = OrderedDict()   # cliente_id -> (base_name, (cliente, contactos_df, visitas_df))
+_detalle_version = 0             # cambia con cada invalidación (descarta lecturas en vuelo)
+
+# Columnas de fecha que llegan como texto desde json_agg
+_FECHAS_DETALLE = {"fecha_contacto": "date", "fecha": "date", "creado_en": "datetime"}
+
+def _tipar_detalle(df):
+    for columna, tipo in _FECHAS_DETALLE.items():
+        if columna in df.columns:
+            if tipo == "date":
+                df[columna] = df[columna].map(lambda v: date.fromisoformat(v) if isinstance(v, str) else v)
+            else:
+                df[columna] = pd.to_datetime(df[columna], format="ISO8601")
+    return df
+
+def _leer_detalle(cliente_id):
+    replica = _replica_vigente()
+    if replica is not None:
+        # En la réplica local no hay viaje de red: tres lecturas locales
+        df = replica.leer("clientes", "SELECT * FROM clientes WHERE id = :id", {"id": cliente_id})
+        if df.empty:
+            return None
+        contactos = replica.leer("contactos", "SELECT * FROM contactos WHERE cliente_id = :id ORDER BY fecha DESC",
+                                 {"id": cliente_id})
+        visitas = replica.leer("visitas", "SELECT * FROM visitas WHERE cliente_id = :id ORDER BY fecha DESC",
+                               {"id": cliente_id})
+        return df.iloc[0], contactos if not contactos.empty else pd.DataFrame(), \
+            visitas if not visitas.empty else pd.DataFrame()
+
+    # Un solo viaje: el historial y la agenda viajan como arreglos JSON junto a la fila
+    with engine.connect() as conn:
+        fila = conn.execute(text("""
+            SELECT row_to_json(c) AS cliente,
+                   (SELECT json_agg(t ORDER BY t.fecha DESC) FROM contactos t WHERE t.cliente_id = c.id) AS contactos,
+                   (SELECT json_agg(v ORDER BY v.fecha DESC) FROM visitas v WHERE v.cliente_id = c.id) AS visitas
+            FROM clientes c
+            WHERE c.id = :id
+        """), {"id": cliente_id}).fetchone()
+    if fila is None:
+        return None
+    cliente, contactos, visitas = (json.loads(v) if isinstance(v, str) else v for v in fila)
+    cliente = _tipar_detalle(pd.DataFrame([cliente])).iloc[0]
+    contactos = _tipar_detalle(pd.DataFrame(contactos)) if contactos else pd.DataFrame()
+    visitas = _tipar_detalle(pd.DataFrame(visitas)) if visitas else pd.DataFrame()
+    return cliente, contactos, visitas
+
+def obtener_detalle_cliente(cliente_id):
+    """
+    Retorna (cliente, contactos_df, visitas_df) para la Vista Detallada: la fila del cliente
+    (pd.Series) con su historial y su agenda (más recientes primero), o None si no existe.
+    Se cachea por cliente hasta que una escritura lo toque (invalidar_detalle); los valores
+    se comparten entre sesiones y no deben modificarse in-place.
+    """
+    try:
+        cliente_id = int(cliente_id)
+    except Exception:
+        st.error(f"ID de cliente inválido al leer el detalle: {cliente_id}")
+        return None
+
+    with _detalle_lock:
+        entrada = _detalle_cache.get(cliente_id)
+        if entrada is not None:
+            _detalle_cache.move_to_end(cliente_id)
+            return entrada[1]
+        version = _detalle_version
+
+    try:
+        detalle = _leer_detalle(cliente_id)
+    except Exception as e:
+        st.error(f"Error leyendo el detalle del cliente {cliente_id}: {e}")
+        return None
+    if detalle is None:
+        return None
+
+    with _detalle_lock:
+        # Si hubo una escritura mientras leíamos, no guardamos datos viejos
+        if version == _detalle_version:
+            _detalle_cache[cliente_id] = (detalle[0].get("base_name"), detalle)
+            while len(_detalle_cache) > DETALLE_CACHE_MAX:
+                _detalle_cache.popitem(last=False)
+    return detalle
+
+def invalidar_detalle(*ids, bases=()):
+    """Descarta el detalle cacheado de los clientes indicados y de todos los de `bases`."""
+    global _detalle_version
+    ids = {int(i) for i in ids if i is not None}
+    bases = {b for b in bases if b}
+    with _detalle_lock:
+        _detalle_version += 1
+        for cliente_id in [k for k, e in _detalle_cache.items() if k in ids or e[0] in bases]:
+            del _detalle_cache[cliente_id]
+
+
+# Lista blanca de columnas permitidas a actualizar (ajusta si necesitas otras)
+COLUMNAS_ACTUALIZABLES = {
+    "nombre", "nit", "contacto", "telefono", "email", "ciudad", "direccion",
+    "fecha_contacto", "observacion", "contactado",
+    "tipo_operacion", "modalidad", "origen", "destino", "mercancia",
+    "base_name"
+}
+
+# Tipo SQL de las columnas que no son TEXT (para los CAST de las actualizaciones por lote)
+_TIPOS_COLUMNAS = {"fecha_contacto": "date", "contactado": "boolean"}
+
 def actualizar_cliente_campos(cliente_id, updates: dict):
     try:
         cliente_id = int(cliente_id)
@@ -327,16 +1468,8 @@ def actualizar_cliente_campos(cliente_id, updates: dict):
     if not updates:
         return
 
-    # Lista blanca de columnas permitidas a actualizar (ajusta si necesitas otras)
-    allowed = {
-        "nombre", "nit", "contacto", "telefono", "email", "ciudad", "direccion",
-        "fecha_contacto", "observacion", "contactado",
-        "tipo_operacion", "modalidad", "origen", "destino", "mercancia",
-        "base_name"
-    }
-
     # Filtrar updates para mantener solo columnas permitidas
-    safe_updates = {k: v for k, v in updates.items() if k in allowed}
+    safe_updates = {k: v for k, v in updates.items() if k in COLUMNAS_ACTUALIZABLES}
     if not safe_updates:
         return
 
@@ -347,10 +1480,24 @@ def actualizar_cliente_campos(cliente_id, updates: dict):
         set_clauses.append(f"{k} = :{k}")
         params[k] = v
 
-    sql = "UPDATE clientes SET " + ", ".join(set_clauses) + " WHERE id = :id"
+    # "antes" conserva la base previa: si base_name cambia hay que invalidar ambas bases
+    sql = (
+        "UPDATE clientes SET " + ", ".join(set_clauses)
+        + " FROM (SELECT id, base_name FROM clientes WHERE id = :id) AS antes"
+        + " WHERE clientes.id = antes.id"
+        + " RETURNING clientes.*, antes.base_name AS base_antes"
+    )
     try:
         with engine.begin() as conn:
-            conn.execute(text(sql), params)
+            res = conn.execute(text(sql), params).mappings().fetchone()
+        if res:
+            fila = dict(res)
+            base_antes = fila.pop("base_antes")
+            aplicar_cambios_cache(filas=[fila], bases=[base_antes])
+            invalidar_detalle(cliente_id)
+            _indices_aplicar(filas=[fila])
+            _replica_aplicar("clientes", filas=[fila])
+            return fila
     except Exception as e:
         # No detenemos la app, pero mostramos/logueamos el error
         try:
@@ -359,3 +1506,317 @@ def actualizar_cliente_campos(cliente_id, updates: dict):
         except Exception:
             pass
         raise
+
+def _valor_para_lote(columna, valor):
+    # Normaliza el valor al tipo de la columna para que cada columna del VALUES tenga un único tipo
+    if valor is None:
+        return None
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass
+    tipo = _TIPOS_COLUMNAS.get(columna)
+    if tipo == "boolean":
+        # Mismo criterio que la importación: "false", "0" o "no" son False (bool("false") es True)
+        return _a_booleano(valor)
+    if tipo == "date":
+        return valor.isoformat() if hasattr(valor, "isoformat") else str(valor)
+    return valor if isinstance(valor, str) else str(valor)
+
+def actualizar_clientes_campos(cambios, tamano_lote=500):
+    """
+    Aplica en UNA sola transacción una lista de cambios [(cliente_id, updates), ...].
+    Las filas se agrupan por conjunto de columnas y cada grupo se escribe con un
+    UPDATE ... FROM (VALUES ...) de hasta tamano_lote filas, en lugar de un UPDATE por fila.
+    Usa la misma lista blanca que actualizar_cliente_campos. Retorna las filas actualizadas
+    tal como quedaron en la BD (dicts de RETURNING), en el mismo recorrido que el UPDATE.
+    """
+    grupos = {}
+    for cliente_id, updates in cambios or []:
+        try:
+            cliente_id = int(cliente_id)
+        except Exception:
+            continue
+        safe_updates = {k: v for k, v in (updates or {}).items() if k in COLUMNAS_ACTUALIZABLES}
+        if not safe_updates:
+            continue
+        columnas = tuple(sorted(safe_updates))
+        grupos.setdefault(columnas, []).append((cliente_id, safe_updates))
+
+    if not grupos:
+        return []
+
+    bases = set()
+    filas_nuevas = []
+    try:
+        with engine.begin() as conn:
+            for columnas, filas in grupos.items():
+                set_sql = ", ".join(
+                    f"{c} = CAST(v.{c} AS {_TIPOS_COLUMNAS.get(c, 'text')})" for c in columnas
+                )
+                for inicio in range(0, len(filas), tamano_lote):
+                    lote = filas[inicio:inicio + tamano_lote]
+                    valores = []
+                    params = {}
+                    for i, (cliente_id, safe_updates) in enumerate(lote):
+                        params[f"id_{i}"] = cliente_id
+                        for c in columnas:
+                            params[f"{c}_{i}"] = _valor_para_lote(c, safe_updates[c])
+                        valores.append("(" + ", ".join([f":id_{i}"] + [f":{c}_{i}" for c in columnas]) + ")")
+
+                    # "antes" conserva la base previa para invalidar también la base de origen
+                    sql = (
+                        f"UPDATE clientes SET {set_sql}"
+                        f" FROM (VALUES {', '.join(valores)}) AS v(id, {', '.join(columnas)}),"
+                        " clientes AS antes"
+                        " WHERE clientes.id = v.id AND antes.id = v.id"
+                        " RETURNING clientes.*, antes.base_name AS base_antes"
+                    )
+                    for res in conn.execute(text(sql), params).mappings():
+                        fila = dict(res)
+                        bases.update((fila["base_name"], fila.pop("base_antes")))
+                        filas_nuevas.append(fila)
+    except Exception as e:
+        # Aunque falle la transacción, invalidar lo que alcanzamos a ver es inofensivo
+        if bases:
+            invalidar_bases(*bases)
+            invalidar_detalle(*[f["id"] for f in filas_nuevas])
+        try:
+            import streamlit as st
+            st.error(f"Error actualizando clientes por lote: {e}")
+        except Exception:
+            pass
+        raise
+    # Solo tras el commit: la caché, los índices y la réplica reciben las filas ya confirmadas
+    aplicar_cambios_cache(filas=filas_nuevas, bases=bases)
+    invalidar_detalle(*[f["id"] for f in filas_nuevas])
+    _indices_aplicar(filas=filas_nuevas)
+    _replica_aplicar("clientes", filas=filas_nuevas)
+    return filas_nuevas
+
+
+# --------------------------
+# Importación masiva (COPY a tabla temporal + merge por NIT normalizado)
+# --------------------------
+COLUMNAS_IMPORTACION = (
+    "nombre", "nit", "contacto", "telefono", "email", "ciudad", "direccion",
+    "fecha_contacto", "observacion", "contactado",
+)
+
+# Encabezados aceptados en el archivo (en minúscula): nombre de columna en la BD o nombre mostrado en la app
+_ALIAS_IMPORTACION = {
+    **{c: c for c in COLUMNAS_IMPORTACION},
+    "persona de contacto": "contacto",
+    "teléfono": "telefono",
+    "dirección": "direccion",
+    "última fecha de contacto": "fecha_contacto",
+    "fecha de contacto": "fecha_contacto",
+    "observación": "observacion",
+    "correo": "email",
+}
+
+_VERDADEROS = {"true", "t", "1", "1.0", "si", "sí", "s", "x", "yes", "y"}
+
+def _a_booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    if valor is None:
+        return None
+    texto = str(valor).strip().lower()
+    if texto == "":
+        return None
+    return texto in _VERDADEROS
+
+def _a_fecha_iso(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def _filas_archivo(archivo, nombre_archivo):
+    """
+    Genera las filas del archivo como tuplas (encabezado, valores) sin cargarlo entero:
+    CSV con el módulo csv, Excel con openpyxl en modo read_only.
+    """
+    nombre = (nombre_archivo or getattr(archivo, "name", "") or "").lower()
+    if nombre.endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            yield from libro.active.iter_rows(values_only=True)
+        finally:
+            libro.close()
+    else:
+        texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="") if not isinstance(archivo, io.TextIOBase) else archivo
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t|")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(texto, dialecto)
+
+class _FlujoCopy(io.RawIOBase):
+    """
+    Adaptador de un iterador de líneas CSV a archivo de lectura para cursor.copy_expert:
+    COPY va pidiendo bloques y solo se mantiene en memoria el bloque actual.
+    """
+    def __init__(self, lineas):
+        self._lineas = lineas
+        self._pendiente = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self._pendiente) < len(buffer):
+            linea = next(self._lineas, None)
+            if linea is None:
+                break
+            self._pendiente += linea.encode("utf-8")
+        n = min(len(buffer), len(self._pendiente))
+        buffer[:n] = self._pendiente[:n]
+        self._pendiente = self._pendiente[n:]
+        return n
+
+def importar_clientes(archivo, base_name="TRANSLOGISTIC", username=None, nombre_archivo=None):
+    """
+    Importa masivamente clientes desde un CSV o Excel (.xlsx) a base_name.
+    - El archivo se recorre en streaming y se carga con COPY a una tabla temporal.
+    - Luego, en la misma transacción, se hace upsert por NIT normalizado dentro de la base:
+      los NIT existentes se actualizan (solo con las columnas presentes en el archivo) y
+      los nuevos se insertan.
+    - Aplica las mismas reglas que agregar_cliente: contactado=False por defecto,
+      sin fecha_contacto si no está contactado y prefijo "username__display" en bases privadas.
+    - Se rechazan filas sin NIT válido y NIT repetidos en el archivo (gana la última fila).
+    Retorna {"insertados": n, "actualizados": n, "rechazados": n}.
+    """
+    base_name = _base_interna(base_name or "TRANSLOGISTIC", username)
+    filas = _filas_archivo(archivo, nombre_archivo)
+
+    encabezado = next(filas, None)
+    if not encabezado:
+        return {"insertados": 0, "actualizados": 0, "rechazados": 0}
+    posiciones = {}
+    for i, titulo in enumerate(encabezado):
+        columna = _ALIAS_IMPORTACION.get(str(titulo or "").strip().lower())
+        if columna and columna not in posiciones:
+            posiciones[columna] = i
+    if "nit" not in posiciones:
+        raise ValueError("El archivo debe tener una columna NIT")
+    presentes = [c for c in COLUMNAS_IMPORTACION if c in posiciones]
+
+    rechazados_sin_nit = 0
+
+    def _lineas_csv():
+        nonlocal rechazados_sin_nit
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        for numero, fila in enumerate(filas, start=1):
+            valores = {}
+            for columna in presentes:
+                i = posiciones[columna]
+                valores[columna] = fila[i] if i < len(fila) else None
+            if not str(valores.get("nit") or "").strip():
+                rechazados_sin_nit += 1
+                continue
+            registro = [numero]
+            for columna in presentes:
+                v = valores[columna]
+                if columna == "contactado":
+                    v = _a_booleano(v)
+                elif columna == "fecha_contacto":
+                    v = _a_fecha_iso(v)
+                elif v is not None:
+                    v = str(v).strip()
+                # En COPY csv el campo vacío sin comillas es NULL
+                registro.append("" if v is None or v == "" else v)
+            escritor.writerow(registro)
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+
+    tipos = {"fecha_contacto": "DATE", "contactado": "BOOLEAN"}
+    definicion = ", ".join(f"{c} {tipos.get(c, 'TEXT')}" for c in presentes)
+
+    # SET para los NIT existentes: solo columnas que trae el archivo (y regla contactado/fecha)
+    sets = [f"{c} = COALESCE(f.{c}, c.{c})" for c in presentes if c not in ("contactado", "fecha_contacto", "nit")]
+    if "contactado" in presentes:
+        sets.append("contactado = COALESCE(f.contactado, c.contactado)")
+        fecha = "f.fecha_contacto" if "fecha_contacto" in presentes else "c.fecha_contacto"
+        sets.append(f"fecha_contacto = CASE WHEN COALESCE(f.contactado, c.contactado) THEN {fecha} ELSE NULL END")
+    elif "fecha_contacto" in presentes:
+        sets.append("fecha_contacto = CASE WHEN c.contactado THEN COALESCE(f.fecha_contacto, c.fecha_contacto) ELSE NULL END")
+
+    insert_cols = [c for c in presentes if c not in ("contactado", "fecha_contacto")]
+    contactado_sql = "COALESCE(f.contactado, FALSE)" if "contactado" in presentes else "FALSE"
+    fecha_sql = f"CASE WHEN {contactado_sql} THEN f.fecha_contacto ELSE NULL END" if "fecha_contacto" in presentes else "NULL"
+
+    with engine.begin() as conn:
+        # Evitar que dos importaciones sobre la misma base dupliquen NITs
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:clave))"), {"clave": f"importar:{base_name}"})
+        conn.execute(text(f"CREATE TEMP TABLE _import_clientes (fila BIGINT, {definicion}) ON COMMIT DROP"))
+
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY _import_clientes (fila, {', '.join(presentes)}) FROM STDIN WITH (FORMAT csv)",
+                _FlujoCopy(_lineas_csv()),
+            )
+        finally:
+            cursor.close()
+
+        # Una fila por NIT normalizado (la última del archivo gana)
+        conn.execute(text("""
+            CREATE TEMP TABLE _import_fuente ON COMMIT DROP AS
+            SELECT DISTINCT ON (nit_norm) *
+            FROM (SELECT *, normalizar_nit(nit) AS nit_norm FROM _import_clientes) s
+            WHERE nit_norm IS NOT NULL
+            ORDER BY nit_norm, fila DESC
+        """))
+        conteo = conn.execute(text("""
+            SELECT (SELECT count(*) FROM _import_clientes), (SELECT count(*) FROM _import_fuente)
+        """)).fetchone()
+
+        actualizados = 0
+        if sets:
+            actualizados = conn.execute(text(f"""
+                UPDATE clientes c SET {", ".join(sets)}
+                FROM _import_fuente f
+                WHERE c.base_name = :base_name AND normalizar_nit(c.nit) = f.nit_norm
+            """), {"base_name": base_name}).rowcount
+
+        insertados = conn.execute(text(f"""
+            INSERT INTO clientes ({", ".join(insert_cols)}, contactado, fecha_contacto, username, base_name)
+            SELECT {", ".join("f." + c for c in insert_cols)}, {contactado_sql}, {fecha_sql}, :username, :base_name
+            FROM _import_fuente f
+            WHERE NOT EXISTS (
+                SELECT 1 FROM clientes c
+                WHERE c.base_name = :base_name AND normalizar_nit(c.nit) = f.nit_norm
+            )
+            ORDER BY f.fila
+        """), {"base_name": base_name, "username": username}).rowcount
+
+    invalidar_bases(base_name)
+    invalidar_detalle(bases=[base_name])
+    descartar_indices_busqueda(base_name)
+    # El upsert no retorna filas: la réplica deja de responder hasta traer la importación
+    if _replica is not None:
+        _replica.invalidar()
+    return {
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "rechazados": rechazados_sin_nit + (conteo[0] - conteo[1]),
+    }
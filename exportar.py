@@ -0,0 +1,235 @@
+import csv
+import hashlib
+import math
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+import streamlit as st
+
+from db import leer_clientes_por_bloques, obtener_bases
+
+# --------------------------
+# Exportación en streaming (memoria acotada sin importar el tamaño de la base)
+# --------------------------
+# formato -> (extensión, mime)
+FORMATOS_EXPORTACION = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Filas leídas de la BD por bloque (cursor del lado del servidor)
+TAMANO_BLOQUE_EXPORTACION = 5000
+
+def _celda(valor):
+    # xlsxwriter no acepta NaN/NaT; las fechas se dejan como date para que Excel las reconozca
+    if valor is None:
+        return None
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if valor is pd.NaT:
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    return valor
+
+def _exportar_xlsx(bloques, destino):
+    import xlsxwriter
+
+    # constant_memory: cada fila se escribe a disco apenas se completa
+    libro = xlsxwriter.Workbook(destino, {"constant_memory": True, "remove_timezone": True})
+    hoja = libro.add_worksheet("Clientes")
+    formato_fecha = libro.add_format({"num_format": "yyyy-mm-dd"})
+    total = 0
+    try:
+        fila = 0
+        for bloque in bloques:
+            if fila == 0:
+                hoja.write_row(0, 0, list(bloque.columns))
+                fila = 1
+            for registro in bloque.itertuples(index=False, name=None):
+                for col, valor in enumerate(registro):
+                    valor = _celda(valor)
+                    if isinstance(valor, (date, datetime)):
+                        hoja.write_datetime(fila, col, valor, formato_fecha)
+                    else:
+                        hoja.write(fila, col, valor)
+                fila += 1
+            total += len(bloque)
+    finally:
+        libro.close()
+    return total
+
+def _exportar_csv(bloques, destino):
+    total = 0
+    # utf-8-sig para que Excel abra bien las tildes
+    with open(destino, "w", newline="", encoding="utf-8-sig") as f:
+        primero = True
+        for bloque in bloques:
+            bloque.to_csv(f, header=primero, index=False, quoting=csv.QUOTE_MINIMAL)
+            primero = False
+            total += len(bloque)
+    return total
+
+def _exportar_parquet(bloques, destino):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación a Parquet requiere el paquete 'pyarrow'")
+
+    # Tipos fijos para las columnas conocidas; así todos los bloques comparten el mismo esquema
+    tipos = {"id": pa.int64(), "fecha_contacto": pa.date32(), "contactado": pa.bool_()}
+    escritor = None
+    esquema = None
+    total = 0
+    try:
+        for bloque in bloques:
+            if escritor is None:
+                campos = []
+                for columna in bloque.columns:
+                    tipo = tipos.get(columna)
+                    if tipo is None:
+                        tipo = pa.Array.from_pandas(bloque[columna]).type
+                        if pa.types.is_null(tipo):
+                            tipo = pa.string()
+                    campos.append(pa.field(columna, tipo))
+                esquema = pa.schema(campos)
+                escritor = pq.ParquetWriter(destino, esquema)
+            if "fecha_contacto" in bloque.columns:
+                bloque = bloque.assign(fecha_contacto=pd.to_datetime(bloque["fecha_contacto"], errors="coerce").dt.date)
+            escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+            total += len(bloque)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return total
+
+def exportar_clientes(destino, formato="xlsx", contactado=None, username=None, is_admin=False,
+                      base_name=None, busqueda=None):
+    """
+    Escribe en el archivo destino los clientes de la vista, leyendo la BD por bloques
+    (cursor del lado del servidor) y escribiendo cada bloque apenas llega.
+    formato: "xlsx" (xlsxwriter en modo constant_memory), "csv" o "parquet".
+    busqueda: texto del buscador del tab; se exportan todas sus coincidencias (la grilla muestra solo las primeras).
+    Retorna el número de filas exportadas.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+
+    bloques = leer_clientes_por_bloques(
+        contactado=contactado, username=username, is_admin=is_admin, base_name=base_name,
+        busqueda=busqueda, tamano_bloque=TAMANO_BLOQUE_EXPORTACION,
+    )
+    if formato == "xlsx":
+        return _exportar_xlsx(bloques, destino)
+    if formato == "csv":
+        return _exportar_csv(bloques, destino)
+    return _exportar_parquet(bloques, destino)
+
+
+# --------------------------
+# Trabajos de exportación en segundo plano con caché en disco
+# --------------------------
+# Carpeta donde quedan los archivos generados (se reusan mientras los datos no cambien)
+EXPORTACIONES_DIR = st.secrets.get("EXPORTACIONES_DIR", os.path.join(tempfile.gettempdir(), "mylocaldata_exportaciones"))
+# Archivos que se conservan en disco; los más viejos se borran
+EXPORTACIONES_MAX_ARCHIVOS = int(st.secrets.get("EXPORTACIONES_MAX_ARCHIVOS", 50))
+
+_pool_exportaciones = ThreadPoolExecutor(
+    max_workers=int(st.secrets.get("EXPORTACIONES_WORKERS", 2)),
+    thread_name_prefix="exportacion",
+)
+_trabajos_lock = threading.Lock()
+_trabajos = {}  # clave -> Future
+
+def version_datos(base_name=None):
+    """
+    Versión de los datos de una base según el catálogo de bases (última modificación + filas).
+    Sin base concreta (admin "Todas" o filtro por username) se usa la de todo el catálogo.
+    Es una lectura de la caché compartida, no una consulta por rerun.
+    """
+    bases = obtener_bases()
+    if bases.empty:
+        return "vacio"
+    if base_name is not None:
+        fila = bases[bases["base_name"] == base_name]
+        if fila.empty:
+            return "vacio"
+        return f"{fila['actualizado_en'].iloc[0]}|{int(fila['total_clientes'].iloc[0])}"
+    return f"{bases['actualizado_en'].max()}|{int(bases['total_clientes'].sum())}|{len(bases)}"
+
+def clave_exportacion(formato, contactado=None, username=None, is_admin=False, base_name=None, busqueda=None):
+    """
+    Nombre de archivo del artefacto: hash de base, filtros, formato y versión de los datos.
+    Si los datos cambian, la clave cambia y el archivo anterior deja de servirse.
+    """
+    partes = [formato, contactado, username, is_admin, base_name, busqueda or "", version_datos(base_name)]
+    digest = hashlib.sha1("|".join(str(p) for p in partes).encode("utf-8")).hexdigest()
+    return f"{digest}.{FORMATOS_EXPORTACION[formato][0]}"
+
+def _ruta(clave):
+    return os.path.join(EXPORTACIONES_DIR, clave)
+
+def _limpiar_exportaciones():
+    # Conserva solo los EXPORTACIONES_MAX_ARCHIVOS más recientes
+    try:
+        archivos = [os.path.join(EXPORTACIONES_DIR, n) for n in os.listdir(EXPORTACIONES_DIR)]
+        archivos = sorted((a for a in archivos if os.path.isfile(a)), key=os.path.getmtime, reverse=True)
+        for viejo in archivos[EXPORTACIONES_MAX_ARCHIVOS:]:
+            os.remove(viejo)
+    except OSError:
+        pass
+
+def _generar(clave, formato, filtros):
+    ruta = _ruta(clave)
+    # Se escribe en un temporal y se renombra: nunca se sirve un archivo a medio escribir
+    temporal = f"{ruta}.{threading.get_ident()}.tmp"
+    try:
+        filas = exportar_clientes(temporal, formato, **filtros)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    _limpiar_exportaciones()
+    return filas
+
+def solicitar_exportacion(formato, contactado=None, username=None, is_admin=False, base_name=None, busqueda=None):
+    """
+    Encola la generación del archivo en el pool de segundo plano (si no existe ya en disco
+    ni hay un trabajo en curso para la misma clave). Retorna la clave del trabajo.
+    """
+    filtros = {"contactado": contactado, "username": username, "is_admin": is_admin,
+               "base_name": base_name, "busqueda": busqueda or None}
+    clave = clave_exportacion(formato, **filtros)
+    os.makedirs(EXPORTACIONES_DIR, exist_ok=True)
+    with _trabajos_lock:
+        if os.path.exists(_ruta(clave)):
+            return clave
+        trabajo = _trabajos.get(clave)
+        if trabajo is None or (trabajo.done() and trabajo.exception() is not None):
+            _trabajos[clave] = _pool_exportaciones.submit(_generar, clave, formato, filtros)
+    return clave
+
+def estado_exportacion(clave):
+    """
+    Retorna {"estado": "listo" | "en_proceso" | "error" | "no_solicitado", "ruta": ..., "error": ...}.
+    """
+    ruta = _ruta(clave)
+    if os.path.exists(ruta):
+        return {"estado": "listo", "ruta": ruta, "error": None}
+    with _trabajos_lock:
+        trabajo = _trabajos.get(clave)
+    if trabajo is None:
+        return {"estado": "no_solicitado", "ruta": None, "error": None}
+    if not trabajo.done():
+        return {"estado": "en_proceso", "ruta": None, "error": None}
+    error = trabajo.exception()
+    if error is not None:
+        return {"estado": "error", "ruta": None, "error": str(error)}
+    # Terminó pero el archivo ya no está (limpieza): hay que volver a pedirlo
+    return {"estado": "no_solicitado", "ruta": None, "error": None}
@@ -0,0 +1,177 @@
+"""
+Generador de datos sintéticos para reproducir volúmenes de producción en una BD LOCAL.
+
+Llena clientes, contactos, visitas y users con distribuciones parecidas a las reales:
+muchas bases privadas con tamaños sesgados (pocas bases grandes, muchas chicas), la base
+compartida TRANSLOGISTIC con ~35% de los clientes, nombres y ciudades colombianas, y un
+historial de contactos de profundidad variable. Es determinista para una misma semilla.
+
+    MYLOCALDATA_DATABASE_URL=postgresql+psycopg2://postgres@localhost/mylocaldata \\
+        python generar_datos.py --clientes 100000
+
+Solo acepta BDs locales (localhost o socket unix) salvo que se pase --forzar.
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from migraciones import aplicar_migraciones
+
+# Clientes insertados por transacción
+TAMANO_LOTE = 50000
+
+_SQL_CLIENTES = """
+    INSERT INTO clientes (nombre, nit, contacto, telefono, email, ciudad, direccion, fecha_contacto,
+                          observacion, contactado, username, base_name,
+                          tipo_operacion, modalidad, origen, destino, mercancia)
+    SELECT
+        p.prefijo || ' ' || p.nucleo || CASE WHEN p.sufijo = '' THEN '' ELSE ' ' || p.sufijo END,
+        (800000000 + g)::text || '-' || (g % 10)::text,
+        p.nombre_contacto,
+        '3' || lpad((floor(random() * 1000000000))::bigint::text, 9, '0'),
+        lower(translate(split_part(p.nombre_contacto, ' ', 1), 'áéíóúñ', 'aeioun')) || g || '@'
+            || (ARRAY['gmail.com','hotmail.com','outlook.com','empresa.com.co','yahoo.es'])[1 + floor(random() * 5)::int],
+        p.ciudad,
+        (ARRAY['Calle','Carrera','Avenida','Transversal','Diagonal'])[1 + floor(random() * 5)::int]
+            || ' ' || (1 + floor(random() * 150)::int) || ' # ' || (1 + floor(random() * 99)::int)
+            || '-' || (1 + floor(random() * 99)::int),
+        CASE WHEN p.contactado THEN current_date - floor(random() * 730)::int END,
+        CASE WHEN random() < 0.3 THEN 'Cliente interesado en cotización' ELSE '' END,
+        p.contactado,
+        CASE WHEN p.base < 0 THEN 'vendedor' || (1 + floor(random() * :bases)::int) ELSE 'vendedor' || p.base END,
+        -- Cada vendedor tiene UNA base privada ("{username}__{display}"), como en la app
+        CASE WHEN p.base < 0 THEN 'TRANSLOGISTIC'
+             ELSE 'vendedor' || p.base || '__' || (ARRAY['Prospectos','Cartera','Clientes Costa','Zona Norte','Importadores'])[1 + p.base % 5] END,
+        (ARRAY['Importación','Exportación','Nacional','Tránsito'])[1 + floor(random() * 4)::int],
+        (ARRAY['Marítimo','Aéreo','Terrestre','Multimodal'])[1 + floor(random() * 4)::int],
+        (ARRAY['Shanghái','Miami','Houston','Rotterdam','Ciudad de Panamá','Buenaventura','Cartagena'])[1 + floor(random() * 7)::int],
+        (ARRAY['Bogotá','Medellín','Cali','Barranquilla','Cartagena','Buenaventura','Santa Marta'])[1 + floor(random() * 7)::int],
+        (ARRAY['Repuestos','Textiles','Alimentos','Maquinaria','Químicos','Electrónica','Café','Flores'])[1 + floor(random() * 8)::int]
+    FROM generate_series(CAST(:desde AS int), CAST(:hasta AS int)) AS g
+    CROSS JOIN LATERAL (
+        SELECT
+            (ARRAY['Transportes','Logística','Distribuidora','Comercializadora','Inversiones','Agroindustrial',
+                   'Importadora','Ferretería','Textiles','Alimentos','Servicios','Construcciones'])[1 + floor(random() * 12)::int] AS prefijo,
+            (ARRAY['del Valle','Andina','del Caribe','San José','La Esperanza','Santa Fe','El Dorado','Los Andes',
+                   'del Pacífico','de Oriente','Gómez','Rodríguez','Martínez','Hernández','López','García',
+                   'Ramírez','Sánchez','Montoya','Restrepo'])[1 + floor(random() * 20)::int] || ' ' || (g % 997) AS nucleo,
+            (ARRAY['S.A.S.','S.A.S.','S.A.S.','Ltda.','S.A.','& Cía.',''])[1 + floor(random() * 7)::int] AS sufijo,
+            (ARRAY['María','José','Luis','Ana','Carlos','Juan','Laura','Andrés','Diana','Jorge','Camila',
+                   'Santiago','Valentina','Felipe','Natalia','Sergio'])[1 + floor(random() * 16)::int]
+                || ' ' ||
+            (ARRAY['García','Rodríguez','Martínez','López','González','Pérez','Sánchez','Ramírez','Torres',
+                   'Gómez','Díaz','Vargas','Castro','Rojas','Moreno','Jiménez'])[1 + floor(random() * 16)::int] AS nombre_contacto,
+            -- Bogotá pesa más que el resto, como en producción
+            (ARRAY['Bogotá','Bogotá','Bogotá','Bogotá','Bogotá','Bogotá','Bogotá','Medellín','Medellín','Medellín',
+                   'Cali','Cali','Barranquilla','Barranquilla','Cartagena','Bucaramanga','Pereira','Manizales',
+                   'Cúcuta','Ibagué','Santa Marta','Villavicencio'])[1 + floor(random() * 22)::int] AS ciudad,
+            random() < 0.35 AS contactado,
+            -- -1 = TRANSLOGISTIC (35%); si no, base privada con tamaño sesgado (potencia de random)
+            CASE WHEN random() < 0.35 THEN -1 ELSE 1 + floor(:bases * power(random(), 2.5))::int END AS base
+        WHERE g > 0
+    ) AS p
+"""
+
+def _es_local(url):
+    u = make_url(url)
+    host = u.host or u.query.get("host") or ""
+    return host in ("", "localhost", "127.0.0.1", "::1") or str(host).startswith("/")
+
+def generar(engine, clientes, bases=200, semilla=42, media_contactos=3.0, limpiar=False):
+    """
+    Inserta `clientes` clientes (y su historial) en lotes de TAMANO_LOTE.
+    Retorna un dict con los conteos finales de cada tabla.
+    """
+    aplicar_migraciones(engine)
+    with engine.begin() as conn:
+        if limpiar:
+            conn.execute(text("TRUNCATE clientes, contactos, visitas, users RESTART IDENTITY CASCADE"))
+            conn.execute(text("DELETE FROM bases"))
+            conn.execute(text("DELETE FROM bases_ediciones"))
+
+    inicio = time.monotonic()
+    for desde in range(1, clientes + 1, TAMANO_LOTE):
+        hasta = min(desde + TAMANO_LOTE - 1, clientes)
+        with engine.begin() as conn:
+            # Semilla por lote: el resultado no depende de cuántos lotes se corran por sesión
+            conn.execute(text("SELECT setseed(:s)"), {"s": ((semilla * 7919 + desde) % 1000000) / 1000000.0})
+            # Clientes, su historial y su agenda en una sola sentencia (CTEs que insertan)
+            conn.execute(text(f"""
+                WITH nuevos AS (
+                    {_SQL_CLIENTES}
+                    RETURNING id, username
+                ),
+                hist AS (
+                    -- Profundidad geométrica: muchos clientes con 0-2 contactos, algunos con decenas
+                    INSERT INTO contactos (cliente_id, fecha, tipo, notas)
+                    SELECT n.id,
+                           current_date - floor(random() * 900)::int,
+                           (ARRAY['Presencial','Llamada','Email'])[1 + floor(random() * 3)::int],
+                           (ARRAY['','Envió portafolio','Pidió cotización','No contesta','Reagendar'])[1 + floor(random() * 5)::int]
+                    FROM nuevos n
+                    CROSS JOIN LATERAL generate_series(1, floor(-ln(1 - random()) * :media + 0 * n.id)::int) AS k
+                    RETURNING 1
+                ),
+                agenda AS (
+                    -- ~20% de los clientes con 1-3 visitas (pasadas y futuras)
+                    INSERT INTO visitas (cliente_id, fecha, medio, creado_por)
+                    SELECT n.id,
+                           current_date + (floor(random() * 120)::int - 60),
+                           (ARRAY['Presencial','Llamada','Email'])[1 + floor(random() * 3)::int],
+                           n.username
+                    FROM (SELECT * FROM nuevos WHERE random() < 0.2) n
+                    CROSS JOIN LATERAL generate_series(1, 1 + floor(random() * 3 + 0 * n.id)::int) AS k
+                    RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM nuevos), (SELECT count(*) FROM hist), (SELECT count(*) FROM agenda)
+            """), {"desde": desde, "hasta": hasta, "bases": bases, "media": media_contactos})
+        print(f"  {hasta}/{clientes} clientes ({time.monotonic() - inicio:.1f} s)")
+
+    with engine.begin() as conn:
+        # Un perfil por dueño de base privada, con el display que usa su base
+        conn.execute(text("""
+            INSERT INTO users (username, display_base_name)
+            SELECT DISTINCT ON (username) username, split_part(base_name, '__', 2)
+            FROM clientes WHERE base_name LIKE 'vendedor%\\_\\_%'
+            ORDER BY username, base_name
+            ON CONFLICT (username) DO NOTHING
+        """))
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("ANALYZE clientes; ANALYZE contactos; ANALYZE visitas; ANALYZE users"))
+        return {
+            t: conn.execute(text(f"SELECT count(*) FROM {t}")).scalar()
+            for t in ("clientes", "contactos", "visitas", "users", "bases")
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de clientes en una BD local.")
+    parser.add_argument("--clientes", type=int, default=100000, help="10000, 100000, 1000000...")
+    parser.add_argument("--bases", type=int, default=200, help="bases privadas (tamaños sesgados)")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--media-contactos", type=float, default=3.0)
+    parser.add_argument("--limpiar", action="store_true", help="vaciar las tablas antes de generar")
+    parser.add_argument("--forzar", action="store_true", help="permitir una BD que no es local")
+    args = parser.parse_args()
+
+    url = os.environ.get("MYLOCALDATA_DATABASE_URL")
+    if not url:
+        print("Definir MYLOCALDATA_DATABASE_URL (BD Postgres local)")
+        return 2
+    if not _es_local(url) and not args.forzar:
+        print("La BD no es local; usar --forzar si de verdad se quiere llenar con datos de prueba")
+        return 2
+
+    engine = create_engine(url)
+    print(f"Generando {args.clientes} clientes en {args.bases} bases privadas + TRANSLOGISTIC...")
+    conteos = generar(engine, args.clientes, args.bases, args.semilla, args.media_contactos, args.limpiar)
+    for tabla, n in conteos.items():
+        print(f"  {tabla}: {n}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
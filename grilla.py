@@ -0,0 +1,127 @@
+from collections.abc import Mapping
+
+import pandas as pd
+
+# --------------------------
+# Cambios hechos en el grid de AgGrid (sin Streamlit, para poder probarlos aparte)
+# --------------------------
+# Valores que AgGrid devuelve para una celda de fecha vacía
+_FECHAS_VACIAS = ("", "None", "none", "null", "NULL", "NaT", "nan", "{}", "{ }")
+
+def _normalizar_fechas(serie: pd.Series) -> pd.Series:
+    """
+    Normaliza una columna completa de fechas (date, datetime, str ISO o dict del editor
+    de AgGrid) a texto 'YYYY-MM-DD' o None, en una sola pasada vectorizada.
+    """
+    valores = serie.astype(object)
+    # El editor de fechas a veces devuelve {"date": ...}; solo esas celdas se tratan aparte
+    es_dict = valores.map(lambda v: isinstance(v, dict))
+    if es_dict.any():
+        valores = valores.copy()
+        valores[es_dict] = valores[es_dict].map(
+            lambda d: d.get("date") or d.get("value") or next(iter(d.values()), None)
+        )
+    valores = valores.where(~valores.astype(str).str.strip().isin(_FECHAS_VACIAS), None)
+    # format="mixed" + utc=True: cada celda puede venir en un formato distinto
+    # (date de la BD, "YYYY-MM-DD", o ISO "...Z" del editor) y aun así se convierte en bloque
+    fechas = pd.to_datetime(valores, errors="coerce", utc=True, format="mixed")
+    texto = fechas.dt.strftime("%Y-%m-%d").astype(object)
+    return texto.where(fechas.notna(), None)
+
+def _normalizar_booleanos(serie: pd.Series) -> pd.Series:
+    # True/False, "true"/"false", 1/0, "sí"/"no" -> bool; vacío -> False
+    texto = serie.astype(str).str.strip().str.lower()
+    return texto.isin(["true", "t", "1", "1.0", "si", "sí", "yes"])
+
+def _normalizar_textos(serie: pd.Series) -> pd.Series:
+    # None/NaN y "" se consideran el mismo valor (celda vacía)
+    valores = serie.astype(object)
+    return valores.where(valores.notna(), "").astype(str)
+
+def diferencias_grid(original: pd.DataFrame, editado: pd.DataFrame, display_to_db: dict) -> list:
+    """
+    Compara, columna por columna y de forma vectorizada, el DataFrame que se entregó al grid
+    (columnas display + 'id') con el que devolvió AgGrid.
+    Retorna [(cliente_id, {columna_db: valor_nuevo}), ...] solo con las celdas que cambiaron;
+    lista vacía si no hubo cambios reales.
+    """
+    if original is None or editado is None or original.empty or editado.empty:
+        return []
+    if "id" not in original.columns or "id" not in editado.columns:
+        return []
+
+    def _indexar(df):
+        ids = pd.to_numeric(df["id"], errors="coerce")
+        df = df[ids.notna()]
+        return df.set_index(ids[ids.notna()].astype("int64"))
+
+    orig = _indexar(original)
+    edit = _indexar(editado)
+    edit = edit[~edit.index.duplicated()]
+    ids = edit.index.intersection(orig.index)
+    if ids.empty:
+        return []
+    orig = orig.loc[ids]
+    edit = edit.loc[ids]
+
+    cambiados = {}
+    nuevos = {}
+    for disp_col in edit.columns:
+        db_col = display_to_db.get(disp_col)
+        if disp_col == "id" or not db_col or disp_col not in orig.columns:
+            continue
+        if db_col == "fecha_contacto":
+            antes, despues = _normalizar_fechas(orig[disp_col]), _normalizar_fechas(edit[disp_col])
+            distinto = antes.fillna("") != despues.fillna("")
+            valor = despues
+        elif db_col == "contactado":
+            antes, despues = _normalizar_booleanos(orig[disp_col]), _normalizar_booleanos(edit[disp_col])
+            distinto = antes != despues
+            valor = despues
+        else:
+            distinto = _normalizar_textos(orig[disp_col]) != _normalizar_textos(edit[disp_col])
+            crudo = edit[disp_col].astype(object)
+            valor = crudo.where(crudo.notna(), None)
+        if distinto.any():
+            cambiados[db_col] = distinto
+            nuevos[db_col] = valor
+
+    if not cambiados:
+        return []
+
+    mascara = pd.DataFrame(cambiados)
+    filas = mascara.index[mascara.any(axis=1)]
+    resultado = []
+    for cliente_id in filas:
+        updates = {}
+        for col in mascara.columns:
+            if mascara.at[cliente_id, col]:
+                v = nuevos[col].at[cliente_id]
+                # Tipos nativos de Python (numpy.bool_ / numpy.int64 no los adapta psycopg2)
+                updates[col] = v.item() if hasattr(v, "item") else v
+        resultado.append((int(cliente_id), updates))
+    return resultado
+
+def ids_seleccionados(seleccion) -> list:
+    """
+    Extrae los ids (int) de las filas seleccionadas en AgGrid, venga la selección como
+    DataFrame (versiones nuevas de st_aggrid) o como lista de dicts/Series.
+    """
+    if seleccion is None:
+        return []
+    if isinstance(seleccion, pd.DataFrame):
+        valores = seleccion["id"].tolist() if "id" in seleccion.columns else []
+    else:
+        valores = []
+        for row in seleccion:
+            if hasattr(row, "to_dict"):
+                row = row.to_dict()
+            if isinstance(row, Mapping):
+                valores.append(row.get("id"))
+    ids = []
+    for v in valores:
+        try:
+            ids.append(int(v))
+        except (TypeError, ValueError):
+            continue
+    return ids
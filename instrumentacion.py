@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+
+# --------------------------
+# Instrumentación de SQL: duración, filas y función de db.py que originó cada sentencia
+# --------------------------
+# Módulos cuyas funciones se consideran "llamadoras" (el primer frame de estos módulos gana)
+MODULOS_INSTRUMENTADOS = {"db", "exportar", "migraciones"}
+# Duraciones guardadas por función para los percentiles (las más recientes)
+MUESTRAS_POR_FUNCION = 2000
+
+_stats_lock = threading.Lock()
+_duraciones = {}            # funcion -> deque de ms
+_totales = {}               # funcion -> [consultas, ms_total, filas_total]
+_consultas_por_rerun = deque(maxlen=500)
+_local = threading.local()
+
+_log_lento = logging.getLogger("mylocaldata.sql_lento")
+_umbral_lento_ms = None
+
+_RE_ESPACIOS = re.compile(r"\s+")
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAMETRO = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+\b")
+_RE_GRUPOS = re.compile(r"\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))+")
+_RE_LISTA = re.compile(r"\?(?:, \?)+")
+
+@lru_cache(maxsize=1024)
+def normalizar_sql(sql: str) -> str:
+    """
+    Forma canónica de una sentencia para agruparla: sin saltos de línea, literales y
+    parámetros como "?", y listas/lotes de VALUES colapsados ("(?, ?), ..." -> "(?, ?), ...").
+    """
+    sql = _RE_ESPACIOS.sub(" ", sql).strip()
+    sql = _RE_TEXTO.sub("?", sql)
+    sql = _RE_PARAMETRO.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_GRUPOS.sub(lambda m: m.group(0)[:m.group(0).index(")") + 1] + ", ...", sql)
+    return _RE_LISTA.sub("?, ...", sql)
+
+def _funcion_llamadora():
+    # Recorre la pila hasta el primer frame de db.py/exportar.py; las funciones anidadas
+    # (p. ej. el _leer de obtener_clientes) se reportan con el nombre de su función externa
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__") in MODULOS_INSTRUMENTADOS:
+            nombre = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+            return nombre.split(".<locals>")[0]
+        frame = frame.f_back
+    return "(otro)"
+
+def _registrar(funcion, sql, ms, filas):
+    with _stats_lock:
+        muestras = _duraciones.get(funcion)
+        if muestras is None:
+            muestras = _duraciones[funcion] = deque(maxlen=MUESTRAS_POR_FUNCION)
+            _totales[funcion] = [0, 0.0, 0]
+        muestras.append(ms)
+        tot = _totales[funcion]
+        tot[0] += 1
+        tot[1] += ms
+        tot[2] += max(filas, 0)
+
+    conteo = getattr(_local, "conteo", None)
+    if conteo is not None:
+        conteo.consultas += 1
+        conteo.ms += ms
+
+    if _umbral_lento_ms is not None and ms >= _umbral_lento_ms:
+        _log_lento.warning(json.dumps({
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "funcion": funcion,
+            "ms": round(ms, 1),
+            "filas": filas,
+            "sql": normalizar_sql(sql),
+        }, ensure_ascii=False))
+
+def instrumentar(engine, umbral_lento_ms=500, ruta_log=None, max_bytes=5 * 1024 * 1024, respaldos=5):
+    """
+    Registra los hooks de ejecución en engine. Las sentencias que tarden umbral_lento_ms o
+    más se escriben (una línea JSON, sin parámetros) en ruta_log, que rota por tamaño.
+    """
+    global _umbral_lento_ms
+    _umbral_lento_ms = umbral_lento_ms
+    if ruta_log and not _log_lento.handlers:
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_log)), exist_ok=True)
+        handler = RotatingFileHandler(ruta_log, maxBytes=max_bytes, backupCount=respaldos, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _log_lento.addHandler(handler)
+        _log_lento.setLevel(logging.WARNING)
+        _log_lento.propagate = False
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._instr_inicio = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = getattr(context, "_instr_inicio", None)
+        if inicio is None:
+            return
+        ms = (time.perf_counter() - inicio) * 1000
+        # Con cursores del servidor (stream_results) rowcount aún no se conoce: queda en -1
+        filas = getattr(cursor, "rowcount", -1)
+        _registrar(_funcion_llamadora(), statement, ms, filas if filas is not None else -1)
+
+class ConteoRerun:
+    """Consultas y milisegundos de SQL acumulados durante un rerun de Streamlit."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.ms = 0.0
+
+def iniciar_conteo_rerun(anterior=None):
+    """
+    Llamar al comienzo de cada rerun (en el hilo del script). Cierra el conteo del rerun
+    anterior de la sesión (si se pasa) y retorna el nuevo.
+    """
+    if anterior is not None:
+        with _stats_lock:
+            _consultas_por_rerun.append((anterior.consultas, anterior.ms))
+    _local.conteo = ConteoRerun()
+    return _local.conteo
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    k = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[k]
+
+def resumen_por_funcion():
+    """Lista de dicts por función: consultas, p50/p95/p99 (ms), ms totales y filas promedio."""
+    with _stats_lock:
+        datos = [(f, sorted(m), list(_totales[f])) for f, m in _duraciones.items()]
+    filas = []
+    for funcion, ordenadas, (n, ms_total, filas_total) in datos:
+        filas.append({
+            "funcion": funcion,
+            "consultas": n,
+            "p50_ms": round(_percentil(ordenadas, 50), 1),
+            "p95_ms": round(_percentil(ordenadas, 95), 1),
+            "p99_ms": round(_percentil(ordenadas, 99), 1),
+            "total_ms": round(ms_total, 1),
+            "filas_prom": round(filas_total / n, 1) if n else 0,
+        })
+    return sorted(filas, key=lambda f: -f["total_ms"])
+
+def resumen_reruns():
+    """Consultas por rerun (reruns ya terminados): último, p50, p95 y máximo."""
+    with _stats_lock:
+        consultas = [c for c, _ in _consultas_por_rerun]
+    if not consultas:
+        return {"reruns": 0, "ultimo": 0, "p50": 0, "p95": 0, "max": 0}
+    ordenadas = sorted(consultas)
+    return {
+        "reruns": len(consultas),
+        "ultimo": consultas[-1],
+        "p50": _percentil(ordenadas, 50),
+        "p95": _percentil(ordenadas, 95),
+        "max": ordenadas[-1],
+    }
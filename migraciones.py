@@ -0,0 +1,441 @@
+import logging
+
+from sqlalchemy import text
+
+# --------------------------
+# Migraciones del esquema (se aplican una sola vez por BD, en orden)
+# --------------------------
+# Llave del advisory lock que serializa las migraciones entre procesos de la app
+LLAVE_LOCK_MIGRACIONES = 72640113
+
+_log = logging.getLogger("mylocaldata.migraciones")
+
+# --------------------------
+# Funciones de trigger compartidas por varias migraciones
+# --------------------------
+# Cada migración que cambia una de estas funciones vuelve a crearla entera (CREATE OR REPLACE)
+# con su variante; el cuerpo se arma aquí una sola vez para que las versiones no se separen.
+
+def _sql_catalogo_bases(salen_en_update="viejas", entran_en_update="nuevas", al_editar=""):
+    """
+    CREATE OR REPLACE de catalogo_bases_sync(). salen_en_update / entran_en_update: filas que en
+    un UPDATE restan / suman al conteo de su base (una tabla de transición o una subconsulta);
+    al_editar: sentencias que además corren en cada UPDATE.
+    """
+    def restar(fuente):
+        return f"""
+                UPDATE bases b
+                SET total_clientes = b.total_clientes - v.n, actualizado_en = now()
+                FROM (SELECT base_name, count(*) AS n FROM {fuente} AS s GROUP BY base_name) v
+                WHERE b.base_name = v.base_name;
+                GET DIAGNOSTICS salieron = ROW_COUNT;"""
+
+    def sumar(fuente):
+        return f"""
+                INSERT INTO bases (base_name, total_clientes, actualizado_en)
+                SELECT base_name, count(*), now() FROM {fuente} AS e
+                WHERE base_name IS NOT NULL
+                GROUP BY base_name
+                ON CONFLICT (base_name) DO UPDATE
+                SET total_clientes = bases.total_clientes + EXCLUDED.total_clientes,
+                    actualizado_en = now();"""
+
+    return f"""
+        CREATE OR REPLACE FUNCTION catalogo_bases_sync() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            salieron BIGINT := 0;
+        BEGIN
+            -- Triggers por sentencia con tablas de transición: un import masivo
+            -- actualiza el catálogo una sola vez por base, no una vez por fila
+            IF TG_OP = 'UPDATE' THEN
+                {al_editar}{restar(salen_en_update)}{sumar(entran_en_update)}
+            ELSIF TG_OP = 'DELETE' THEN{restar("viejas")}
+            ELSE{sumar("nuevas")}
+            END IF;
+            -- Solo lo que salió de una base puede dejarla en cero
+            IF salieron > 0 THEN
+                DELETE FROM bases WHERE total_clientes <= 0;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+    """
+
+def _sql_registrar_cambio(avisar=False, campos_aviso=""):
+    """
+    CREATE OR REPLACE de registrar_cambio_replica(): registra en cambios_replica la llave de
+    cada fila tocada (TG_ARGV[0] es la columna llave). Con avisar=True además publica la
+    sentencia en el canal mylocaldata_cambios; campos_aviso agrega pares al JSON del aviso
+    (", ''clave'', expresión", con las comillas duplicadas del format()).
+    """
+    aviso = ""
+    if avisar:
+        aviso = f"""
+
+            -- Aviso: hasta 100 claves (ids de cliente o usernames) y 20 bases; null si son más.
+            -- Así el payload queda lejos del límite de 8000 bytes de NOTIFY
+            origen := CASE TG_OP WHEN 'INSERT' THEN 'nuevas' WHEN 'DELETE' THEN 'viejas'
+                      ELSE '(SELECT * FROM nuevas UNION ALL SELECT * FROM viejas)' END;
+            cliente := CASE WHEN TG_TABLE_NAME IN ('contactos', 'visitas') THEN 't.cliente_id'
+                       ELSE format('t.%I', TG_ARGV[0]) END;
+            bases := CASE WHEN TG_TABLE_NAME = 'clientes'
+                     THEN 'CASE WHEN count(DISTINCT t.base_name) <= 20 THEN json_agg(DISTINCT t.base_name) END'
+                     ELSE 'NULL' END;
+            -- En UPDATE el origen trae cada fila dos veces (vieja y nueva)
+            EXECUTE format('SELECT count(*), json_build_object(''tabla'', %L, ''op'', %L, ''n'', count(*) / %s,
+                                ''claves'', CASE WHEN count(DISTINCT %s) <= 100 THEN json_agg(DISTINCT %s) END,
+                                ''bases'', %s{campos_aviso})::text
+                            FROM %s AS t', TG_TABLE_NAME, TG_OP, CASE TG_OP WHEN 'UPDATE' THEN 2 ELSE 1 END,
+                           cliente, cliente, bases, origen)
+                INTO filas, aviso;
+            IF filas > 0 THEN
+                PERFORM pg_notify('mylocaldata_cambios', aviso);
+            END IF;"""
+    return f"""
+        CREATE OR REPLACE FUNCTION registrar_cambio_replica() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            origen TEXT;
+            cliente TEXT;
+            bases TEXT;
+            filas BIGINT;
+            aviso TEXT;
+        BEGIN
+            -- Por sentencia, como el catálogo de bases; TG_ARGV[0] es la columna llave.
+            -- Los borrados quedan registrados igual que las escrituras (la réplica ve que la fila ya no está)
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format('INSERT INTO cambios_replica (tabla, clave) SELECT %L, (%I)::text FROM nuevas',
+                               TG_TABLE_NAME, TG_ARGV[0]);
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                EXECUTE format('INSERT INTO cambios_replica (tabla, clave) SELECT %L, (%I)::text FROM viejas',
+                               TG_TABLE_NAME, TG_ARGV[0]);
+            END IF;{aviso}
+            RETURN NULL;
+        END;
+        $$;
+    """
+
+# --------------------------
+# Migraciones, en orden de versión
+# --------------------------
+def _m001_esquema_inicial(conn):
+    # Tabla principal clientes (agregada columna direccion)
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS clientes (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT,
+            nit TEXT,
+            contacto TEXT,
+            telefono TEXT,
+            email TEXT,
+            ciudad TEXT,
+            direccion TEXT,
+            fecha_contacto DATE,
+            observacion TEXT,
+            contactado BOOLEAN DEFAULT FALSE,
+            username TEXT,
+            base_name TEXT,
+            tipo_operacion TEXT,
+            modalidad TEXT,
+            origen TEXT,
+            destino TEXT,
+            mercancia TEXT
+        );
+    """))
+
+    # Asegurar columnas existentes en caso de migración
+    conn.execute(text("ALTER TABLE clientes ADD COLUMN IF NOT EXISTS base_name TEXT;"))
+
+    # Índices para búsqueda rápida
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_username ON clientes(username);"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_base_name ON clientes(base_name);"))
+
+    # Normalizar base_name faltante a TRANSLOGISTIC
+    conn.execute(text("UPDATE clientes SET base_name = 'TRANSLOGISTIC' WHERE base_name IS NULL;"))
+
+    # Tabla para persistir el nombre mostrado de la base privada por usuario
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            display_base_name TEXT
+        );
+    """))
+
+    # Tabla para historial de contactos por cliente
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS contactos (
+            id SERIAL PRIMARY KEY,
+            cliente_id INTEGER REFERENCES clientes(id) ON DELETE CASCADE,
+            fecha DATE,
+            tipo TEXT,
+            notas TEXT DEFAULT ''
+        );
+    """))
+
+    # Tabla para agenda de visitas/recordatorios (sin notificaciones externas)
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS visitas (
+            id SERIAL PRIMARY KEY,
+            cliente_id INTEGER REFERENCES clientes(id) ON DELETE CASCADE,
+            fecha DATE,
+            medio TEXT,
+            creado_por TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """))
+
+def _m002_paginacion_keyset(conn):
+    # Índice para la paginación keyset por base + estado de contacto
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_base_contactado_id ON clientes(base_name, contactado, id);"))
+    # Antes se normalizaba base_name NULL en cada recarga; ahora lo garantiza el default
+    conn.execute(text("ALTER TABLE clientes ALTER COLUMN base_name SET DEFAULT 'TRANSLOGISTIC';"))
+
+def _m003_catalogo_bases(conn):
+    # Catálogo de bases: filas por base y última modificación, mantenido por triggers
+    # (así el panel admin no necesita leer toda la tabla clientes)
+    crear_catalogo = conn.execute(text("SELECT to_regclass('public.bases') IS NULL")).scalar()
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS bases (
+            base_name TEXT PRIMARY KEY,
+            total_clientes INTEGER NOT NULL DEFAULT 0,
+            actualizado_en TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """))
+    conn.execute(text(_sql_catalogo_bases()))
+    conn.execute(text("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_catalogo_bases_ins') THEN
+                CREATE TRIGGER trg_catalogo_bases_ins AFTER INSERT ON clientes
+                    REFERENCING NEW TABLE AS nuevas
+                    FOR EACH STATEMENT EXECUTE FUNCTION catalogo_bases_sync();
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_catalogo_bases_upd') THEN
+                CREATE TRIGGER trg_catalogo_bases_upd AFTER UPDATE ON clientes
+                    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+                    FOR EACH STATEMENT EXECUTE FUNCTION catalogo_bases_sync();
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_catalogo_bases_del') THEN
+                CREATE TRIGGER trg_catalogo_bases_del AFTER DELETE ON clientes
+                    REFERENCING OLD TABLE AS viejas
+                    FOR EACH STATEMENT EXECUTE FUNCTION catalogo_bases_sync();
+            END IF;
+        END;
+        $$;
+    """))
+    if crear_catalogo:
+        # Primera vez: poblar el catálogo con lo que ya existe en clientes
+        conn.execute(text("""
+            INSERT INTO bases (base_name, total_clientes, actualizado_en)
+            SELECT base_name, count(*), now() FROM clientes
+            WHERE base_name IS NOT NULL
+            GROUP BY base_name
+            ON CONFLICT (base_name) DO NOTHING
+        """))
+
+def _m004_nit_normalizado(conn):
+    # NIT normalizado (solo dígitos/letras en minúscula) para el upsert de la importación masiva
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION normalizar_nit(valor TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT NULLIF(regexp_replace(lower(coalesce(valor, '')), '[^0-9a-z]', '', 'g'), '')
+        $$;
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_base_nit_norm ON clientes(base_name, normalizar_nit(nit));"))
+
+def _m005_busqueda_trigramas(conn):
+    # Búsqueda aproximada sin tildes (pg_trgm + unaccent). Si el usuario de la BD no puede
+    # crear extensiones la migración falla, buscar_clientes usa ILIKE y se reintenta al reiniciar.
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent;"))
+    # unaccent() es STABLE; el envoltorio IMMUTABLE permite usarlo en un índice
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION f_unaccent(valor TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$
+            SELECT public.unaccent('public.unaccent'::regdictionary, valor)
+        $$;
+    """))
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION texto_busqueda_cliente(
+            nombre TEXT, nit TEXT, contacto TEXT, ciudad TEXT, email TEXT, telefono TEXT
+        ) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT lower(f_unaccent(concat_ws(' ', nombre, nit, contacto, ciudad, email, telefono)))
+        $$;
+    """))
+    conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_clientes_busqueda_trgm ON clientes
+        USING gin (texto_busqueda_cliente(nombre, nit, contacto, ciudad, email, telefono) gin_trgm_ops);
+    """))
+
+def _m006_indices_por_consulta(conn):
+    # Índices compuestos alineados con las consultas de db.py (ver tests/test_planes_consultas.py)
+    # Lecturas completas de una base en orden de id (exportaciones, índice de búsqueda, obtener_clientes)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_base_id ON clientes(base_name, id);"))
+    # Vistas de admin filtradas por usuario: mismo patrón keyset que por base
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_clientes_username_contactado_id ON clientes(username, contactado, id);"))
+    # Historial y agenda del cliente: WHERE cliente_id = ? ORDER BY fecha DESC (y el ON DELETE CASCADE)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_contactos_cliente_fecha ON contactos(cliente_id, fecha DESC);"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_visitas_cliente_fecha ON visitas(cliente_id, fecha DESC);"))
+    # Quedan cubiertos por los compuestos (mismo prefijo) y solo encarecían las escrituras
+    conn.execute(text("DROP INDEX IF EXISTS idx_clientes_base_name;"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_clientes_username;"))
+
+def _m007_registro_cambios(conn):
+    # Registro de cambios para la réplica local (replica.py): una fila por fila tocada, con el
+    # txid de la transacción que la escribió. La réplica pide "todo desde el xmin de su última
+    # lectura", así no se pierde lo que otra transacción aún no había confirmado.
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS cambios_replica (
+            id BIGSERIAL PRIMARY KEY,
+            tabla TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            txid BIGINT NOT NULL DEFAULT txid_current(),
+            registrado_en TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_cambios_replica_txid ON cambios_replica(txid);"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_cambios_replica_registrado ON cambios_replica(registrado_en);"))
+    conn.execute(text(_sql_registrar_cambio()))
+    for tabla, llave in (("clientes", "id"), ("contactos", "id"), ("visitas", "id"), ("users", "username")):
+        conn.execute(text(f"""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_replica_{tabla}_ins') THEN
+                    CREATE TRIGGER trg_replica_{tabla}_ins AFTER INSERT ON {tabla}
+                        REFERENCING NEW TABLE AS nuevas
+                        FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambio_replica('{llave}');
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_replica_{tabla}_upd') THEN
+                    CREATE TRIGGER trg_replica_{tabla}_upd AFTER UPDATE ON {tabla}
+                        REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+                        FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambio_replica('{llave}');
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_replica_{tabla}_del') THEN
+                    CREATE TRIGGER trg_replica_{tabla}_del AFTER DELETE ON {tabla}
+                        REFERENCING OLD TABLE AS viejas
+                        FOR EACH STATEMENT EXECUTE FUNCTION registrar_cambio_replica('{llave}');
+                END IF;
+            END;
+            $$;
+        """))
+
+def _m008_notificar_cambios(conn):
+    # La misma función de la migración 7 publica además cada sentencia en el canal
+    # mylocaldata_cambios (notificaciones.py): tabla, operación, filas y, si no son demasiadas,
+    # los clientes y bases afectados. El aviso sale recién con el COMMIT (y nunca si hay ROLLBACK).
+    conn.execute(text(_sql_registrar_cambio(avisar=True)))
+
+def _m009_proceso_en_avisos(conn):
+    # Los avisos llevan además "proceso": el application_name de la conexión que escribió, que
+    # db.py fija por proceso. Así cada proceso reconoce sus propios avisos (los pids de backend
+    # se reusan y no sirven detrás de un pooler como pgbouncer).
+    conn.execute(text(_sql_registrar_cambio(
+        avisar=True, campos_aviso=", ''proceso'', current_setting(''application_name'', true)"
+    )))
+
+def _m010_catalogo_sin_bloqueo(conn):
+    # El trigger de la migración 3 reescribía la fila de la base en `bases` con cada UPDATE a
+    # clientes: las ediciones concurrentes de una misma base hacían cola en ese lock y una
+    # importación lo retenía hasta el COMMIT. Ahora el conteo solo se toca en INSERT, DELETE y en
+    # los UPDATE que mueven filas de base; las demás ediciones se anotan en bases_ediciones, que
+    # solo recibe INSERTs (no comparten fila, no se bloquean). obtener_bases toma la más reciente
+    # como actualizado_en y la poda de cambios_replica deja una sola fila por base.
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS bases_ediciones (
+            base_name TEXT NOT NULL,
+            editado_en TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+        );
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_bases_ediciones_base ON bases_ediciones(base_name, editado_en DESC);"
+    ))
+    # Las transiciones no admiten UPDATE OF base_name: se cruzan vieja y nueva por id
+    conn.execute(text(_sql_catalogo_bases(
+        salen_en_update="(SELECT v.* FROM viejas v JOIN nuevas n ON n.id = v.id"
+                        " WHERE v.base_name IS DISTINCT FROM n.base_name)",
+        entran_en_update="(SELECT n.* FROM nuevas n JOIN viejas v ON v.id = n.id"
+                         " WHERE n.base_name IS DISTINCT FROM v.base_name)",
+        al_editar="""
+                INSERT INTO bases_ediciones (base_name)
+                SELECT DISTINCT n.base_name
+                FROM nuevas n JOIN viejas v ON v.id = n.id
+                WHERE n.base_name IS NOT NULL AND n.base_name IS NOT DISTINCT FROM v.base_name;""",
+    )))
+
+def _m011_base_name_obligatorio(conn):
+    # El DEFAULT de la migración 2 no cubre un NULL explícito (INSERT o UPDATE), y un cliente
+    # sin base no aparece en ninguna vista: las filas que quedaron así van a TRANSLOGISTIC
+    conn.execute(text("UPDATE clientes SET base_name = 'TRANSLOGISTIC' WHERE base_name IS NULL;"))
+    conn.execute(text("ALTER TABLE clientes ALTER COLUMN base_name SET NOT NULL;"))
+
+# (version, descripción, función, opcional). Nunca reordenar ni renumerar: solo agregar al final.
+# Una migración opcional que falla no se registra y se reintenta en el siguiente arranque.
+MIGRACIONES = [
+    (1, "esquema inicial: clientes, users, contactos, visitas", _m001_esquema_inicial, False),
+    (2, "índice de paginación keyset y default de base_name", _m002_paginacion_keyset, False),
+    (3, "catálogo de bases mantenido por triggers", _m003_catalogo_bases, False),
+    (4, "NIT normalizado para la importación masiva", _m004_nit_normalizado, False),
+    (5, "búsqueda aproximada con pg_trgm/unaccent", _m005_busqueda_trigramas, True),
+    (6, "índices compuestos por patrón de acceso", _m006_indices_por_consulta, False),
+    (7, "registro de cambios para la réplica local", _m007_registro_cambios, False),
+    (8, "avisos de cambios por LISTEN/NOTIFY", _m008_notificar_cambios, False),
+    (9, "proceso que escribió en los avisos de cambios", _m009_proceso_en_avisos, False),
+    (10, "catálogo de bases sin bloquear la fila en cada edición", _m010_catalogo_sin_bloqueo, False),
+    (11, "base_name obligatorio en clientes", _m011_base_name_obligatorio, False),
+]
+
+def _versiones_aplicadas(conn):
+    existe = conn.execute(text("SELECT to_regclass('public.schema_migraciones') IS NOT NULL")).scalar()
+    if not existe:
+        return set()
+    return {v for (v,) in conn.execute(text("SELECT version FROM schema_migraciones"))}
+
+def aplicar_migraciones(engine):
+    """
+    Aplica las migraciones pendientes de MIGRACIONES, cada una en su propia transacción y
+    registrada en schema_migraciones. Un advisory lock evita que dos procesos migren a la vez.
+    Si la BD ya está al día solo cuesta una consulta. Retorna las versiones aplicadas.
+    """
+    with engine.connect() as conn:
+        pendientes = [m for m in MIGRACIONES if m[0] not in _versiones_aplicadas(conn)]
+        conn.commit()
+        if not pendientes:
+            return []
+
+        aplicadas = []
+        conn.execute(text("SELECT pg_advisory_lock(:llave)"), {"llave": LLAVE_LOCK_MIGRACIONES})
+        conn.commit()
+        try:
+            with conn.begin():
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS schema_migraciones (
+                        version INTEGER PRIMARY KEY,
+                        descripcion TEXT,
+                        aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+                    );
+                """))
+            # Releer con el lock tomado: otro proceso pudo migrar mientras esperábamos
+            hechas = _versiones_aplicadas(conn)
+            conn.commit()
+            for version, descripcion, migrar, opcional in MIGRACIONES:
+                if version in hechas:
+                    continue
+                try:
+                    with conn.begin():
+                        migrar(conn)
+                        conn.execute(
+                            text("INSERT INTO schema_migraciones (version, descripcion) VALUES (:v, :d)"),
+                            {"v": version, "d": descripcion}
+                        )
+                    aplicadas.append(version)
+                except Exception as e:
+                    if not opcional:
+                        raise
+                    _log.warning("migración %s (%s) no aplicada: %s", version, descripcion, e)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:llave)"), {"llave": LLAVE_LOCK_MIGRACIONES})
+            conn.commit()
+        return aplicadas
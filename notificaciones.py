@@ -0,0 +1,127 @@
+import json
+import logging
+import select
+import threading
+import time
+
+# --------------------------
+# Avisos de cambios por LISTEN/NOTIFY
+# --------------------------
+# El trigger de cambios_replica (migración 8) publica cada sentencia que escribe en clientes,
+# contactos, visitas o users en CANAL_CAMBIOS con un JSON:
+#   {"tabla", "op" (INSERT/UPDATE/DELETE), "n" (filas),
+#    "claves" (ids de cliente, o usernames en users; null si son más de 100),
+#    "bases" (solo clientes; null si son más de 20),
+#    "proceso" (application_name de la conexión que escribió, migración 9)}
+# Un hilo por proceso mantiene una conexión dedicada escuchando el canal y entrega los avisos,
+# agrupados por ráfaga, a la función que le pasa db.py.
+
+# Debe coincidir con el pg_notify de la migración 8
+CANAL_CAMBIOS = "mylocaldata_cambios"
+
+_log = logging.getLogger("mylocaldata.notificaciones")
+
+class EscuchaCambios:
+    """
+    Hilo que escucha CANAL_CAMBIOS y llama al_notificar(avisos) con la lista de payloads
+    (dicts del trigger) de cada ráfaga. Tras cada (re)conexión llama al_notificar(None): los
+    avisos publicados mientras no se escuchaba se perdieron y hay que ponerse al día por otra vía.
+    """
+
+    def __init__(self, engine, al_notificar, reintento_seg=5, agrupar_seg=0.2):
+        self.engine = engine
+        self.al_notificar = al_notificar
+        self.reintento_seg = reintento_seg
+        # Espera tras el primer aviso para entregar juntos los de una misma ráfaga
+        self.agrupar_seg = agrupar_seg
+        self._detener = threading.Event()
+        self._hilo = None
+        self._conectada = False
+        self._stats = {"avisos": 0, "entregas": 0, "reconexiones": 0, "errores": 0, "ultimo_error": None}
+
+    def _conectar(self):
+        # Conexión fuera del pool: queda ocupada mientras viva el proceso
+        proxy = self.engine.raw_connection()
+        proxy.detach()
+        conn = proxy.dbapi_connection
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {CANAL_CAMBIOS}")
+        cur.close()
+        return conn
+
+    def _entregar(self, avisos):
+        try:
+            self.al_notificar(avisos)
+            self._stats["entregas"] += 1
+        except Exception as e:
+            self._stats["errores"] += 1
+            self._stats["ultimo_error"] = str(e)[:300]
+            _log.warning("falló el manejo de un aviso de cambios (%s)", e)
+
+    def _escuchar(self, conn):
+        while not self._detener.is_set():
+            # Espera con timeout para poder detener el hilo; poll() también detecta la conexión caída
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                conn.poll()
+                continue
+            conn.poll()
+            if self.agrupar_seg:
+                time.sleep(self.agrupar_seg)
+                conn.poll()
+            recibidos, conn.notifies[:] = list(conn.notifies), []
+            avisos = []
+            for n in recibidos:
+                try:
+                    avisos.append(json.loads(n.payload))
+                except ValueError:
+                    avisos.append({})
+            if avisos:
+                self._stats["avisos"] += len(avisos)
+                self._entregar(avisos)
+
+    def _bucle(self):
+        fallando = False
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = self._conectar()
+                self._conectada = True
+                if fallando:
+                    fallando = False
+                    _log.info("escucha de cambios reconectada")
+                self._stats["reconexiones"] += 1
+                self._entregar(None)
+                self._escuchar(conn)
+            except Exception as e:
+                self._stats["errores"] += 1
+                self._stats["ultimo_error"] = str(e)[:300]
+                # Sin BD cada reintento falla igual: solo se avisa el primero
+                _log.log(logging.DEBUG if fallando else logging.WARNING,
+                         "se perdió la escucha de cambios (%s); reintento cada %s s", e, self.reintento_seg)
+                fallando = True
+            finally:
+                self._conectada = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._detener.wait(self.reintento_seg)
+
+    def iniciar(self):
+        """Arranca el hilo de escucha (una vez por proceso)."""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="escucha-cambios", daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+
+    def conectada(self):
+        """True mientras hay una conexión escuchando (los avisos llegan sin consultar la BD)."""
+        return self._conectada
+
+    def estadisticas(self):
+        return {"conectada": self._conectada, **self._stats}
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections import deque
+
+# --------------------------
+# Perfilador de secciones del rerun de Streamlit
+# --------------------------
+# Cada rerun se parte en secciones con nombre (marcadores planos: abrir una cierra la anterior).
+# La historia de cada sesión se escribe en formato Trace Event de Chrome: se abre tal cual en
+# chrome://tracing, https://ui.perfetto.dev o https://www.speedscope.app (vista flamegraph).
+
+# Reruns que se conservan por sesión
+PERFIL_HISTORIAL = 50
+
+_log = logging.getLogger("mylocaldata.perfilador")
+
+def directorio_perfiles():
+    return os.path.join(tempfile.gettempdir(), "mylocaldata_perfiles")
+
+class PerfilRerun:
+    """Secciones cronometradas de un rerun: [(nombre, inicio_us, dur_us, consultas_sql), ...]."""
+
+    def __init__(self, numero, contador=None):
+        self.numero = numero
+        self.inicio_us = time.time_ns() // 1000
+        self.secciones = []
+        self.interrumpido = False
+        self.cerrado = False
+        self._contador = contador      # ConteoRerun de instrumentacion.py (opcional)
+        self._abierta = None           # (nombre, inicio_us, t0, consultas al abrir)
+        self.fin_us = None
+
+    def _consultas(self):
+        return self._contador.consultas if self._contador is not None else 0
+
+    def _cerrar_abierta(self):
+        if self._abierta is None:
+            return
+        nombre, inicio_us, t0, consultas0 = self._abierta
+        dur_us = int((time.perf_counter() - t0) * 1_000_000)
+        self.secciones.append((nombre, inicio_us, dur_us, self._consultas() - consultas0))
+        self._abierta = None
+
+    def seccion(self, nombre):
+        """Cierra la sección en curso (si hay) y abre `nombre`."""
+        if self.cerrado:
+            return
+        self._cerrar_abierta()
+        self._abierta = (nombre, time.time_ns() // 1000, time.perf_counter(), self._consultas())
+
+    def cerrar(self, interrumpido=False):
+        if self.cerrado:
+            return
+        self._cerrar_abierta()
+        self.interrumpido = interrumpido
+        self.fin_us = time.time_ns() // 1000
+        self.cerrado = True
+
+    @property
+    def duracion_ms(self):
+        fin = self.fin_us if self.fin_us is not None else time.time_ns() // 1000
+        return (fin - self.inicio_us) / 1000
+
+    def eventos(self, tid):
+        # Un evento "X" para el rerun completo y uno por sección (anidados por tiempo)
+        eventos = [{
+            "name": f"rerun #{self.numero}" + (" (interrumpido)" if self.interrumpido else ""),
+            "cat": "rerun", "ph": "X", "pid": os.getpid(), "tid": tid,
+            "ts": self.inicio_us, "dur": max(int(self.duracion_ms * 1000), 1),
+        }]
+        for nombre, inicio_us, dur_us, consultas in self.secciones:
+            eventos.append({
+                "name": nombre, "cat": "seccion", "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": inicio_us, "dur": max(dur_us, 1), "args": {"consultas_sql": consultas},
+            })
+        return eventos
+
+def escribir_traza(ruta, sesion, perfiles):
+    """Escribe (reemplazando de forma atómica) la traza de los reruns de una sesión."""
+    eventos = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": 1,
+                "args": {"name": f"sesión {sesion}"}}]
+    for perfil in perfiles:
+        eventos.extend(perfil.eventos(tid=1))
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+def iniciar_perfil_rerun(estado, contador=None, escribir=False, directorio=None):
+    """
+    Llamar al comienzo de cada rerun con st.session_state. Cierra el perfil del rerun anterior
+    (marcándolo interrumpido si no llegó a finalizar_perfil_rerun), lo agrega a la historia de
+    la sesión, y retorna el perfil del rerun actual.
+    """
+    if "_perfil_sesion" not in estado:
+        estado["_perfil_sesion"] = uuid.uuid4().hex[:12]
+        estado["_perfil_historial"] = deque(maxlen=PERFIL_HISTORIAL)
+    anterior = estado.get("_perfil_rerun")
+    if anterior is not None and not anterior.cerrado:
+        anterior.cerrar(interrumpido=True)
+        _guardar(estado, anterior, escribir, directorio)
+
+    numero = anterior.numero + 1 if anterior is not None else 1
+    perfil = PerfilRerun(numero, contador)
+    estado["_perfil_rerun"] = perfil
+    return perfil
+
+def finalizar_perfil_rerun(estado, escribir=False, directorio=None):
+    """Llamar al final del script: cierra el perfil del rerun actual y lo guarda."""
+    perfil = estado.get("_perfil_rerun")
+    if perfil is None or perfil.cerrado:
+        return None
+    perfil.cerrar()
+    return _guardar(estado, perfil, escribir, directorio)
+
+def _guardar(estado, perfil, escribir, directorio):
+    historial = estado["_perfil_historial"]
+    historial.append(perfil)
+    if not escribir:
+        return None
+    ruta = os.path.join(directorio or directorio_perfiles(), f"perfil_{estado['_perfil_sesion']}.json")
+    try:
+        escribir_traza(ruta, estado["_perfil_sesion"], list(historial))
+    except OSError as e:
+        _log.warning("no se pudo escribir el perfil %s (%s)", ruta, e)
+        return None
+    return ruta
+
+def resumen_historial(estado):
+    """ms por sección (promedio y máximo) sobre los reruns guardados de la sesión."""
+    acumulado = {}
+    for perfil in estado.get("_perfil_historial", []):
+        for nombre, _, dur_us, consultas in perfil.secciones:
+            datos = acumulado.setdefault(nombre, [0, 0.0, 0.0, 0])
+            datos[0] += 1
+            datos[1] += dur_us / 1000
+            datos[2] = max(datos[2], dur_us / 1000)
+            datos[3] += consultas
+    return [
+        {"seccion": nombre, "reruns": n, "prom_ms": round(total / n, 1), "max_ms": round(maximo, 1),
+         "consultas_prom": round(consultas / n, 1)}
+        for nombre, (n, total, maximo, consultas) in sorted(acumulado.items(), key=lambda kv: -kv[1][1])
+    ]
@@ -0,0 +1,445 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+_log = logging.getLogger("mylocaldata.replica")
+
+# --------------------------
+# Réplica local de solo lectura (SQLite) de las tablas que lee db.py
+# --------------------------
+# Se sincroniza en segundo plano desde Postgres leyendo cambios_replica (migración 7): cada
+# ronda trae el estado actual de las filas tocadas desde el xmin de la ronda anterior, en una
+# transacción REPEATABLE READ. Las escrituras siguen yendo a Postgres y db.py las aplica
+# aquí después del commit (aplicar) para que cada sesión lea lo que acaba de escribir.
+
+# tabla -> columna llave (las mismas que registran los triggers de cambios_replica)
+TABLAS_REPLICA = {"clientes": "id", "contactos": "id", "visitas": "id", "users": "username"}
+# Borrar un cliente borra su historial (el ON DELETE CASCADE de Postgres)
+_CASCADAS = {"clientes": (("contactos", "cliente_id"), ("visitas", "cliente_id"))}
+_INDICES_SQLITE = (
+    "CREATE INDEX IF NOT EXISTS r_clientes_base ON clientes(base_name, contactado, id)",
+    "CREATE INDEX IF NOT EXISTS r_clientes_username ON clientes(username, contactado, id)",
+    "CREATE INDEX IF NOT EXISTS r_contactos_cliente ON contactos(cliente_id, fecha)",
+    "CREATE INDEX IF NOT EXISTS r_visitas_cliente ON visitas(cliente_id, fecha)",
+)
+# Filas por lote al copiar/traer de Postgres (también acota los parámetros de cada IN en SQLite)
+LOTE_SINCRONIZACION = 5000
+
+def ruta_por_defecto():
+    return os.path.join(tempfile.gettempdir(), "mylocaldata_replica.sqlite3")
+
+def _tipo_columna(tipo_pg):
+    if tipo_pg == "boolean":
+        return "bool"
+    if tipo_pg == "date":
+        return "date"
+    if tipo_pg.startswith("timestamp"):
+        return "datetime"
+    if tipo_pg in ("integer", "bigint", "smallint"):
+        return "int"
+    if tipo_pg in ("numeric", "real", "double precision"):
+        return "float"
+    return "text"
+
+_TIPOS_SQLITE = {"bool": "INTEGER", "date": "TEXT", "datetime": "TEXT", "int": "INTEGER", "float": "REAL", "text": "TEXT"}
+
+def _a_sqlite(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, bool):
+        return int(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if hasattr(valor, "item"):
+        valor = valor.item()
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return valor
+
+def _fecha(valor):
+    return date.fromisoformat(valor[:10]) if isinstance(valor, str) and valor else None
+
+def marca_actual(conn):
+    """Marca de agua para leer_cambios: xmin del snapshot (toda transacción anterior ya terminó)."""
+    return int(conn.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar())
+
+def leer_cambios(conn, desde, tablas=tuple(TABLAS_REPLICA)):
+    """
+    Filas tocadas por transacciones con txid >= desde (una marca anterior de marca_actual).
+    Retorna {tabla: (filas, eliminadas)}: el estado actual de cada fila tocada (dicts) y las
+    claves que ya no existen (borradas). Correr en la misma transacción REPEATABLE READ que la
+    marca nueva para que ambas vean el mismo snapshot. Puede repetir filas ya leídas: aplicar
+    los cambios debe ser idempotente. Cuesta en proporción a los cambios, no al tamaño de la tabla.
+    """
+    por_tabla = {}
+    for tabla, clave in conn.execute(text(
+        "SELECT DISTINCT tabla, clave FROM cambios_replica WHERE txid >= :desde AND tabla = ANY(:tablas)"
+    ), {"desde": desde, "tablas": list(tablas)}):
+        por_tabla.setdefault(tabla, set()).add(clave)
+
+    leidos = {}
+    for tabla, claves in por_tabla.items():
+        llave = TABLAS_REPLICA[tabla]
+        claves = [int(c) for c in claves] if llave == "id" else list(claves)
+        encontradas = []
+        for i in range(0, len(claves), LOTE_SINCRONIZACION):
+            encontradas.extend(dict(f) for f in conn.execute(
+                text(f"SELECT * FROM {tabla} WHERE {llave} = ANY(:claves)"),
+                {"claves": claves[i:i + LOTE_SINCRONIZACION]}
+            ).mappings())
+        presentes = {f[llave] for f in encontradas}
+        leidos[tabla] = (encontradas, [c for c in claves if c not in presentes])
+    return leidos
+
+def podar_cambios(engine, horas):
+    """
+    Borra de cambios_replica lo registrado hace más de `horas` (ninguna réplica lo necesita ya).
+    De paso deja en bases_ediciones solo la última edición de cada base (la única que se lee).
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            DELETE FROM bases_ediciones e
+            WHERE EXISTS (SELECT 1 FROM bases_ediciones m
+                          WHERE m.base_name = e.base_name AND m.editado_en > e.editado_en)
+               OR NOT EXISTS (SELECT 1 FROM bases b WHERE b.base_name = e.base_name)
+        """))
+        return conn.execute(text(
+            "DELETE FROM cambios_replica WHERE registrado_en < now() - make_interval(hours => :h)"
+        ), {"h": int(horas)}).rowcount
+
+class ReplicaLocal:
+    """
+    Copia SQLite de clientes, contactos, visitas y users. Solo debe usarse para leer cuando
+    vigente(max_retraso) es True; si no, el llamador va a Postgres.
+    al_cambiar(cambios) se llama tras cada ronda que trajo cambios de otros procesos, con
+    {"bases": set, "clientes": [filas], "clientes_eliminados": [ids], "users": [usernames],
+    "historial": set de cliente_id cuyos contactos/visitas cambiaron}.
+    """
+
+    def __init__(self, engine, ruta=None, intervalo_seg=5, retencion_horas=24, al_cambiar=None):
+        self.engine = engine
+        self.ruta = ruta or ruta_por_defecto()
+        self.intervalo_seg = intervalo_seg
+        self.retencion_horas = retencion_horas
+        self.al_cambiar = al_cambiar
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()        # una ronda de sincronización a la vez
+        self._escritura_lock = threading.Lock()   # escrituras en SQLite (ronda o aplicar)
+        self._tipos = None                        # tabla -> {columna: tipo}
+        self._escritas = {}                       # (tabla, clave) -> monotonic de la escritura local
+        self._ultima_ok = None                    # monotonic del inicio de la última ronda correcta
+        self._fallando = False                    # la última ronda falló (solo se avisa la primera)
+        self._min_inicio = 0.0                    # rondas que empezaron antes no cuentan (invalidar)
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._stats = {"rondas": 0, "copias_completas": 0, "filas_aplicadas": 0,
+                       "errores": 0, "ultimo_error": None, "ms_ultima_ronda": None}
+
+    # --- SQLite ---
+    def _conexion(self):
+        # Una conexión por hilo; WAL deja leer mientras la ronda escribe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS replica_meta (clave TEXT PRIMARY KEY, valor TEXT)")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, clave):
+        fila = self._conexion().execute("SELECT valor FROM replica_meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def _guardar_meta(self, conn, **valores):
+        conn.executemany("INSERT OR REPLACE INTO replica_meta (clave, valor) VALUES (?, ?)",
+                         [(k, str(v)) for k, v in valores.items()])
+
+    def _preparar(self, pg):
+        # Esquema de la réplica = columnas actuales de Postgres; si cambió, se rehace desde cero
+        columnas = {}
+        for tabla, columna, tipo in pg.execute(text("""
+            SELECT table_name, column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ANY(:tablas)
+            ORDER BY table_name, ordinal_position
+        """), {"tablas": list(TABLAS_REPLICA)}):
+            columnas.setdefault(tabla, {})[columna] = _tipo_columna(tipo)
+        esquema = json.dumps(columnas, sort_keys=True)
+
+        conn = self._conexion()
+        if self._meta("esquema") != esquema:
+            with self._escritura_lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for tabla, cols in columnas.items():
+                        llave = TABLAS_REPLICA[tabla]
+                        definicion = ", ".join(
+                            f'"{c}" {_TIPOS_SQLITE[t]}' + (" PRIMARY KEY" if c == llave else "") for c, t in cols.items()
+                        )
+                        conn.execute(f'DROP TABLE IF EXISTS "{tabla}"')
+                        conn.execute(f'CREATE TABLE "{tabla}" ({definicion})')
+                    for indice in _INDICES_SQLITE:
+                        conn.execute(indice)
+                    conn.execute("DELETE FROM replica_meta")
+                    self._guardar_meta(conn, esquema=esquema)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        self._tipos = columnas
+
+    def _insertar(self, conn, tabla, filas):
+        cols = list(self._tipos[tabla])
+        nombres = ", ".join(f'"{c}"' for c in cols)
+        sql = f'INSERT OR REPLACE INTO "{tabla}" ({nombres}) VALUES ({", ".join("?" * len(cols))})'
+        conn.executemany(sql, [tuple(_a_sqlite(f.get(c)) for c in cols) for f in filas])
+
+    def _borrar(self, conn, tabla, claves):
+        llave = TABLAS_REPLICA[tabla]
+        claves = list(claves)
+        for i in range(0, len(claves), LOTE_SINCRONIZACION):
+            lote = claves[i:i + LOTE_SINCRONIZACION]
+            marcas = ", ".join("?" * len(lote))
+            conn.execute(f'DELETE FROM "{tabla}" WHERE "{llave}" IN ({marcas})', lote)
+            for hija, columna in _CASCADAS.get(tabla, ()):
+                conn.execute(f'DELETE FROM "{hija}" WHERE "{columna}" IN ({marcas})', lote)
+
+    def _bases_de(self, conn, ids):
+        bases = set()
+        ids = list(ids)
+        for i in range(0, len(ids), LOTE_SINCRONIZACION):
+            lote = ids[i:i + LOTE_SINCRONIZACION]
+            bases.update(b for (b,) in conn.execute(
+                f"SELECT base_name FROM clientes WHERE id IN ({', '.join('?' * len(lote))})", lote))
+        return bases
+
+    def _clientes_de(self, conn, tabla, ids):
+        # cliente_id de filas de contactos/visitas que todavía están en la réplica
+        clientes = set()
+        for i in range(0, len(ids), LOTE_SINCRONIZACION):
+            lote = ids[i:i + LOTE_SINCRONIZACION]
+            clientes.update(c for (c,) in conn.execute(
+                f'SELECT cliente_id FROM "{tabla}" WHERE id IN ({", ".join("?" * len(lote))})', lote))
+        return clientes
+
+    # --- Sincronización ---
+    def _copiar_todo(self, pg, inicio):
+        conn = self._conexion()
+        with self._escritura_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for tabla in TABLAS_REPLICA:
+                    conn.execute(f'DELETE FROM "{tabla}"')
+                    resultado = pg.execution_options(stream_results=True).execute(text(f"SELECT * FROM {tabla}"))
+                    while True:
+                        filas = resultado.mappings().fetchmany(LOTE_SINCRONIZACION)
+                        if not filas:
+                            break
+                        self._insertar(conn, tabla, filas)
+                        self._stats["filas_aplicadas"] += len(filas)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            # Lo escrito localmente durante la copia pudo quedar pisado: no servir hasta la próxima ronda
+            if any(t > inicio for t in self._escritas.values()):
+                self._min_inicio = time.monotonic()
+        self._stats["copias_completas"] += 1
+
+    def _aplicar_cambios(self, pg, desde, inicio):
+        leidos = leer_cambios(pg, desde)
+        if not leidos:
+            return None
+
+        conn = self._conexion()
+        cambios = {"bases": set(), "clientes": [], "clientes_eliminados": [], "users": [], "historial": set()}
+        with self._escritura_lock:
+            # Lo que este proceso escribió después de empezar la ronda ya está aquí y es más nuevo
+            def _propia(tabla, clave):
+                return self._escritas.get((tabla, str(clave)), 0) > inicio
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for tabla, (vivas, borradas) in leidos.items():
+                    llave = TABLAS_REPLICA[tabla]
+                    filas = [f for f in vivas if not _propia(tabla, f[llave])]
+                    eliminadas = [c for c in borradas if not _propia(tabla, c)]
+                    if tabla == "clientes":
+                        cambios["bases"] |= self._bases_de(conn, [f["id"] for f in filas] + eliminadas)
+                        cambios["bases"] |= {f["base_name"] for f in filas}
+                        cambios["clientes"] = filas
+                        cambios["clientes_eliminados"] = eliminadas
+                    elif tabla == "users":
+                        cambios["users"] = [f["username"] for f in filas] + eliminadas
+                    else:
+                        cambios["historial"] |= {f["cliente_id"] for f in filas}
+                        cambios["historial"] |= self._clientes_de(conn, tabla, eliminadas)
+                    if filas:
+                        self._insertar(conn, tabla, filas)
+                    if eliminadas:
+                        self._borrar(conn, tabla, eliminadas)
+                    self._stats["filas_aplicadas"] += len(filas) + len(eliminadas)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cambios
+
+    def sincronizar(self):
+        """Una ronda de sincronización (copia completa la primera vez). Retorna True si terminó bien."""
+        with self._sync_lock:
+            inicio = time.monotonic()
+            cambios = None
+            try:
+                with self.engine.connect() as pg:
+                    pg = pg.execution_options(isolation_level="REPEATABLE READ")
+                    with pg.begin():
+                        xmin = marca_actual(pg)
+                        if self._tipos is None:
+                            self._preparar(pg)
+                        desde = self._meta("xmin")
+                        ultima = float(self._meta("ultima_ronda") or 0)
+                        # Si la réplica estuvo apagada más que la retención del registro, faltan cambios
+                        if desde is None or time.time() - ultima > self.retencion_horas * 3600 * 0.9:
+                            self._copiar_todo(pg, inicio)
+                        else:
+                            cambios = self._aplicar_cambios(pg, int(desde), inicio)
+                conn = self._conexion()
+                with self._escritura_lock:
+                    self._guardar_meta(conn, xmin=xmin, ultima_ronda=time.time())
+                    for k in [k for k, t in self._escritas.items() if t <= inicio]:
+                        del self._escritas[k]
+                self._ultima_ok = inicio
+                if self._fallando:
+                    self._fallando = False
+                    _log.info("réplica local sincronizada de nuevo")
+                self._stats["rondas"] += 1
+                self._stats["ms_ultima_ronda"] = round((time.monotonic() - inicio) * 1000, 1)
+            except Exception as e:
+                # Un esquema a medio migrar se vuelve a leer en la próxima ronda
+                self._tipos = None
+                self._stats["errores"] += 1
+                self._stats["ultimo_error"] = str(e)[:300]
+                # Con Postgres caído esto se repite en cada ronda: solo se avisa el primer fallo
+                _log.log(logging.DEBUG if self._fallando else logging.WARNING,
+                         "no se pudo sincronizar la réplica local (%s)", e)
+                self._fallando = True
+                return False
+        if cambios and self.al_cambiar is not None:
+            try:
+                self.al_cambiar(cambios)
+            except Exception as e:
+                _log.warning("error al propagar cambios de la réplica (%s)", e)
+        return True
+
+    def _bucle(self):
+        ultima_poda = None
+        while not self._detener.is_set():
+            self.sincronizar()
+            if ultima_poda is None or time.monotonic() - ultima_poda > 3600:
+                try:
+                    podar_cambios(self.engine, self.retencion_horas)
+                except Exception as e:
+                    _log.warning("no se pudo podar cambios_replica (%s)", e)
+                ultima_poda = time.monotonic()
+            self._despertar.wait(self.intervalo_seg)
+            self._despertar.clear()
+
+    def iniciar(self):
+        """Arranca el hilo de sincronización (una vez por proceso)."""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="replica-local", daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+
+    # --- Uso desde db.py ---
+    def vigente(self, max_retraso_seg):
+        """True si la última ronda correcta empezó hace menos de max_retraso_seg (y no fue invalidada)."""
+        inicio = self._ultima_ok
+        return (inicio is not None and self._tipos is not None and inicio >= self._min_inicio
+                and time.monotonic() - inicio <= max_retraso_seg)
+
+    def invalidar(self):
+        # Para escrituras cuyo resultado no se puede aplicar fila a fila (p. ej. una importación):
+        # no servir lecturas hasta que termine una ronda que empiece después de este momento
+        self._min_inicio = time.monotonic()
+        self._despertar.set()
+
+    def despertar(self):
+        # Adelanta la próxima ronda (p. ej. ante un aviso de cambios de otro proceso)
+        self._despertar.set()
+
+    def aplicar(self, tabla, filas=(), eliminados=()):
+        """Write-through tras un commit en Postgres: filas completas (RETURNING *) y claves borradas."""
+        filas = [dict(f) for f in filas]
+        eliminados = list(eliminados)
+        if not filas and not eliminados:
+            return
+        if self._tipos is None:
+            self.invalidar()
+            return
+        llave = TABLAS_REPLICA[tabla]
+        # Durante una copia completa el lock queda tomado varios segundos: la escritura del
+        # usuario no espera, la réplica deja de responder hasta la próxima ronda
+        if not self._escritura_lock.acquire(timeout=0.5):
+            self.invalidar()
+            return
+        try:
+            conn = self._conexion()
+            marca = time.monotonic()
+            for clave in [f[llave] for f in filas] + eliminados:
+                self._escritas[(tabla, str(clave))] = marca
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if filas:
+                    self._insertar(conn, tabla, filas)
+                if eliminados:
+                    self._borrar(conn, tabla, eliminados)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            _log.warning("no se pudo aplicar la escritura en la réplica local (%s)", e)
+            self.invalidar()
+        finally:
+            self._escritura_lock.release()
+
+    def leer(self, tabla, sql, params=None):
+        """
+        Ejecuta sql (dialecto SQLite, parámetros :nombre) y retorna un DataFrame con los mismos
+        tipos que daría Postgres para las columnas de `tabla` (booleanos, fechas, timestamps).
+        """
+        df = pd.read_sql(sql, self._conexion(), params=params or {})
+        for columna, tipo in (self._tipos or {}).get(tabla, {}).items():
+            if columna not in df.columns or df.empty:
+                continue
+            if tipo == "bool":
+                valores = df[columna].map(lambda v: None if v is None or v != v else bool(v))
+                df[columna] = valores.astype(bool) if valores.notna().all() else valores
+            elif tipo == "date":
+                df[columna] = df[columna].map(_fecha)
+            elif tipo == "datetime":
+                df[columna] = pd.to_datetime(df[columna], format="ISO8601")
+        return df
+
+    def estadisticas(self):
+        retraso = None if self._ultima_ok is None else round(time.monotonic() - self._ultima_ok, 1)
+        return {"ruta": self.ruta, "retraso_seg": retraso, "escrituras_pendientes": len(self._escritas),
+                **self._stats}
@@ -0,0 +1,101 @@
+import os
+import sys
+import types
+
+# Los módulos de la app están en la raíz del repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# db.py arma el engine al importarse (sin conectarse); la URL evita depender de secrets
+os.environ.setdefault("MYLOCALDATA_DATABASE_URL", "postgresql+psycopg2://usuario@localhost/mylocaldata")
+
+def _streamlit_minimo():
+    # db.py solo usa st.secrets y los avisos (st.error/warning/info); en los tests
+    # los secrets quedan vacíos (valores por defecto) y los avisos se guardan para revisarlos
+    st = types.ModuleType("streamlit")
+    st.secrets = {}
+    st.mensajes = []
+    for nombre in ("error", "warning", "info", "success", "write"):
+        setattr(st, nombre, lambda *args, _tipo=nombre, **kwargs: st.mensajes.append((_tipo, args)))
+    def _cache(func=None, **kwargs):
+        return func if func is not None else (lambda f: f)
+    st.cache_data = st.cache_resource = _cache
+    return st
+
+try:
+    import streamlit  # noqa: F401
+except ImportError:
+    sys.modules["streamlit"] = _streamlit_minimo()
+
+# --------------------------
+# BD de pruebas (opcional): MYLOCALDATA_TEST_DATABASE_URL apunta a una BD desechable.
+# Sin ella, los tests que la piden se saltan; los demás corren con la URL de arriba.
+# --------------------------
+BD_PRUEBAS = os.environ.get("MYLOCALDATA_TEST_DATABASE_URL")
+if BD_PRUEBAS:
+    os.environ["MYLOCALDATA_DATABASE_URL"] = BD_PRUEBAS
+
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+@pytest.fixture
+def base_pruebas():
+    """Nombre de una base nueva en la BD de pruebas; sus clientes se borran al terminar."""
+    if not BD_PRUEBAS:
+        pytest.skip("MYLOCALDATA_TEST_DATABASE_URL no está definida")
+    import db
+    from migraciones import aplicar_migraciones
+    aplicar_migraciones(db.engine)
+    base = f"pruebas_{uuid.uuid4().hex[:8]}"
+    yield base
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM clientes WHERE base_name = :b"), {"b": base})
+
+@pytest.fixture
+def insertar(base_pruebas):
+    """insertar(*filas) -> ids: inserta clientes (dicts de columnas) en base_pruebas por defecto."""
+    import db
+
+    def _insertar(*filas):
+        ids = []
+        with db.engine.begin() as conn:
+            for fila in filas:
+                fila = {"base_name": base_pruebas, **fila}
+                columnas = ", ".join(fila)
+                valores = ", ".join(f":{c}" for c in fila)
+                ids.append(conn.execute(text(f"INSERT INTO clientes ({columnas}) VALUES ({valores}) RETURNING id"),
+                                        fila).scalar())
+        return ids
+    return _insertar
+
+@pytest.fixture
+def cache_vacia(monkeypatch):
+    """Caché de clientes propia de la prueba (el estado de db es global al proceso)."""
+    from collections import OrderedDict
+    import db
+
+    monkeypatch.setattr(db, "_cache_clientes", OrderedDict())
+    monkeypatch.setattr(db, "_cache_bytes", 0)
+    monkeypatch.setattr(db, "_versiones_base", {})
+    monkeypatch.setattr(db, "_version_global", 0)
+
+@pytest.fixture
+def engine_fresco():
+    """Engine de una BD recién creada (vacía) junto a la de pruebas; se borra al terminar."""
+    if not BD_PRUEBAS:
+        pytest.skip("sin MYLOCALDATA_TEST_DATABASE_URL")
+    url = make_url(BD_PRUEBAS)
+    nombre = f"fresca_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f'CREATE DATABASE "{nombre}"'))
+    engine = create_engine(url.set(database=nombre))
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{nombre}" WITH (FORCE)'))
+        admin.dispose()
@@ -0,0 +1,16 @@
+import benchmark
+
+def test_medir_descarta_el_calentamiento():
+    llamadas = []
+    preparados = iter(range(10))
+    resultado = benchmark.medir(lambda x: llamadas.append(x), 4, preparar=lambda: (next(preparados),))
+    assert llamadas == [0, 1, 2, 3, 4]
+    assert resultado["n"] == 4
+    assert resultado["min_ms"] <= resultado["p50_ms"] <= resultado["p95_ms"] <= resultado["max_ms"]
+
+def test_comparar_usa_el_p50(capsys):
+    actual = {"resultados": {"buscar": {"p50_ms": 5.0}, "nuevo": {"p50_ms": 1.0}}}
+    previo = {"etiqueta": "antes", "resultados": {"buscar": {"p50_ms": 10.0}}}
+    benchmark.comparar(actual, previo)
+    salida = capsys.readouterr().out
+    assert "antes" in salida and "(x0.50)" in salida and "nuevo" not in salida
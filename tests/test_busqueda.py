@@ -0,0 +1,108 @@
+import pandas as pd
+
+from busqueda import IndiceNgramas
+
+def _indice():
+    return IndiceNgramas(pd.DataFrame([
+        {"id": 1, "nombre": "Transportes Gómez S.A.S.", "nit": "800555111", "contacto": "Ana López",
+         "ciudad": "Bogotá", "email": "ana@gomez.co", "telefono": "3101234567", "contactado": False},
+        {"id": 2, "nombre": "Logística Andina", "nit": "900123456", "contacto": "Luis Pérez",
+         "ciudad": "Medellín", "email": "luis@andina.co", "telefono": "3159876543", "contactado": True},
+        {"id": 3, "nombre": "Distribuidora del Valle", "nit": "901777888", "contacto": "María Díaz",
+         "ciudad": "Cali", "email": "maria@valle.co", "telefono": "3205550000", "contactado": False},
+    ]))
+
+def _ids(df):
+    return list(df["id"])
+
+def test_fragmento_de_nit():
+    df = _indice().buscar("555")
+    # 800555111 (NIT) y 3205550000 (teléfono) lo contienen tal cual
+    assert _ids(df)[:2] == [1, 3]
+    assert list(df["relevancia"])[:2] == [1.0, 1.0]
+    assert _ids(_indice().buscar("0055511"))[0] == 1
+
+def test_fragmento_de_telefono():
+    df = _indice().buscar("1234567")
+    assert _ids(df)[0] == 1 and df["relevancia"].iloc[0] == 1.0
+    assert _ids(_indice().buscar("98765"))[0] == 2
+
+def test_fragmento_corto_dentro_de_palabra():
+    # "ot" no llega al umbral de similitud pero es substring de "bogota"
+    assert 1 in _ids(_indice().buscar("ot"))
+
+def test_exactos_primero_y_sin_tildes():
+    df = _indice().buscar("gomez")
+    assert _ids(df)[0] == 1
+    assert df["relevancia"].iloc[0] == 1.0
+
+def test_filtro_contactado_y_borrados():
+    indice = _indice()
+    assert _ids(indice.buscar("555", contactado=True)) == []
+    indice.aplicar(eliminados=[1])
+    assert 1 not in _ids(indice.buscar("555"))
+
+def test_similitud_sin_substring():
+    # Error de tipeo: no es substring pero comparte la mayoría de trigramas
+    assert 3 in _ids(_indice().buscar("distribuidra"))
+
+def test_filtro_username_antes_del_limite():
+    # Los clientes de otro usuario puntúan más alto que los del que busca
+    filas = [{"id": i, "nombre": "Transportes Gómez", "nit": str(i), "username": "otro", "contactado": False}
+             for i in range(1, 11)]
+    filas += [{"id": 100, "nombre": "Transportes Gomez Hermanos Ltda", "nit": "100", "username": "ana",
+               "contactado": False}]
+    indice = IndiceNgramas(pd.DataFrame(filas))
+    assert 100 not in _ids(indice.buscar("transportes gomez", limite=5))
+    df = indice.buscar("transportes gomez", limite=5, username="ana")
+    assert _ids(df) == [100]
+    assert _ids(indice.buscar("transportes gomez", username="nadie")) == []
+
+def test_edicion_y_borrado_llegan_al_indice():
+    indice = _indice()
+    indice.aplicar(filas=[{"id": 2, "nombre": "Logística del Caribe", "nit": "900123456",
+                           "ciudad": "Barranquilla", "username": "ana", "contactado": False}])
+    assert 2 not in _ids(indice.buscar("andina"))
+    assert _ids(indice.buscar("caribe"))[0] == 2
+    # contactado y username se toman de la fila nueva
+    assert 2 in _ids(indice.buscar("caribe", contactado=False, username="ana"))
+    indice.aplicar(eliminados=[2])
+    assert 2 not in _ids(indice.buscar("caribe"))
+    assert len(indice) == 2
+
+def test_escrituras_de_db_llegan_al_indice_de_su_base():
+    import db
+    indices = {"A": IndiceNgramas(pd.DataFrame([
+        {"id": 1, "nombre": "Ferretería Central", "base_name": "A", "contactado": False},
+        {"id": 2, "nombre": "Panadería Central", "base_name": "A", "contactado": False},
+    ])), "B": IndiceNgramas(pd.DataFrame([
+        {"id": 3, "nombre": "Droguería Central", "base_name": "B", "contactado": False},
+    ]))}
+    with db._indices_lock:
+        anteriores = dict(db._indices_busqueda)
+        db._indices_busqueda.clear()
+        db._indices_busqueda.update(indices)
+    try:
+        # El cliente 2 se edita y pasa a la base B; el 1 se borra
+        db._indices_aplicar(filas=[{"id": 2, "nombre": "Panadería Norte", "base_name": "B", "contactado": True}],
+                            eliminados=[1])
+        assert _ids(indices["A"].buscar("central")) == []
+        assert _ids(indices["B"].buscar("norte")) == [2]
+        assert _ids(indices["B"].buscar("central")) == [3]
+    finally:
+        with db._indices_lock:
+            db._indices_busqueda.clear()
+            db._indices_busqueda.update(anteriores)
+
+def test_fallo_al_construir_indice_se_registra(monkeypatch, caplog):
+    import db
+    def _falla(*args, **kwargs):
+        raise RuntimeError("sin conexión")
+    monkeypatch.setattr(db.pd, "read_sql", _falla)
+    with db._indices_lock:
+        db._indices_construyendo.add("rota")
+    db._construir_indice("rota")
+    assert "rota" not in db._indices_busqueda
+    # Queda libre para que la próxima búsqueda lo intente de nuevo
+    assert "rota" not in db._indices_construyendo
+    assert any("rota" in r.getMessage() and r.name == "mylocaldata.db" for r in caplog.records)
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+import db
+
+pytestmark = pytest.mark.usefixtures("cache_vacia")
+
+def _cargador(valor):
+    llamadas = []
+    def cargar():
+        llamadas.append(1)
+        return valor
+    return cargar, llamadas
+
+def _frame(n):
+    return pd.DataFrame({"id": range(n), "nombre": ["x" * 20] * n})
+
+def test_segunda_lectura_sale_de_la_cache():
+    cargar, llamadas = _cargador(_frame(3))
+    primero = db._cache_leer(("pagina", "A", None), "A", cargar)
+    assert db._cache_leer(("pagina", "A", None), "A", cargar) is primero
+    assert len(llamadas) == 1
+
+def test_invalidar_una_base_no_toca_las_demas():
+    cargar_a, llamadas_a = _cargador(_frame(3))
+    cargar_b, llamadas_b = _cargador(_frame(3))
+    cargar_todas, llamadas_todas = _cargador(_frame(3))
+    for _ in range(2):
+        db._cache_leer(("pagina", "A"), "A", cargar_a)
+        db._cache_leer(("pagina", "B"), "B", cargar_b)
+        db._cache_leer(("pagina", None), None, cargar_todas)
+        db.invalidar_bases("A")
+    # A y la vista sin base (que incluye a A) se recargan; B conserva su entrada
+    assert (len(llamadas_a), len(llamadas_b), len(llamadas_todas)) == (2, 1, 2)
+
+def test_no_guarda_lo_leido_durante_una_escritura():
+    def cargar():
+        db.invalidar_bases("A")   # otra sesión escribe mientras esta lee
+        return _frame(3)
+    db._cache_leer(("pagina", "A"), "A", cargar)
+    assert ("pagina", "A") not in db._cache_clientes
+
+def test_lru_respeta_el_limite_de_memoria(monkeypatch):
+    tamano = db._tamano_valor(_frame(1000))
+    monkeypatch.setattr(db, "CACHE_CLIENTES_MAX_MB", 2.5 * tamano / (1024 * 1024))
+    for base in ("A", "B"):
+        db._cache_leer(("pagina", base), base, lambda: _frame(1000))
+    db._cache_leer(("pagina", "A"), "A", lambda: pytest.fail("A debía seguir en caché"))
+    db._cache_leer(("pagina", "C"), "C", lambda: _frame(1000))
+    # Se descarta la menos usada recientemente (B), no la primera en entrar
+    assert list(db._cache_clientes) == [("pagina", "A"), ("pagina", "C")]
+    assert db.estadisticas_cache()["bytes"] == 2 * tamano
+
+def test_valor_mayor_que_el_limite_no_se_guarda(monkeypatch):
+    monkeypatch.setattr(db, "CACHE_CLIENTES_MAX_MB", 0)
+    valor = db._cache_leer(("pagina", "A"), "A", lambda: _frame(10))
+    assert len(valor) == 10 and not db._cache_clientes
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+import db
+
+pytestmark = pytest.mark.usefixtures("cache_vacia")
+
+def _cliente(cliente_id, contactado=False, base_name="A", username="ana", nombre=None):
+    return {"id": cliente_id, "nombre": nombre or f"c{cliente_id}", "contactado": contactado,
+            "base_name": base_name, "username": username}
+
+def _frame(*clientes):
+    return pd.DataFrame(list(clientes), columns=["id", "nombre", "contactado", "base_name", "username"])
+
+def _todos(f):
+    return True
+
+def test_parchar_frame_reemplaza_agrega_y_quita_en_orden():
+    df = _frame(_cliente(1), _cliente(3), _cliente(5))
+    nuevo = db._parchar_frame(df, [_cliente(3, nombre="editado"), _cliente(4)], [5], _todos)
+    assert list(nuevo["id"]) == [1, 3, 4]
+    assert nuevo.loc[nuevo["id"] == 3, "nombre"].item() == "editado"
+    assert list(df["id"]) == [1, 3, 5]   # el frame cacheado no se modifica in-place
+
+def test_parchar_frame_respeta_el_rango_de_la_pagina():
+    df = _frame(_cliente(4), _cliente(6))
+    nuevo = db._parchar_frame(df, [_cliente(2), _cliente(5), _cliente(9)], [], _todos, desde=3, hasta=6)
+    # 2 pertenece a una página anterior y 9 a una posterior
+    assert list(nuevo["id"]) == [4, 5, 6]
+
+def test_parchar_frame_conserva_tipos():
+    df = _frame(_cliente(1), _cliente(2))
+    nuevo = db._parchar_frame(df, [_cliente(2, contactado=False)], [], _todos)
+    assert nuevo.dtypes.equals(df.dtypes)
+
+def test_cambio_de_contactado_pasa_de_tab():
+    vista = (_frame(_cliente(1), _cliente(3)), _frame(_cliente(2, True)), 3, None)
+    db._cache_leer(("vista", "A", None, 2), "A", lambda: vista)
+    db.aplicar_cambios_cache(filas=[_cliente(1, contactado=True)])
+    df_no, df_si, cursor_no, cursor_si = db._cache_leer(("vista", "A", None, 2), "A",
+                                                        lambda: pytest.fail("la vista debía quedar parchada"))
+    assert list(df_no["id"]) == [3] and list(df_si["id"]) == [1, 2]
+    assert (cursor_no, cursor_si) == (3, None)
+
+def test_paginas_filtran_por_usuario_y_base():
+    clave = ("pagina", "A", "ana", False, None, 50)
+    db._cache_leer(clave, "A", lambda: (_frame(_cliente(1)), None))
+    db.aplicar_cambios_cache(filas=[_cliente(2, username="luis"), _cliente(3, base_name="B"), _cliente(4)],
+                             bases=["B"])
+    df, cursor = db._cache_leer(clave, "A", lambda: pytest.fail("la página debía quedar parchada"))
+    assert list(df["id"]) == [1, 4] and cursor is None
+
+def test_otras_entradas_de_la_base_se_descartan():
+    db._cache_leer(("busqueda", "A", None), "A", lambda: _frame(_cliente(1)))
+    db._cache_leer(("pagina", "B", None, False, None, 50), "B", lambda: (_frame(_cliente(7, base_name="B")), None))
+    db.aplicar_cambios_cache(eliminados=[1], bases=["A"])
+    assert list(db._cache_clientes) == [("pagina", "B", None, False, None, 50)]
+
+def test_fallo_al_parchar_descarta_la_entrada(caplog):
+    db._cache_leer(("pagina", "A", None, False, None, 50), "A", lambda: ("no es una página", None))
+    with caplog.at_level("WARNING", logger="mylocaldata.db"):
+        db.aplicar_cambios_cache(filas=[_cliente(1)])
+    assert not db._cache_clientes
+    assert "no se pudo parchar" in caplog.text
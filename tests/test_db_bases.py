@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import text
+
+import db
+
+pytestmark = pytest.mark.usefixtures("cache_vacia")
+
+def _catalogo(*bases):
+    with db.engine.connect() as conn:
+        filas = conn.execute(text("SELECT base_name, total_clientes FROM bases WHERE base_name = ANY(:b)"),
+                             {"b": list(bases)}).fetchall()
+    return dict(filas)
+
+def test_catalogo_cuenta_altas_traslados_y_bajas(base_pruebas, insertar):
+    otra = f"{base_pruebas}_b"
+    ids = insertar(*[{"nombre": f"c{i}"} for i in range(5)])
+    try:
+        assert _catalogo(base_pruebas, otra) == {base_pruebas: 5}
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE clientes SET base_name = :otra WHERE id = ANY(:ids)"),
+                         {"otra": otra, "ids": ids[:2]})
+        assert _catalogo(base_pruebas, otra) == {base_pruebas: 3, otra: 2}
+        db.eliminar_clientes(ids)
+        # Las bases que quedan sin clientes salen del catálogo
+        assert _catalogo(base_pruebas, otra) == {}
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM clientes WHERE base_name = :otra"), {"otra": otra})
+
+def test_obtener_bases_refleja_la_ultima_edicion(base_pruebas, insertar):
+    cliente_id, = insertar({"nombre": "c"})
+    antes = db.obtener_bases().set_index("base_name").loc[base_pruebas]
+    assert antes["total_clientes"] == 1
+
+    db.actualizar_cliente_campos(cliente_id, {"ciudad": "Cali"})
+    despues = db.obtener_bases().set_index("base_name").loc[base_pruebas]
+    # Una edición no cambia el conteo pero sí la fecha de actualización de la base
+    assert despues["total_clientes"] == 1
+    assert despues["actualizado_en"] > antes["actualizado_en"]
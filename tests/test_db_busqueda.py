@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import db
+
+def test_patron_like_escapa_comodines():
+    assert db._patron_like("50%") == "%50\\%%"
+    assert db._patron_like("a_b") == "%a\\_b%"
+    assert db._patron_like("c:\\x") == "%c:\\\\x%"
+
+def _insertar(base, nombres):
+    with db.engine.begin() as conn:
+        for nombre in nombres:
+            conn.execute(text("INSERT INTO clientes (nombre, nit, base_name) VALUES (:n, :nit, :b)"),
+                         {"n": nombre, "nit": None, "b": base})
+
+def test_busqueda_con_comodines_es_literal(base_pruebas, monkeypatch):
+    # Solo la consulta a la BD (el índice en memoria no usa LIKE)
+    monkeypatch.setattr(db, "indice_busqueda", lambda *args, **kwargs: None)
+    _insertar(base_pruebas, ["Descuento 50% Ltda", "Comercial 500 SAS", "Nit_123 Express", "Nit9123 Express"])
+    porcentaje = db.buscar_clientes("50%", base_name=base_pruebas, is_admin=True)
+    guion = db.buscar_clientes("t_1", base_name=base_pruebas, is_admin=True)
+    assert porcentaje["nombre"].iloc[0] == "Descuento 50% Ltda"
+    assert guion["nombre"].iloc[0] == "Nit_123 Express"
+    if db._busqueda_sin_trigramas:
+        # Con ILIKE no hay coincidencias por similitud: solo queda el texto literal
+        assert list(porcentaje["nombre"]) == ["Descuento 50% Ltda"]
+        assert list(guion["nombre"]) == ["Nit_123 Express"]
+
+def test_exportar_busqueda_trae_todas_las_coincidencias(base_pruebas, monkeypatch):
+    monkeypatch.setattr(db, "indice_busqueda", lambda *args, **kwargs: None)
+    _insertar(base_pruebas, [f"Transportes Ruta {i}" for i in range(120)] + ["Panadería Sol"])
+    assert len(db.buscar_clientes("transportes", base_name=base_pruebas, is_admin=True)) == 50
+    bloques = list(db.leer_clientes_por_bloques(base_name=base_pruebas, busqueda="transportes", tamano_bloque=40))
+    exportado = pd.concat(bloques)
+    assert len(bloques) > 1
+    assert len(exportado) == 120
+    assert "doc" not in exportado.columns and "relevancia" not in exportado.columns
+
+def test_busqueda_sin_coincidencias_exporta_encabezados(base_pruebas):
+    bloques = list(db.leer_clientes_por_bloques(base_name=base_pruebas, busqueda="zzzqqq"))
+    assert sum(len(b) for b in bloques) == 0
+    assert bloques and "nombre" in bloques[0].columns
+
+def test_solo_falta_de_pg_trgm_cae_a_ilike(monkeypatch):
+    # Un error que no es "función inexistente" se propaga y no cambia el modo de búsqueda
+    def _falla(*args, **kwargs):
+        raise OperationalError("SELECT", {}, Exception("conexión perdida"))
+    monkeypatch.setattr(db.pd, "read_sql", _falla)
+    monkeypatch.setattr(db, "_busqueda_sin_trigramas", False)
+    monkeypatch.setattr(db.engine, "connect", lambda: _ConexionFalsa())
+    with pytest.raises(OperationalError):
+        list(db._consultar_busqueda("gomez", base_name="A"))
+    assert db._busqueda_sin_trigramas is False
+
+class _ConexionFalsa:
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return False
+    def execution_options(self, **kwargs):
+        return self
+    def execute(self, *args, **kwargs):
+        return None
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+import db
+
+def test_agregar_cliente_sin_base_va_a_translogistic(base_pruebas):
+    fila = db.agregar_cliente({"nombre": "Sin base", "base_name": None, "username": None})
+    try:
+        assert fila["base_name"] == "TRANSLOGISTIC"
+        df = db.obtener_clientes(base_name="TRANSLOGISTIC")
+        assert fila["id"] in set(df["id"])
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM clientes WHERE id = :id"), {"id": fila["id"]})
+
+def test_base_name_nulo_no_se_acepta(base_pruebas):
+    with pytest.raises(IntegrityError):
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO clientes (nombre, base_name) VALUES ('x', NULL)"))
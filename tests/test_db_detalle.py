@@ -0,0 +1,53 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import db
+
+@pytest.fixture
+def detalle_vacio(monkeypatch):
+    monkeypatch.setattr(db, "_detalle_cache", db.OrderedDict())
+
+@pytest.fixture
+def lecturas(monkeypatch):
+    contador = []
+    leer = db._leer_detalle
+    monkeypatch.setattr(db, "_leer_detalle", lambda cliente_id: contador.append(cliente_id) or leer(cliente_id))
+    return contador
+
+def test_detalle_en_una_lectura_con_tipos(base_pruebas, insertar, detalle_vacio, lecturas):
+    cliente_id, = insertar({"nombre": "Gómez", "contactado": True, "fecha_contacto": "2024-05-01"})
+    db.agregar_contacto(cliente_id, datetime.date(2024, 5, 1), "Llamada", "primero")
+    db.agregar_contacto(cliente_id, datetime.date(2024, 6, 1), "Email", "segundo")
+    db.agendar_visita(cliente_id, datetime.date(2024, 7, 1), "Presencial", "ana")
+
+    cliente, contactos, visitas = db.obtener_detalle_cliente(cliente_id)
+    assert cliente["nombre"] == "Gómez" and cliente["fecha_contacto"] == datetime.date(2024, 5, 1)
+    assert list(contactos["notas"]) == ["segundo", "primero"]
+    assert contactos["fecha"].iloc[0] == datetime.date(2024, 6, 1)
+    assert list(visitas["medio"]) == ["Presencial"] and isinstance(visitas["creado_en"].iloc[0], pd.Timestamp)
+
+    assert db.obtener_detalle_cliente(cliente_id)[0] is cliente
+    assert lecturas == [cliente_id]
+
+def test_escrituras_invalidan_el_detalle(base_pruebas, insertar, detalle_vacio, lecturas):
+    cliente_id, = insertar({"nombre": "Gómez"})
+    assert db.obtener_detalle_cliente(cliente_id)[1].empty
+    db.agregar_contacto(cliente_id, datetime.date(2024, 5, 1), "Llamada")
+    assert len(db.obtener_detalle_cliente(cliente_id)[1]) == 1
+    db.actualizar_cliente_campos(cliente_id, {"ciudad": "Cali"})
+    assert db.obtener_detalle_cliente(cliente_id)[0]["ciudad"] == "Cali"
+    assert len(lecturas) == 3
+
+def test_cliente_inexistente_o_id_invalido(base_pruebas, detalle_vacio):
+    assert db.obtener_detalle_cliente(-1) is None
+    assert db.obtener_detalle_cliente("abc") is None
+    assert not db._detalle_cache
+
+def test_invalidar_detalle_por_base(detalle_vacio):
+    db._detalle_cache[1] = ("A", "detalle 1")
+    db._detalle_cache[2] = ("B", "detalle 2")
+    db._detalle_cache[3] = ("B", "detalle 3")
+    db.invalidar_detalle(1, bases=["B"])
+    assert not db._detalle_cache
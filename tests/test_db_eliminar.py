@@ -0,0 +1,28 @@
+import datetime
+
+from sqlalchemy import text
+
+import db
+
+def test_eliminar_clientes_en_una_sentencia(base_pruebas, insertar):
+    ids = insertar(*[{"nombre": f"c{i}"} for i in range(4)])
+    db.agregar_contacto(ids[0], datetime.date(2024, 5, 1), "llamada", "hola")
+    db.agendar_visita(ids[0], datetime.date(2024, 6, 1), "presencial", "ana")
+
+    # Ids repetidos, inválidos o inexistentes no impiden borrar los demás
+    eliminados = db.eliminar_clientes([ids[0], str(ids[1]), ids[1], "x", -1])
+    assert sorted(eliminados) == ids[:2]
+
+    with db.engine.connect() as conn:
+        quedan = conn.execute(text("SELECT id FROM clientes WHERE base_name = :b ORDER BY id"),
+                              {"b": base_pruebas}).scalars().all()
+        huerfanos = conn.execute(text("""
+            SELECT (SELECT count(*) FROM contactos WHERE cliente_id = :id)
+                 + (SELECT count(*) FROM visitas WHERE cliente_id = :id)
+        """), {"id": ids[0]}).scalar()
+    assert quedan == ids[2:] and huerfanos == 0
+
+def test_eliminar_clientes_sin_ids_validos_no_consulta():
+    assert db.eliminar_clientes([]) == []
+    assert db.eliminar_clientes(None) == []
+    assert db.eliminar_clientes(["x", None]) == []
@@ -0,0 +1,39 @@
+import uuid
+
+from sqlalchemy import text
+
+import db
+
+def test_admin_filtrando_por_usuario(monkeypatch):
+    monkeypatch.setattr(db, "get_display_base_name", lambda username: "Mia")
+    vista = db.resolver_vista(is_admin=True, filtrar_username="ana")
+    clauses, params = db._filtros_clientes(None, **vista)
+    assert clauses == ["username = :username"] and params == {"username": "ana"}
+
+def test_admin_sin_filtro_ve_todo():
+    assert db._filtros_clientes(None, None, True, None) == ([], {})
+    clauses, params = db._filtros_clientes(True, None, True, "TRANSLOGISTIC")
+    assert clauses == ["contactado = :contactado", "base_name = :base_name"]
+
+def test_usuario_sin_base_usa_su_base_privada(monkeypatch):
+    # Un usuario normal nunca filtra por username: ve su base privada (o la que elija)
+    monkeypatch.setattr(db, "get_display_base_name", lambda username: "Mia")
+    assert db._filtros_clientes(None, "ana", False, None) == (["base_name = :base_name"], {"base_name": "ana__Mia"})
+    vista = db.resolver_vista(username="ana", base_seleccionada="TRANSLOGISTIC")
+    assert db._filtros_clientes(None, **vista) == (["base_name = :base_name"], {"base_name": "TRANSLOGISTIC"})
+
+def test_admin_filtrando_por_usuario_en_la_bd(base_pruebas):
+    usuario = f"ana_{uuid.uuid4().hex[:6]}"
+    otra_base = f"{base_pruebas}_b"
+    with db.engine.begin() as conn:
+        for nombre, dueno, base in (("A1", usuario, base_pruebas), ("A2", usuario, otra_base),
+                                    ("B1", "otro", base_pruebas)):
+            conn.execute(text("INSERT INTO clientes (nombre, username, base_name) VALUES (:n, :u, :b)"),
+                         {"n": nombre, "u": dueno, "b": base})
+    try:
+        df = db.obtener_clientes(**db.resolver_vista(is_admin=True, filtrar_username=usuario))
+        # Todos los clientes del usuario, en cualquier base, y solo los suyos
+        assert sorted(df["nombre"]) == ["A1", "A2"]
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM clientes WHERE base_name = :b"), {"b": otra_base})
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+from sqlalchemy import text
+
+import db
+
+def _clientes(base_name):
+    with db.engine.connect() as conn:
+        filas = conn.execute(text("""
+            SELECT nit, nombre, ciudad, contactado, fecha_contacto::text AS fecha_contacto
+            FROM clientes WHERE base_name = :b ORDER BY id
+        """), {"b": base_name}).mappings().all()
+    return {f["nit"]: dict(f) for f in filas}
+
+def _csv(texto):
+    return io.BytesIO(texto.encode("utf-8"))
+
+def test_upsert_por_nit_normalizado(base_pruebas, insertar):
+    insertar({"nombre": "Gómez", "nit": "800.555.111-1", "ciudad": "Bogotá"})
+    archivo = _csv(
+        "NIT;Nombre;Contactado;Fecha de contacto\n"
+        "8005551111;Gómez S.A.S.;sí;2024-05-01\n"      # existente: se actualiza sin tocar ciudad
+        "900123456;Andina;no;2024-05-02\n"              # nuevo sin contactar: sin fecha
+        ";Sin NIT;;\n"
+        "901777888;Valle;;\n"
+        "901-777-888;Valle Dos;x;01/06/2024\n"          # NIT repetido: gana la última fila
+    )
+    resultado = db.importar_clientes(archivo, base_name=base_pruebas, nombre_archivo="clientes.csv")
+    assert resultado == {"insertados": 2, "actualizados": 1, "rechazados": 2}
+
+    clientes = _clientes(base_pruebas)
+    assert clientes["800.555.111-1"] == {"nit": "800.555.111-1", "nombre": "Gómez S.A.S.", "ciudad": "Bogotá",
+                                         "contactado": True, "fecha_contacto": "2024-05-01"}
+    assert clientes["900123456"]["contactado"] is False and clientes["900123456"]["fecha_contacto"] is None
+    assert clientes["901-777-888"]["nombre"] == "Valle Dos" and "901777888" not in clientes
+
+def test_importar_excel(base_pruebas):
+    from openpyxl import Workbook
+
+    libro = Workbook()
+    libro.active.append(["NIT", "Nombre", "Correo"])
+    libro.active.append([900123456, "Andina", "luis@andina.co"])
+    archivo = io.BytesIO()
+    libro.save(archivo)
+    archivo.seek(0)
+
+    resultado = db.importar_clientes(archivo, base_name=base_pruebas, nombre_archivo="clientes.xlsx")
+    assert resultado == {"insertados": 1, "actualizados": 0, "rechazados": 0}
+    assert _clientes(base_pruebas)["900123456"]["nombre"] == "Andina"
+
+def test_archivo_sin_columna_nit(base_pruebas):
+    with pytest.raises(ValueError):
+        db.importar_clientes(_csv("Nombre,Ciudad\nGómez,Cali\n"), base_name=base_pruebas)
+    assert db.importar_clientes(_csv(""), base_name=base_pruebas) == {"insertados": 0, "actualizados": 0,
+                                                                      "rechazados": 0}
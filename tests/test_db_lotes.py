@@ -0,0 +1,31 @@
+import pytest
+
+import db
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("false", False), ("0", False), ("no", False), ("f", False), (" False ", False),
+    ("true", True), ("1", True), ("sí", True), ("X", True),
+    (True, True), (False, False), (0, False), (1, True),
+])
+def test_contactado_en_texto(valor, esperado):
+    assert db._valor_para_lote("contactado", valor) is esperado
+
+def test_contactado_vacio_es_nulo():
+    assert db._valor_para_lote("contactado", "") is None
+    assert db._valor_para_lote("contactado", None) is None
+
+def test_lote_escribe_booleanos_en_texto(base_pruebas):
+    from sqlalchemy import text
+    with db.engine.begin() as conn:
+        ids = [conn.execute(text(
+            "INSERT INTO clientes (nombre, contactado, base_name) VALUES (:n, :c, :b) RETURNING id"
+        ), {"n": f"cliente {i}", "c": c, "b": base_pruebas}).scalar() for i, c in enumerate((True, True, False))]
+
+    filas = db.actualizar_clientes_campos([(ids[0], {"contactado": "false"}),
+                                           (ids[1], {"contactado": "0"}),
+                                           (ids[2], {"contactado": "sí"})])
+    assert {f["id"]: f["contactado"] for f in filas} == {ids[0]: False, ids[1]: False, ids[2]: True}
+    with db.engine.connect() as conn:
+        en_bd = dict(conn.execute(text("SELECT id, contactado FROM clientes WHERE base_name = :b"),
+                                  {"b": base_pruebas}).all())
+    assert en_bd == {ids[0]: False, ids[1]: False, ids[2]: True}
@@ -0,0 +1,28 @@
+import db
+
+def test_paginas_keyset_recorren_el_tab_sin_repetir(base_pruebas, insertar):
+    ids = insertar(*[{"nombre": f"c{i}", "contactado": i % 3 == 0} for i in range(25)])
+    no_contactados = [i for n, i in enumerate(ids) if n % 3 != 0]
+
+    vistos, cursor = [], None
+    while True:
+        df, cursor = db.obtener_clientes_pagina(contactado=False, base_name=base_pruebas, is_admin=True,
+                                                despues_de_id=cursor, limite=7)
+        vistos += list(df["id"])
+        if cursor is None:
+            break
+        assert cursor == vistos[-1]
+    assert vistos == no_contactados
+
+def test_pagina_no_se_corre_al_insertar_durante_el_recorrido(base_pruebas, insertar):
+    ids = insertar(*[{"nombre": f"c{i}", "contactado": False} for i in range(6)])
+    primera, cursor = db.obtener_clientes_pagina(contactado=False, base_name=base_pruebas, is_admin=True, limite=3)
+    nuevo, = insertar({"nombre": "nuevo", "contactado": False})
+    segunda, fin = db.obtener_clientes_pagina(contactado=False, base_name=base_pruebas, is_admin=True,
+                                              despues_de_id=cursor, limite=3)
+    assert list(primera["id"]) == ids[:3]
+    # El cliente nuevo (id mayor) aparece al final, sin repetir ni saltar filas
+    assert list(segunda["id"]) == ids[3:6] and fin == ids[5]
+    resto, _ = db.obtener_clientes_pagina(contactado=False, base_name=base_pruebas, is_admin=True,
+                                          despues_de_id=fin, limite=3)
+    assert list(resto["id"]) == [nuevo]
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import db
+
+@pytest.fixture(autouse=True)
+def contadores(monkeypatch):
+    monkeypatch.setattr(db, "_pool_timeouts", 0)
+    monkeypatch.setattr(db, "_pool_pings_fallidos", 0)
+    monkeypatch.setattr(db, "_pool_esperas", db.deque(maxlen=500))
+
+def test_pool_medido_cuenta_esperas_y_timeouts():
+    engine = create_engine("sqlite://", poolclass=db.PoolMedido, pool_size=1, max_overflow=0, pool_timeout=0.05)
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert db._pool_timeouts == 1
+    assert len(db._pool_esperas) == 2 and max(db._pool_esperas) >= 0.05
+
+def test_estadisticas_pool():
+    db._pool_esperas.extend([0.010, 0.030])
+    stats = db.estadisticas_pool()
+    assert stats["tamano"] == db.DB_POOL_SIZE and stats["max_overflow"] == db.DB_MAX_OVERFLOW
+    assert stats["espera_promedio_ms"] == 20.0 and stats["espera_max_ms"] == 30.0
+    assert stats["timeouts"] == 0 and stats["pre_ping"] == db.DB_PRE_PING
+
+def test_conexion_inactiva_caida_se_reemplaza(base_pruebas, monkeypatch):
+    # Pool de una conexión con los mismos hooks de checkout/checkin que el engine de la app
+    engine = create_engine(db.engine.url, poolclass=db.PoolMedido, pool_size=1, max_overflow=0)
+    event.listen(engine, "checkin", db._al_devolver)
+    event.listen(engine, "checkout", db._al_tomar)
+    monkeypatch.setattr(db, "DB_PRE_PING", "inactivas")
+    monkeypatch.setattr(db, "DB_PRE_PING_INACTIVA_SEG", 0)
+    try:
+        with engine.connect() as conn:
+            pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT pg_backend_pid()")).scalar() != pid
+        assert db._pool_pings_fallidos == 1
+    finally:
+        engine.dispose()
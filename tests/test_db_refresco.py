@@ -0,0 +1,61 @@
+import logging
+import time
+
+import pytest
+from sqlalchemy import text
+
+import db
+
+@pytest.fixture
+def refresco(base_pruebas, cache_vacia, monkeypatch):
+    # Proceso sin réplica ni escucha de avisos, con la marca tomada ahora y sin poda en segundo plano
+    monkeypatch.setattr(db, "_replica", None)
+    monkeypatch.setattr(db, "_escucha", None)
+    monkeypatch.setattr(db, "_poda_ultima", time.monotonic())
+    monkeypatch.setattr(db, "_delta_fallando", False)
+    monkeypatch.setattr(db, "_delta_marca", db.marca_cambios())
+    monkeypatch.setattr(db, "_delta_ultima", time.time())
+
+def _otro_proceso(sql, **params):
+    # Escritura directa en la BD: no pasa por las cachés de este proceso
+    with db.engine.begin() as conn:
+        conn.execute(text(sql), params)
+
+def test_cambios_de_otro_proceso_parchan_la_cache(base_pruebas, insertar, refresco):
+    uno, dos = insertar({"nombre": "uno"}, {"nombre": "dos"})
+    db.refrescar_cambios(forzar=True)
+    df_no, _, _, _ = db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True)
+    assert list(df_no["nombre"]) == ["uno", "dos"]
+
+    _otro_proceso("UPDATE clientes SET nombre = 'uno editado' WHERE id = :id", id=uno)
+    _otro_proceso("UPDATE clientes SET contactado = TRUE WHERE id = :id", id=dos)
+    _otro_proceso("INSERT INTO clientes (nombre, base_name) VALUES ('tres', :b)", b=base_pruebas)
+    # Sin refresco, la caché sigue sirviendo lo anterior
+    assert list(db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True)[0]["nombre"]) == ["uno", "dos"]
+
+    assert db.refrescar_cambios(forzar=True) == 3
+    claves = list(db._cache_clientes)
+    df_no, df_si, _, _ = db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True)
+    assert list(df_no["nombre"]) == ["uno editado", "tres"] and list(df_si["nombre"]) == ["dos"]
+    # La página se parchó en su lugar, no se descartó
+    assert list(db._cache_clientes) == claves
+
+def test_sin_forzar_respeta_el_intervalo(refresco, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(db, "cambios_desde", lambda marca: llamadas.append(marca) or ({}, marca))
+    assert db.refrescar_cambios() == 0
+    assert llamadas == []
+    monkeypatch.setattr(db, "_delta_ultima", time.time() - db.DELTA_INTERVALO_SEG - 1)
+    assert db.refrescar_cambios() == 0
+    assert len(llamadas) == 1
+
+def test_bd_caida_avisa_una_vez_y_la_recuperacion(refresco, monkeypatch, caplog):
+    def _falla(marca):
+        raise RuntimeError("sin conexión")
+    monkeypatch.setattr(db, "cambios_desde", _falla)
+    with caplog.at_level(logging.DEBUG, logger="mylocaldata.db"):
+        assert db.refrescar_cambios(forzar=True) is None
+        assert db.refrescar_cambios(forzar=True) is None
+        monkeypatch.setattr(db, "cambios_desde", lambda marca: ({}, marca))
+        assert db.refrescar_cambios(forzar=True) == 0
+    assert [r.levelno for r in caplog.records] == [logging.WARNING, logging.DEBUG, logging.INFO]
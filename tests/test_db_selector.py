@@ -0,0 +1,29 @@
+import pytest
+
+import db
+
+pytestmark = pytest.mark.usefixtures("cache_vacia")
+
+def test_selector_sin_texto_trae_los_primeros_por_id(base_pruebas, insertar):
+    ids = insertar(*[{"nombre": f"c{i}", "nit": str(900000 + i)} for i in range(8)])
+    df = db.opciones_selector_clientes(base_name=base_pruebas, is_admin=True, limite=5)
+    assert list(df.columns) == ["id", "nombre", "nit"]
+    assert list(df["id"]) == ids[:5]
+
+def test_selector_con_texto_busca_por_nit_o_nombre(base_pruebas, insertar, monkeypatch):
+    # La búsqueda en la BD (sin índice en memoria) basta para el selector
+    monkeypatch.setattr(db, "indice_busqueda", lambda *args, **kwargs: None)
+    gomez, andina = insertar({"nombre": "Transportes Gómez", "nit": "800555111"},
+                             {"nombre": "Logística Andina", "nit": "900123456"})
+    assert db.opciones_selector_clientes("800555", base_name=base_pruebas, is_admin=True)["id"].iloc[0] == gomez
+    assert db.opciones_selector_clientes("andina", base_name=base_pruebas, is_admin=True)["id"].iloc[0] == andina
+    vacio = db.opciones_selector_clientes("zzzqqq", base_name=base_pruebas, is_admin=True)
+    assert vacio.empty and list(vacio.columns) == ["id", "nombre", "nit"]
+
+def test_selector_respeta_la_vista_del_usuario(base_pruebas, insertar):
+    # Admin filtrando por usuario (sin base): solo los clientes de ese usuario
+    usuario = f"{base_pruebas}_usuario"
+    mio, = insertar({"nombre": "mío", "username": usuario})
+    insertar({"nombre": "ajeno", "username": "otro"})
+    vista = db.resolver_vista(is_admin=True, filtrar_base="Todas", filtrar_username=usuario)
+    assert list(db.opciones_selector_clientes(**vista)["id"]) == [mio]
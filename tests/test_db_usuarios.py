@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+import db
+
+@pytest.fixture
+def usuario(base_pruebas, monkeypatch):
+    # base_pruebas solo para saltar sin BD de pruebas; la caché de usuarios parte vacía
+    monkeypatch.setattr(db, "_usuarios_cache", {})
+    username = f"usuario_{uuid.uuid4().hex[:8]}"
+    yield username
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE username = :u"), {"u": username})
+
+@pytest.fixture
+def lecturas(monkeypatch):
+    # Cuenta las conexiones que se abren (engine.begin también pasa por connect)
+    contador = []
+    conectar = db.engine.connect
+    monkeypatch.setattr(db.engine, "connect", lambda: contador.append(1) or conectar())
+    return contador
+
+def test_ausencia_y_valor_se_cachean(usuario, lecturas):
+    assert db.get_display_base_name(usuario) is None
+    assert db.get_display_base_name(usuario) is None
+    assert len(lecturas) == 1
+
+    db.set_display_base_name(usuario, "Mi base")
+    despues_de_escribir = len(lecturas)
+    # Write-through: el valor nuevo se ve sin volver a consultar
+    assert db.get_display_base_name(usuario) == "Mi base"
+    assert len(lecturas) == despues_de_escribir
+
+def test_cambio_de_otro_proceso_se_ve_al_vencer_el_ttl(usuario, lecturas, monkeypatch):
+    db.set_display_base_name(usuario, "Antes")
+    with db.engine.begin() as conn:
+        conn.execute(text("UPDATE users SET display_base_name = 'Después' WHERE username = :u"), {"u": usuario})
+    assert db.get_display_base_name(usuario) == "Antes"
+
+    reloj = db.time.monotonic() + db.USUARIOS_CACHE_TTL + 1
+    monkeypatch.setattr(db.time, "monotonic", lambda: reloj)
+    assert db.get_display_base_name(usuario) == "Después"
@@ -0,0 +1,14 @@
+import db
+
+def test_vista_separa_los_tabs_en_una_consulta(base_pruebas, insertar):
+    ids = insertar(*[{"nombre": f"c{i}", "contactado": i % 2 == 0} for i in range(9)])
+    df_no, df_si, cursor_no, cursor_si = db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True, limite=3)
+    assert list(df_no["id"]) == ids[1:7:2] and cursor_no == ids[5]
+    assert list(df_si["id"]) == ids[0:6:2] and cursor_si == ids[4]
+
+    df_no, df_si, cursor_no, cursor_si = db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True, limite=None)
+    assert len(df_no) == 4 and len(df_si) == 5 and cursor_no is None and cursor_si is None
+
+def test_vista_de_base_vacia(base_pruebas):
+    df_no, df_si, cursor_no, cursor_si = db.obtener_clientes_vista(base_name=base_pruebas, is_admin=True)
+    assert df_no.empty and df_si.empty and cursor_no is None and cursor_si is None
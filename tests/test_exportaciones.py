@@ -0,0 +1,78 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import exportar
+
+@pytest.fixture
+def catalogo(monkeypatch, tmp_path):
+    bases = pd.DataFrame({"base_name": ["A", "B"], "total_clientes": [3, 5],
+                          "actualizado_en": pd.to_datetime(["2024-05-01", "2024-05-02"])})
+    monkeypatch.setattr(exportar, "obtener_bases", lambda: bases)
+    monkeypatch.setattr(exportar, "EXPORTACIONES_DIR", str(tmp_path))
+    monkeypatch.setattr(exportar, "_trabajos", {})
+    return bases
+
+def test_clave_cambia_con_los_datos_de_la_base(catalogo):
+    antes = exportar.clave_exportacion("csv", base_name="A")
+    assert exportar.clave_exportacion("csv", base_name="A") == antes
+    assert exportar.clave_exportacion("csv", base_name="A", busqueda="x") != antes
+    assert exportar.clave_exportacion("xlsx", base_name="A").endswith(".xlsx")
+
+    catalogo.loc[catalogo["base_name"] == "B", "total_clientes"] = 6
+    # Otra base cambió: la clave de A se mantiene, la de "todas" no
+    assert exportar.clave_exportacion("csv", base_name="A") == antes
+    catalogo.loc[catalogo["base_name"] == "A", "actualizado_en"] = pd.Timestamp("2024-06-01")
+    assert exportar.clave_exportacion("csv", base_name="A") != antes
+
+def test_solicitar_genera_una_vez_y_reusa_el_archivo(catalogo, monkeypatch):
+    liberar = threading.Event()
+    generados = []
+    def _exportar(destino, formato, **filtros):
+        liberar.wait(5)
+        generados.append(filtros)
+        with open(destino, "w") as f:
+            f.write("id\n1\n")
+        return 1
+    monkeypatch.setattr(exportar, "exportar_clientes", _exportar)
+
+    clave = exportar.solicitar_exportacion("csv", base_name="A")
+    assert exportar.solicitar_exportacion("csv", base_name="A") == clave
+    assert exportar.estado_exportacion(clave)["estado"] == "en_proceso"
+    liberar.set()
+    exportar._trabajos[clave].result(5)
+
+    estado = exportar.estado_exportacion(clave)
+    assert estado["estado"] == "listo" and estado["ruta"].endswith(clave)
+    exportar.solicitar_exportacion("csv", base_name="A")
+    assert len(generados) == 1
+
+def test_error_se_informa_y_se_puede_reintentar(catalogo, monkeypatch, tmp_path):
+    def _falla(destino, formato, **filtros):
+        with open(destino, "w") as f:
+            f.write("a medio escribir")
+        raise RuntimeError("sin conexión")
+    monkeypatch.setattr(exportar, "exportar_clientes", _falla)
+    clave = exportar.solicitar_exportacion("csv", base_name="B")
+    with pytest.raises(RuntimeError):
+        exportar._trabajos[clave].result(5)
+    assert exportar.estado_exportacion(clave) == {"estado": "error", "ruta": None, "error": "sin conexión"}
+    # No queda ni el temporal ni un artefacto a medias
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr(exportar, "exportar_clientes", lambda destino, formato, **f: open(destino, "w").close())
+    exportar.solicitar_exportacion("csv", base_name="B")
+    exportar._trabajos[clave].result(5)
+    assert exportar.estado_exportacion(clave)["estado"] == "listo"
+
+def test_limpieza_conserva_los_mas_recientes(catalogo, monkeypatch, tmp_path):
+    monkeypatch.setattr(exportar, "EXPORTACIONES_MAX_ARCHIVOS", 2)
+    for i in range(4):
+        ruta = tmp_path / f"{i}.csv"
+        ruta.write_text("x")
+        os.utime(ruta, (i, i))
+    exportar._limpiar_exportaciones()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2.csv", "3.csv"]
+    assert exportar.estado_exportacion("0.csv")["estado"] == "no_solicitado"
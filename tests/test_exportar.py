@@ -0,0 +1,50 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import exportar
+
+def _bloques():
+    # Segundo bloque con tipos que el primero no fija (ciudad toda nula al inicio)
+    yield pd.DataFrame({"id": [1, 2], "nombre": ["Gómez", "Andina"], "ciudad": [None, None],
+                        "contactado": [True, False],
+                        "fecha_contacto": [datetime.date(2024, 5, 1), None]})
+    yield pd.DataFrame({"id": [3], "nombre": ["Valle"], "ciudad": ["Cali"], "contactado": [False],
+                        "fecha_contacto": [pd.NaT]})
+
+@pytest.fixture
+def bloques(monkeypatch):
+    pedidos = []
+    def _leer(**filtros):
+        pedidos.append(filtros)
+        return _bloques()
+    monkeypatch.setattr(exportar, "leer_clientes_por_bloques", _leer)
+    return pedidos
+
+@pytest.mark.parametrize("formato, leer", [
+    ("csv", lambda ruta: pd.read_csv(ruta, encoding="utf-8-sig")),
+    ("xlsx", lambda ruta: pd.read_excel(ruta)),
+    ("parquet", lambda ruta: pd.read_parquet(ruta)),
+])
+def test_exporta_todos_los_bloques(bloques, tmp_path, formato, leer):
+    ruta = tmp_path / f"clientes.{formato}"
+    assert exportar.exportar_clientes(str(ruta), formato, base_name="A", busqueda="x") == 3
+    df = leer(ruta)
+    assert list(df["nombre"]) == ["Gómez", "Andina", "Valle"]
+    assert df["ciudad"].isna().tolist() == [True, True, False]
+    assert pd.to_datetime(df["fecha_contacto"]).dt.strftime("%Y-%m-%d").tolist()[0] == "2024-05-01"
+    assert bloques[0]["busqueda"] == "x" and bloques[0]["tamano_bloque"] == exportar.TAMANO_BLOQUE_EXPORTACION
+
+def test_parquet_con_tipos_fijos(bloques, tmp_path):
+    import pyarrow.parquet as pq
+
+    ruta = tmp_path / "clientes.parquet"
+    exportar.exportar_clientes(str(ruta), "parquet")
+    esquema = pq.read_schema(ruta)
+    assert str(esquema.field("fecha_contacto").type) == "date32[day]"
+    assert str(esquema.field("ciudad").type) == "string"
+
+def test_formato_no_soportado(bloques, tmp_path):
+    with pytest.raises(ValueError):
+        exportar.exportar_clientes(str(tmp_path / "x.pdf"), "pdf")
@@ -0,0 +1,61 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from grilla import diferencias_grid, ids_seleccionados
+
+DISPLAY_TO_DB = {"Nombre": "nombre", "Ciudad": "ciudad", "Contactado": "contactado",
+                 "Fecha contacto": "fecha_contacto"}
+
+def _original():
+    return pd.DataFrame({
+        "id": [1, 2, 3],
+        "Nombre": ["Gómez", "Andina", None],
+        "Ciudad": ["Bogotá", None, "Cali"],
+        "Contactado": [False, True, False],
+        "Fecha contacto": [datetime.date(2024, 5, 1), None, None],
+    })
+
+def test_sin_cambios_reales():
+    editado = _original()
+    # Lo que AgGrid devuelve tras un ida y vuelta: textos, NaN y fechas ISO con hora
+    editado["Nombre"] = ["Gómez", "Andina", ""]
+    editado["Ciudad"] = ["Bogotá", np.nan, "Cali"]
+    editado["Contactado"] = ["false", "true", "False"]
+    editado["Fecha contacto"] = ["2024-05-01T00:00:00.000Z", "None", {}]
+    assert diferencias_grid(_original(), editado, DISPLAY_TO_DB) == []
+
+def test_solo_las_celdas_cambiadas():
+    editado = _original().astype(object)
+    editado.loc[0, "Ciudad"] = "Medellín"
+    editado.loc[2, "Contactado"] = "true"
+    editado.at[2, "Fecha contacto"] = {"date": "2024-06-02"}
+    assert diferencias_grid(_original(), editado, DISPLAY_TO_DB) == [
+        (1, {"ciudad": "Medellín"}),
+        (3, {"contactado": True, "fecha_contacto": "2024-06-02"}),
+    ]
+
+def test_tipos_nativos_para_el_driver():
+    editado = _original()
+    editado.loc[1, "Contactado"] = False
+    (cliente_id, updates), = diferencias_grid(_original(), editado, DISPLAY_TO_DB)
+    assert type(cliente_id) is int and type(updates["contactado"]) is bool
+
+def test_filas_reordenadas_o_ajenas_se_ignoran():
+    editado = _original().iloc[::-1].reset_index(drop=True)
+    editado = pd.concat([editado, pd.DataFrame({"id": [99], "Nombre": ["nueva"]})], ignore_index=True)
+    editado.loc[editado["id"] == 2, "Nombre"] = "Andina S.A."
+    assert diferencias_grid(_original(), editado, DISPLAY_TO_DB) == [(2, {"nombre": "Andina S.A."})]
+
+def test_columnas_sin_mapeo_o_frames_vacios():
+    editado = _original().assign(Extra="x")
+    assert diferencias_grid(_original().assign(Extra="y"), editado, DISPLAY_TO_DB) == []
+    assert diferencias_grid(_original(), pd.DataFrame(), DISPLAY_TO_DB) == []
+    assert diferencias_grid(None, _original(), DISPLAY_TO_DB) == []
+
+def test_ids_seleccionados_en_cualquier_formato():
+    assert ids_seleccionados(pd.DataFrame({"id": [3, "7", None]})) == [3, 7]
+    assert ids_seleccionados([{"id": 1}, pd.Series({"id": 2}), {"nombre": "sin id"}, "basura"]) == [1, 2]
+    assert ids_seleccionados(pd.DataFrame({"nombre": ["x"]})) == []
+    assert ids_seleccionados(None) == []
@@ -0,0 +1,73 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import instrumentacion
+
+@pytest.fixture(autouse=True)
+def estadisticas_vacias(monkeypatch):
+    monkeypatch.setattr(instrumentacion, "_duraciones", {})
+    monkeypatch.setattr(instrumentacion, "_totales", {})
+    monkeypatch.setattr(instrumentacion, "_consultas_por_rerun", instrumentacion.deque(maxlen=500))
+    # Este módulo cuenta como llamador, igual que db.py
+    monkeypatch.setattr(instrumentacion, "MODULOS_INSTRUMENTADOS", {__name__})
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    instrumentacion.instrumentar(engine, umbral_lento_ms=None)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER, nombre TEXT)"))
+    yield engine
+    engine.dispose()
+
+def test_normalizar_sql_agrupa_variantes():
+    assert instrumentacion.normalizar_sql(
+        "SELECT *  FROM clientes\n  WHERE id = :id AND nombre = 'O''Brien' AND x > 10.5"
+    ) == "SELECT * FROM clientes WHERE id = ? AND nombre = ? AND x > ?"
+    # Los casts de PostgreSQL no se confunden con parámetros
+    assert instrumentacion.normalizar_sql("SELECT y::text FROM t WHERE y = %(y)s") == "SELECT y::text FROM t WHERE y = ?"
+    # Listas IN y lotes de VALUES de cualquier largo quedan iguales
+    assert (instrumentacion.normalizar_sql("SELECT 1 FROM t WHERE id IN (1, 2, 3)")
+            == instrumentacion.normalizar_sql("SELECT 1 FROM t WHERE id IN (%s, %s)"))
+    assert (instrumentacion.normalizar_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)")
+            == instrumentacion.normalizar_sql("INSERT INTO t (a, b) VALUES (1, 2), (3, 4)"))
+
+def _leer_t(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT * FROM t")).fetchall()
+
+def test_consultas_por_funcion_llamadora(engine):
+    def _anidada():
+        # Las funciones anidadas se reportan con el nombre de la función externa
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    _anidada()
+    _leer_t(engine)
+    resumen = {f["funcion"]: f for f in instrumentacion.resumen_por_funcion()}
+    assert resumen["_leer_t"]["consultas"] == 1
+    assert resumen["test_consultas_por_funcion_llamadora"]["consultas"] == 1
+    assert resumen["test_consultas_por_funcion_llamadora"]["p99_ms"] >= 0
+
+def test_conteo_por_rerun(engine):
+    anterior = instrumentacion.iniciar_conteo_rerun()
+    _leer_t(engine)
+    _leer_t(engine)
+    actual = instrumentacion.iniciar_conteo_rerun(anterior)
+    _leer_t(engine)
+    assert anterior.consultas == 2 and actual.consultas == 1
+    assert instrumentacion.resumen_reruns() == {"reruns": 1, "ultimo": 2, "p50": 2, "p95": 2, "max": 2}
+
+def test_log_de_consultas_lentas(engine, monkeypatch, caplog):
+    monkeypatch.setattr(instrumentacion, "_umbral_lento_ms", 0)
+    # El logger no propaga (escribe a su propio archivo): caplog se engancha directo
+    instrumentacion._log_lento.addHandler(caplog.handler)
+    try:
+        with caplog.at_level(logging.WARNING, logger="mylocaldata.sql_lento"):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT * FROM t WHERE nombre = 'secreto'"))
+    finally:
+        instrumentacion._log_lento.removeHandler(caplog.handler)
+    assert '"funcion": "test_log_de_consultas_lentas"' in caplog.text
+    assert "secreto" not in caplog.text and "nombre = ?" in caplog.text
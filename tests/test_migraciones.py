@@ -0,0 +1,43 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+
+import migraciones
+
+def _registradas(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT version FROM schema_migraciones ORDER BY version")).scalars().all()
+
+def test_bd_vacia_queda_al_dia_y_no_se_migra_dos_veces(engine_fresco):
+    aplicadas = migraciones.aplicar_migraciones(engine_fresco)
+    obligatorias = [m[0] for m in migraciones.MIGRACIONES if not m[3]]
+    assert set(obligatorias) <= set(aplicadas)
+    assert _registradas(engine_fresco) == aplicadas
+    assert migraciones.aplicar_migraciones(engine_fresco) == []
+
+def _falla(conn):
+    conn.execute(text("CREATE TABLE migracion_a_medias (id INT)"))
+    raise RuntimeError("fallo a propósito")
+
+def test_opcional_fallida_no_detiene_las_demas(engine_fresco, monkeypatch, caplog):
+    def _ok(conn):
+        conn.execute(text("CREATE TABLE migracion_ok (id INT)"))
+    monkeypatch.setattr(migraciones, "MIGRACIONES", [(1, "opcional", _falla, True), (2, "ok", _ok, False)])
+    with caplog.at_level(logging.WARNING, logger="mylocaldata.migraciones"):
+        assert migraciones.aplicar_migraciones(engine_fresco) == [2]
+    assert "fallo a propósito" in caplog.text
+    with engine_fresco.connect() as conn:
+        # La opcional se revirtió entera y queda pendiente para el próximo arranque
+        assert conn.execute(text("SELECT to_regclass('migracion_a_medias')")).scalar() is None
+    assert _registradas(engine_fresco) == [2]
+
+def test_obligatoria_fallida_se_propaga_sin_registrarse(engine_fresco, monkeypatch):
+    monkeypatch.setattr(migraciones, "MIGRACIONES", [(1, "obligatoria", _falla, False)])
+    with pytest.raises(RuntimeError):
+        migraciones.aplicar_migraciones(engine_fresco)
+    assert _registradas(engine_fresco) == []
+    # El advisory lock se liberó: otro intento puede tomarlo
+    with engine_fresco.connect() as conn:
+        assert conn.execute(text("SELECT pg_try_advisory_lock(:llave)"),
+                            {"llave": migraciones.LLAVE_LOCK_MIGRACIONES}).scalar()
@@ -0,0 +1,53 @@
+import queue
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import db
+from notificaciones import EscuchaCambios
+
+@pytest.fixture
+def proceso(monkeypatch, cache_vacia):
+    # Proceso sin réplica: los avisos se resuelven con refrescar_cambios
+    monkeypatch.setattr(db, "_replica", None)
+    refrescos = []
+    monkeypatch.setattr(db, "refrescar_cambios", lambda forzar=False: refrescos.append(forzar) or 0)
+    return refrescos
+
+def test_avisos_propios_se_ignoran(proceso):
+    db._al_notificar([{"tabla": "clientes", "proceso": db.PROCESO_ID, "bases": ["A"]}])
+    assert proceso == []
+    db._al_notificar([{"tabla": "clientes", "proceso": db.PROCESO_ID}, {"tabla": "clientes", "proceso": "otro"}])
+    assert proceso == [True]
+
+def test_reconexion_fuerza_el_refresco(proceso):
+    db._al_notificar(None)
+    assert proceso == [True]
+
+def test_sin_registro_de_cambios_invalida_lo_que_nombra_el_aviso(proceso, monkeypatch):
+    monkeypatch.setattr(db, "refrescar_cambios", lambda forzar=False: None)
+    for base in ("A", "B"):
+        db._cache_leer(("pagina", base), base, lambda: "página")
+    db._al_notificar([{"tabla": "clientes", "proceso": "otro", "bases": ["A"], "claves": [1]}])
+    assert list(db._cache_clientes) == [("pagina", "B")]
+    # Un aviso sin bases (demasiadas) invalida todo
+    db._al_notificar([{"tabla": "clientes", "proceso": "otro", "bases": None}])
+    assert not db._cache_clientes
+
+def test_escucha_entrega_los_avisos_con_el_proceso(base_pruebas):
+    recibidos = queue.Queue()
+    escucha = EscuchaCambios(db.engine, recibidos.put, reintento_seg=0.1, agrupar_seg=0.05).iniciar()
+    otro = create_engine(db.engine.url, connect_args={"application_name": "otro-proceso"})
+    try:
+        assert recibidos.get(timeout=5) is None    # primera conexión: ponerse al día
+        with otro.begin() as conn:
+            cliente_id = conn.execute(text("INSERT INTO clientes (nombre, base_name) VALUES ('x', :b) RETURNING id"),
+                                      {"b": base_pruebas}).scalar()
+        aviso, = recibidos.get(timeout=5)
+        assert aviso["tabla"] == "clientes" and aviso["op"] == "INSERT"
+        assert aviso["claves"] == [cliente_id] and aviso["bases"] == [base_pruebas]
+        assert aviso["proceso"] == "otro-proceso"
+        assert escucha.conectada() and escucha.estadisticas()["avisos"] == 1
+    finally:
+        escucha.detener()
+        otro.dispose()
@@ -0,0 +1,51 @@
+import json
+
+from instrumentacion import ConteoRerun
+from perfilador import finalizar_perfil_rerun, iniciar_perfil_rerun, resumen_historial
+
+def test_secciones_y_consultas_por_seccion():
+    estado, contador = {}, ConteoRerun()
+    perfil = iniciar_perfil_rerun(estado, contador)
+    perfil.seccion("autenticación")
+    contador.consultas += 2
+    perfil.seccion("tabs")
+    contador.consultas += 3
+    assert finalizar_perfil_rerun(estado) is None
+    assert [(s[0], s[3]) for s in perfil.secciones] == [("autenticación", 2), ("tabs", 3)]
+    assert perfil.cerrado and not perfil.interrumpido
+    # Una vez cerrado no se abren más secciones
+    perfil.seccion("tarde")
+    assert len(perfil.secciones) == 2
+
+def test_rerun_interrumpido_se_guarda_al_iniciar_el_siguiente():
+    estado = {}
+    primero = iniciar_perfil_rerun(estado)
+    primero.seccion("tabs")
+    segundo = iniciar_perfil_rerun(estado)   # st.rerun() cortó el script antes de finalizar
+    finalizar_perfil_rerun(estado)
+    assert primero.interrumpido and segundo.numero == 2
+    assert list(estado["_perfil_historial"]) == [primero, segundo]
+    assert [r["seccion"] for r in resumen_historial(estado)] == ["tabs"]
+
+def test_traza_en_formato_chrome(tmp_path):
+    estado = {}
+    for _ in range(2):
+        iniciar_perfil_rerun(estado, escribir=True, directorio=str(tmp_path)).seccion("tabs")
+        ruta = finalizar_perfil_rerun(estado, escribir=True, directorio=str(tmp_path))
+    with open(ruta, encoding="utf-8") as f:
+        traza = json.load(f)
+    reruns = [e for e in traza["traceEvents"] if e.get("cat") == "rerun"]
+    secciones = [e for e in traza["traceEvents"] if e.get("cat") == "seccion"]
+    assert [e["name"] for e in reruns] == ["rerun #1", "rerun #2"]
+    assert len(secciones) == 2 and all(e["ph"] == "X" and e["dur"] >= 1 for e in secciones)
+    assert [p.name for p in tmp_path.iterdir()] == [f"perfil_{estado['_perfil_sesion']}.json"]
+
+def test_fallo_al_escribir_no_corta_el_rerun(tmp_path, caplog):
+    archivo = tmp_path / "no_es_carpeta"
+    archivo.write_text("x")
+    estado = {}
+    iniciar_perfil_rerun(estado, escribir=True, directorio=str(archivo))
+    with caplog.at_level("WARNING", logger="mylocaldata.perfilador"):
+        assert finalizar_perfil_rerun(estado, escribir=True, directorio=str(archivo)) is None
+    assert "no se pudo escribir el perfil" in caplog.text
+    assert len(estado["_perfil_historial"]) == 1
@@ -0,0 +1,254 @@
+"""
+Revisión de planes de ejecución de las consultas calientes de db.py.
+
+Carga una BD Postgres LOCAL con volúmenes realistas, corre EXPLAIN sobre cada consulta y
+falla si alguna cae en un Seq Scan sobre clientes/contactos/visitas o necesita un Sort extra
+sobre muchas filas. Sin PLANES_DATABASE_URL los tests con BD se saltan:
+
+    PLANES_DATABASE_URL=postgresql+psycopg2://postgres@localhost/planes python -m pytest tests/test_planes_consultas.py
+
+¡No apuntar a producción! La carga inserta cientos de miles de filas de prueba.
+"""
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import db
+from migraciones import aplicar_migraciones
+
+# Volumen de prueba (clientes); contactos y visitas se generan en proporción
+FILAS_CLIENTES = int(os.environ.get("PLANES_FILAS_CLIENTES", 200000))
+BASES_PRIVADAS = 40
+
+# Tablas grandes en las que un Seq Scan es una regresión (bases/users son catálogos chicos)
+TABLAS_GRANDES = {"clientes", "contactos", "visitas"}
+# Un Sort sobre pocas filas (bitmap + orden en memoria) es lo que el planner debe elegir para
+# bases chicas; solo es regresión cuando ordena más filas estimadas que esto
+FILAS_MAX_SORT = int(os.environ.get("PLANES_FILAS_MAX_SORT", 10000))
+
+def _vista(where):
+    # obtener_clientes_vista con limite: una rama por tab (mismo texto que arma db.py)
+    return (f"(SELECT * FROM clientes WHERE {where} AND contactado = FALSE ORDER BY id LIMIT :limite)"
+            " UNION ALL "
+            f"(SELECT * FROM clientes WHERE {where} AND contactado = TRUE ORDER BY id LIMIT :limite)")
+
+def _lote_valores(n):
+    # actualizar_clientes_campos: un UPDATE ... FROM (VALUES ...) por lote de n filas
+    valores = ", ".join(f"(:id_{i}, :observacion_{i})" for i in range(n))
+    params = {**{f"id_{i}": 1000 + 7 * i for i in range(n)}, **{f"observacion_{i}": "nota" for i in range(n)}}
+    sql = ("UPDATE clientes SET observacion = CAST(v.observacion AS text)"
+           f" FROM (VALUES {valores}) AS v(id, observacion),"
+           " clientes AS antes"
+           " WHERE clientes.id = v.id AND antes.id = v.id"
+           " RETURNING clientes.*, antes.base_name AS base_antes")
+    return sql, params
+
+# (nombre, sql, params, permite_sort). Mismo texto SQL que emite db.py (con las cláusulas en el
+# orden en que las arma _filtros_clientes); al cambiar una consulta allá, cambiarla aquí.
+# EXPLAIN sin ANALYZE no ejecuta nada: los DELETE/UPDATE se explican tal cual.
+CONSULTAS = [
+    ("obtener_clientes_vista (primera página de ambos tabs)",
+     _vista("base_name = :base_name"), {"base_name": "TRANSLOGISTIC", "limite": 501}, False),
+    ("obtener_clientes_vista (admin filtrando por usuario)",
+     _vista("username = :username"), {"username": "usuario3", "limite": 501}, False),
+    ("obtener_clientes_vista (admin, todas las bases)",
+     _vista("TRUE"), {"limite": 501}, False),
+    ("obtener_clientes_vista (base completa)",
+     "SELECT * FROM clientes WHERE base_name = :base_name AND contactado IS NOT NULL ORDER BY id",
+     {"base_name": "usuario7__Privada"}, False),
+    ("obtener_clientes_pagina (keyset por base)",
+     "SELECT * FROM clientes WHERE contactado = :contactado AND base_name = :base_name"
+     " AND id > :despues_de_id ORDER BY id LIMIT :limite",
+     {"contactado": False, "base_name": "TRANSLOGISTIC", "despues_de_id": 5000, "limite": 501}, False),
+    ("obtener_clientes_pagina (base privada)",
+     "SELECT * FROM clientes WHERE contactado = :contactado AND base_name = :base_name"
+     " AND id > :despues_de_id ORDER BY id LIMIT :limite",
+     {"contactado": True, "base_name": "usuario7__Privada", "despues_de_id": 0, "limite": 501}, False),
+    ("obtener_clientes_pagina (admin filtrando por usuario)",
+     "SELECT * FROM clientes WHERE contactado = :contactado AND username = :username"
+     " AND id > :despues_de_id ORDER BY id LIMIT :limite",
+     {"contactado": False, "username": "usuario3", "despues_de_id": 0, "limite": 501}, False),
+    ("obtener_clientes_pagina (admin, todas las bases)",
+     "SELECT * FROM clientes WHERE contactado = :contactado AND id > :despues_de_id ORDER BY id LIMIT :limite",
+     {"contactado": True, "despues_de_id": 0, "limite": 501}, False),
+    ("obtener_clientes (base completa)",
+     "SELECT * FROM clientes WHERE base_name = :base_name ORDER BY id",
+     {"base_name": "TRANSLOGISTIC"}, False),
+    # leer_clientes_por_bloques usa un cursor del servidor: el planner lo optimiza para
+    # entregar las primeras filas rápido, por eso se explica como DECLARE ... CURSOR
+    ("leer_clientes_por_bloques (base completa)",
+     "DECLARE planes_cursor CURSOR FOR SELECT * FROM clientes WHERE base_name = :base_name ORDER BY id",
+     {"base_name": "TRANSLOGISTIC"}, False),
+    ("leer_clientes_por_bloques (un tab completo)",
+     "DECLARE planes_cursor CURSOR FOR"
+     " SELECT * FROM clientes WHERE contactado = :contactado AND base_name = :base_name ORDER BY id",
+     {"contactado": True, "base_name": "TRANSLOGISTIC"}, False),
+    ("opciones_selector_clientes (sin texto)",
+     "SELECT id, nombre, nit FROM clientes WHERE base_name = :base_name ORDER BY id LIMIT :limite",
+     {"base_name": "TRANSLOGISTIC", "limite": 50}, False),
+    ("obtener_contactos",
+     "SELECT * FROM contactos WHERE cliente_id = :cliente_id ORDER BY fecha DESC",
+     {"cliente_id": 1234}, False),
+    ("obtener_visitas",
+     "SELECT * FROM visitas WHERE cliente_id = :cliente_id ORDER BY fecha DESC",
+     {"cliente_id": 1234}, False),
+    ("obtener_detalle_cliente (fila + historial + agenda)",
+     "SELECT row_to_json(c) AS cliente,"
+     " (SELECT json_agg(t ORDER BY t.fecha DESC) FROM contactos t WHERE t.cliente_id = c.id) AS contactos,"
+     " (SELECT json_agg(v ORDER BY v.fecha DESC) FROM visitas v WHERE v.cliente_id = c.id) AS visitas"
+     " FROM clientes c WHERE c.id = :id",
+     {"id": 1234}, False),
+    ("eliminar_cliente",
+     "DELETE FROM clientes WHERE id = :id RETURNING *",
+     {"id": 4321}, False),
+    ("eliminar_clientes",
+     "DELETE FROM clientes WHERE id = ANY(:ids) RETURNING id, base_name",
+     {"ids": [10, 20, 30]}, False),
+    ("actualizar_cliente_campos",
+     "UPDATE clientes SET observacion = :observacion"
+     " FROM (SELECT id, base_name FROM clientes WHERE id = :id) AS antes"
+     " WHERE clientes.id = antes.id"
+     " RETURNING clientes.*, antes.base_name AS base_antes",
+     {"id": 4321, "observacion": "nota"}, False),
+    ("actualizar_clientes_campos (lote de 500)", *_lote_valores(500), False),
+    # Las dos sentencias del upsert por NIT de importar_clientes (ver PREPARAR_IMPORTACION)
+    ("importar_clientes (actualizar por NIT normalizado)",
+     "UPDATE clientes c SET nombre = f.nombre"
+     " FROM _import_fuente f"
+     " WHERE c.base_name = :base_name AND normalizar_nit(c.nit) = f.nit_norm",
+     {"base_name": "TRANSLOGISTIC"}, False),
+    ("importar_clientes (insertar NITs nuevos)",
+     "INSERT INTO clientes (nombre, nit, contactado, fecha_contacto, username, base_name)"
+     " SELECT f.nombre, f.nit, FALSE, NULL, :username, :base_name"
+     " FROM _import_fuente f"
+     " WHERE NOT EXISTS ("
+     " SELECT 1 FROM clientes c"
+     " WHERE c.base_name = :base_name AND normalizar_nit(c.nit) = f.nit_norm"
+     " )"
+     " ORDER BY f.fila",
+     {"base_name": "TRANSLOGISTIC", "username": None}, True),
+]
+
+# Tabla temporal con la forma de la que arma importar_clientes (un archivo de 1.000 filas).
+# Con archivos del orden de miles de filas contra una base grande el planner prefiere, con
+# razón, un Hash Join que recorre la base una vez: eso no es una regresión del índice
+PREPARAR_IMPORTACION = """
+    CREATE TEMP TABLE _import_fuente AS
+    SELECT g AS fila, 'Importado ' || g AS nombre, (900000000 + g * 37)::text AS nit,
+           normalizar_nit((900000000 + g * 37)::text) AS nit_norm
+    FROM generate_series(1, 1000) AS g;
+    ANALYZE _import_fuente;
+"""
+
+def _consultas_busqueda():
+    # Solo si la migración de pg_trgm/unaccent quedó aplicada (el ORDER BY relevancia necesita
+    # un Sort). El SQL sale de db.py mismo: pantalla (con LIMIT) y exportación (sin LIMIT)
+    filtros = {"is_admin": True, "base_name": "TRANSLOGISTIC"}
+    texto = "logistica 123"
+    return [
+        ("buscar_clientes (trigramas)", *db._sql_busqueda(texto, limite=50, **filtros), True),
+        ("leer_clientes_por_bloques (búsqueda)", *db._sql_busqueda(texto, **filtros), True),
+    ]
+
+def cargar_datos(conn):
+    # Idempotente: si ya hay suficientes clientes no vuelve a cargar
+    actuales = conn.execute(text("SELECT count(*) FROM clientes")).scalar()
+    if actuales >= FILAS_CLIENTES:
+        return
+    faltan = FILAS_CLIENTES - actuales
+    # ~40% en TRANSLOGISTIC, el resto repartido entre bases privadas de varios usuarios
+    conn.execute(text("""
+        INSERT INTO clientes (nombre, nit, contacto, telefono, email, ciudad, contactado,
+                              fecha_contacto, username, base_name)
+        SELECT 'Cliente ' || g || ' ' || (ARRAY['Logística','Transportes','Comercial','Agro'])[1 + g % 4],
+               (900000000 + g)::text, 'Contacto ' || g, '300' || lpad(g::text, 7, '0'),
+               'cliente' || g || '@ejemplo.co',
+               (ARRAY['Bogotá','Medellín','Cali','Barranquilla','Cartagena'])[1 + g % 5],
+               g % 3 = 0,
+               CASE WHEN g % 3 = 0 THEN current_date - (g % 365) END,
+               'usuario' || (g % :privadas),
+               CASE WHEN g % 5 < 2 THEN 'TRANSLOGISTIC' ELSE 'usuario' || (g % :privadas) || '__Privada' END
+        FROM generate_series(1, :n) AS g
+    """), {"n": faltan, "privadas": BASES_PRIVADAS})
+    conn.execute(text("""
+        INSERT INTO contactos (cliente_id, fecha, tipo, notas)
+        SELECT c.id, current_date - (g % 400), (ARRAY['Presencial','Llamada','Email'])[1 + g % 3], ''
+        FROM clientes c, generate_series(1, 3) AS g
+        WHERE c.id % 2 = 0
+    """))
+    conn.execute(text("""
+        INSERT INTO visitas (cliente_id, fecha, medio, creado_por)
+        SELECT id, current_date + (id % 60), 'Llamada', username FROM clientes WHERE id % 4 = 0
+    """))
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+def problemas_del_plan(plan, permite_sort=False):
+    """Retorna la lista de nodos del plan que cuentan como regresión."""
+    problemas = []
+    for nodo in _nodos(plan):
+        tipo = nodo.get("Node Type")
+        if tipo == "Seq Scan" and nodo.get("Relation Name") in TABLAS_GRANDES:
+            problemas.append(f"Seq Scan sobre {nodo['Relation Name']}")
+        elif tipo in ("Sort", "Incremental Sort") and not permite_sort:
+            filas = max([h.get("Plan Rows", 0) for h in nodo.get("Plans", [])] or [nodo.get("Plan Rows", 0)])
+            if filas > FILAS_MAX_SORT:
+                problemas.append(f"{tipo} de ~{filas} filas ({', '.join(nodo.get('Sort Key', []))})")
+    return problemas
+
+# --------------------------
+# Tests
+# --------------------------
+def test_regla_seq_scan_en_tabla_grande():
+    plan = {"Node Type": "Limit", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "clientes"}]}
+    assert problemas_del_plan(plan) == ["Seq Scan sobre clientes"]
+    assert problemas_del_plan({"Node Type": "Seq Scan", "Relation Name": "bases"}) == []
+
+def test_regla_sort_solo_sobre_muchas_filas():
+    def _sort(filas):
+        return {"Node Type": "Sort", "Sort Key": ["id"],
+                "Plans": [{"Node Type": "Bitmap Heap Scan", "Relation Name": "clientes", "Plan Rows": filas}]}
+    assert problemas_del_plan(_sort(FILAS_MAX_SORT // 2)) == []
+    assert problemas_del_plan(_sort(FILAS_MAX_SORT * 2)) != []
+    assert problemas_del_plan(_sort(FILAS_MAX_SORT * 2), permite_sort=True) == []
+
+@pytest.fixture(scope="module")
+def conn_planes():
+    url = os.environ.get("PLANES_DATABASE_URL")
+    if not url:
+        pytest.skip("PLANES_DATABASE_URL no está definida (BD Postgres local de pruebas)")
+    engine = create_engine(url)
+    aplicar_migraciones(engine)
+    with engine.begin() as conn:
+        cargar_datos(conn)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE clientes; ANALYZE contactos; ANALYZE visitas;"))
+    with engine.connect() as conn:
+        conn.execute(text(PREPARAR_IMPORTACION))
+        yield conn
+        conn.rollback()
+    engine.dispose()
+
+def _explicar(conn, sql, params):
+    # Cada EXPLAIN en su savepoint: un error no deja abortada la transacción de los demás
+    with conn.begin_nested():
+        plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+@pytest.mark.parametrize("nombre, sql, params, permite_sort", CONSULTAS, ids=[c[0] for c in CONSULTAS])
+def test_plan_sin_seq_scan_ni_sort_extra(conn_planes, nombre, sql, params, permite_sort):
+    assert problemas_del_plan(_explicar(conn_planes, sql, params), permite_sort) == []
+
+def test_plan_busqueda(conn_planes, monkeypatch):
+    if not conn_planes.execute(text("SELECT 1 FROM schema_migraciones WHERE version = 5")).scalar():
+        pytest.skip("sin pg_trgm/unaccent (migración 5 no aplicada)")
+    monkeypatch.setattr(db, "_busqueda_sin_trigramas", False)
+    for nombre, sql, params, permite_sort in _consultas_busqueda():
+        assert problemas_del_plan(_explicar(conn_planes, sql, params), permite_sort) == [], nombre
@@ -0,0 +1,98 @@
+import datetime
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from migraciones import aplicar_migraciones
+import replica as modulo_replica
+from replica import ReplicaLocal
+
+@pytest.fixture
+def replica(engine_fresco, tmp_path):
+    aplicar_migraciones(engine_fresco)
+    avisos = []
+    replica = ReplicaLocal(engine_fresco, ruta=str(tmp_path / "replica.sqlite3"), al_cambiar=avisos.append)
+    replica.avisos = avisos
+    return replica
+
+def _ejecutar(engine, sql, **params):
+    with engine.begin() as conn:
+        resultado = conn.execute(text(sql), params)
+        return resultado.fetchall() if resultado.returns_rows else None
+
+def _clientes(replica):
+    return replica.leer("clientes", "SELECT id, nombre, base_name, contactado FROM clientes ORDER BY id")
+
+def test_copia_inicial_y_cambios_incrementales(replica):
+    pg = replica.engine
+    (uno,), (dos,) = _ejecutar(pg, "INSERT INTO clientes (nombre, base_name) VALUES ('Uno', 'A'), ('Dos', 'B') RETURNING id")
+    _ejecutar(pg, "INSERT INTO contactos (cliente_id, fecha, tipo) VALUES (:id, current_date, 'Llamada')", id=dos)
+    assert replica.sincronizar()
+    assert list(_clientes(replica)["nombre"]) == ["Uno", "Dos"]
+    assert replica.estadisticas()["copias_completas"] == 1 and replica.avisos == []
+
+    _ejecutar(pg, "UPDATE clientes SET nombre = 'Uno editado', contactado = TRUE WHERE id = :id", id=uno)
+    _ejecutar(pg, "DELETE FROM clientes WHERE id = :id", id=dos)
+    assert replica.sincronizar()
+    df = _clientes(replica)
+    assert list(df["nombre"]) == ["Uno editado"] and df["contactado"].dtype == bool
+    # El borrado en cascada del historial también llega a la réplica
+    assert replica.leer("contactos", "SELECT * FROM contactos").empty
+
+    cambios, = replica.avisos
+    assert cambios["bases"] == {"A", "B"}
+    assert [f["id"] for f in cambios["clientes"]] == [uno] and cambios["clientes_eliminados"] == [dos]
+    assert replica.estadisticas()["copias_completas"] == 1
+
+def test_leer_conserva_los_tipos_de_postgres(replica):
+    _ejecutar(replica.engine, """
+        INSERT INTO clientes (nombre, base_name, contactado, fecha_contacto)
+        VALUES ('Uno', 'A', TRUE, '2024-05-01'), ('Dos', 'A', FALSE, NULL)
+    """)
+    replica.sincronizar()
+    df = replica.leer("clientes", "SELECT * FROM clientes WHERE base_name = :b ORDER BY id", {"b": "A"})
+    assert df["contactado"].tolist() == [True, False]
+    assert df["fecha_contacto"].tolist()[0] == datetime.date(2024, 5, 1) and df["fecha_contacto"].tolist()[1] is None
+
+def test_escritura_propia_se_ve_antes_de_la_ronda(replica):
+    replica.sincronizar()
+    fila, = _ejecutar(replica.engine, "INSERT INTO clientes (nombre, base_name) VALUES ('Nuevo', 'A') RETURNING *")
+    replica.aplicar("clientes", filas=[fila._mapping])
+    assert list(_clientes(replica)["nombre"]) == ["Nuevo"]
+
+def test_ronda_en_curso_no_pisa_una_escritura_propia_mas_nueva(replica, monkeypatch):
+    replica.sincronizar()
+    (cliente_id,), = _ejecutar(replica.engine, "INSERT INTO clientes (nombre, base_name) VALUES ('Viejo', 'A') RETURNING id")
+
+    # La sesión escribe mientras la ronda lee: la ronda trae 'Viejo', pero la réplica ya tiene 'Nuevo'
+    leer_cambios = modulo_replica.leer_cambios
+    def _leer_y_escribir(conn, desde):
+        leidos = leer_cambios(conn, desde)
+        fila, = _ejecutar(replica.engine, "UPDATE clientes SET nombre = 'Nuevo' WHERE id = :id RETURNING *", id=cliente_id)
+        replica.aplicar("clientes", filas=[fila._mapping])
+        return leidos
+    monkeypatch.setattr(modulo_replica, "leer_cambios", _leer_y_escribir)
+    replica.sincronizar()
+    assert list(_clientes(replica)["nombre"]) == ["Nuevo"]
+    # Y no se avisa como cambio de otro proceso
+    assert replica.avisos == [] or not replica.avisos[-1]["clientes"]
+
+def test_vigencia(replica):
+    assert not replica.vigente(30)
+    replica.sincronizar()
+    assert replica.vigente(30)
+    replica.invalidar()
+    assert not replica.vigente(30)
+    replica.sincronizar()
+    assert replica.vigente(30)
+
+def test_postgres_caido_avisa_una_sola_vez(tmp_path, caplog):
+    caido = create_engine("postgresql+psycopg2://nadie@/nada?host=/ruta/inexistente")
+    replica = ReplicaLocal(caido, ruta=str(tmp_path / "replica.sqlite3"))
+    with caplog.at_level(logging.DEBUG, logger="mylocaldata.replica"):
+        assert not replica.sincronizar()
+        assert not replica.sincronizar()
+    niveles = [r.levelno for r in caplog.records]
+    assert niveles == [logging.WARNING, logging.DEBUG]
+    assert replica.estadisticas()["errores"] == 2 and not replica.vigente(30)